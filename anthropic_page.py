@@ -1,15 +1,29 @@
-import random
-
 import langfuse  # Observability tool for language models
-import streamlit as st
-from langfuse.decorators import langfuse_context, observe
+from langfuse.decorators import observe
+
+from chat_engine import chat_page, provider_spec
+from config import get_anthropic_async_client, get_anthropic_client
+from context_window import ContextWindow
+from provider_call import ProviderCall
+from router import RouteDecision
+from timing import timed
+
 
-from config import anthropic_client
+def message_text(response) -> str:
+    # Join text if response.content is a list of TextBlock objects.
+    if isinstance(response.content, list):
+        return "\n".join(block.text for block in response.content)
+    return response.content
 
 
-@observe(as_type="generation")
+@observe(as_type="generation", capture_input=False)
+@timed("anthropic_api")
 def anthropic_api(
-    prompt: str, model: str = "claude-3-5-sonnet-latest", **kwargs
+    prompt: str,
+    model: str = "claude-3-5-sonnet-latest",
+    context: ContextWindow | None = None,
+    route: RouteDecision | None = None,
+    **kwargs,
 ) -> str:
     """
     Calls the Anthropics API (Claude) to generate a response,
@@ -19,51 +33,102 @@ def anthropic_api(
     If Claude were a stand-up comedian, it might joke that it doesn't do 'completion'
     anymore—it just delivers punchlines via 'message.content'!
     """
-    langfuse_context.update_current_observation(
-        input=prompt, model=model, metadata=kwargs
-    )
-
-    user_ids = ["user-1", "user-2", "user-3"]
-    selected_user_id = random.choice(user_ids)
-    try:
-        response = anthropic_client.messages.create(
-            max_tokens=1024,
-            messages=[{"role": "user", "content": prompt}],
-            model=model,
-            **kwargs,
+    call = ProviderCall("anthropic", model, prompt, context, route, kwargs)
+    if call.lookup.hit:
+        return call.lookup.response
+    with call.reporting():
+        response = call.request(
+            lambda: get_anthropic_client().messages.create(
+                max_tokens=1024,
+                messages=call.context.anthropic_messages(),
+                model=model,
+                **call.context.anthropic_options(),
+                **kwargs,
+            )
         )
-        langfuse_context.update_current_trace(user_id=selected_user_id)
-        # Join text if response.content is a list of TextBlock objects.
-        if isinstance(response.content, list):
-            return "\n".join(block.text for block in response.content)
-        return response.content
-    except Exception as e:
-        return f"An error occurred: {str(e)}"
+        call.record(response.usage)
+        return call.finish(message_text(response))
 
 
-def anthropic_page():
-    st.title("Chat with Anthropics' Claude Model")
-    st.write(
-        "This chatbot uses Anthropics' API (Claude) and Langfuse for observability."
-    )
+@observe(as_type="generation", capture_input=False)
+@timed("anthropic_api_async")
+async def anthropic_api_async(
+    prompt: str,
+    model: str = "claude-3-5-sonnet-latest",
+    context: ContextWindow | None = None,
+    route: RouteDecision | None = None,
+    **kwargs,
+) -> str:
+    """
+    Async twin of anthropic_api, used when several providers run concurrently.
+    """
+    call = ProviderCall("anthropic", model, prompt, context, route, kwargs)
+    if call.lookup.hit:
+        return call.lookup.response
+    with call.reporting():
+        response = await call.request_async(
+            lambda: get_anthropic_async_client().messages.create(
+                max_tokens=1024,
+                messages=call.context.anthropic_messages(),
+                model=model,
+                **call.context.anthropic_options(),
+                **kwargs,
+            )
+        )
+        call.record(response.usage)
+        return call.finish(message_text(response))
 
-    if "anthropic_messages" not in st.session_state:
-        st.session_state.anthropic_messages = []
 
-    for message in st.session_state.anthropic_messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+@observe(as_type="generation", capture_input=False)
+@timed("anthropic_api_stream")
+def anthropic_api_stream(
+    prompt: str,
+    model: str = "claude-3-5-sonnet-latest",
+    context: ContextWindow | None = None,
+    route: RouteDecision | None = None,
+    **kwargs,
+):
+    """
+    Streaming variant of anthropic_api: yields text as Claude produces it.
 
-    if prompt := st.chat_input("Say something to Anthropic..."):
-        st.session_state.anthropic_messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
+    Uses 'messages.stream()' so the final message (and its usage) is still
+    available once the text stream is exhausted.
+    """
+    call = ProviderCall("anthropic", model, prompt, context, route, kwargs)
+    if call.lookup.hit:
+        yield call.lookup.response
+        return
 
-        response_text = anthropic_api(prompt)
+    def open_stream():
+        # Entering the stream manager sends the request, so that is the
+        # part that gets retried.
+        manager = get_anthropic_client().messages.stream(
+            max_tokens=1024,
+            messages=call.context.anthropic_messages(),
+            model=model,
+            **call.context.anthropic_options(),
+            **kwargs,
+        )
+        return manager.__enter__()
 
-        with st.chat_message("assistant"):
-            st.markdown(response_text)
+    with call.reporting():
+        with call.request(open_stream) as stream:
+            for text in call.timed(stream.text_stream):
+                yield call.chunk(text)
+            call.record(stream.get_final_message().usage)
+        call.finish()
 
-        st.session_state.anthropic_messages.append(
-            {"role": "assistant", "content": response_text}
-        )
+
+ANTHROPIC_CHAT = provider_spec(
+    "anthropic",
+    "Anthropic",
+    title="Chat with Anthropics' Claude Model",
+    description="This chatbot uses Anthropics' API (Claude) and Langfuse for observability.",
+    default_model="claude-3-5-sonnet-latest",
+    api=anthropic_api,
+    api_stream=anthropic_api_stream,
+)
+
+
+def anthropic_page():
+    chat_page(ANTHROPIC_CHAT)
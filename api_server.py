@@ -0,0 +1,363 @@
+"""
+Headless HTTP API for the chat functions, as a plain ASGI application.
+
+    uvicorn api_server:app --workers 1 --port 8000
+
+Endpoints (JSON in, JSON out):
+
+    GET  /health
+    GET  /v1/models
+    POST /v1/chat/{gemini|openai|anthropic}
+         {"prompt": "...", "model": "gpt-4o-mini" | "fastest" | ...,
+          "messages": [{"role": "user", "content": "..."}, ...],
+          "conversation_id": "...", "stream": false}
+    POST /v1/scoring/chat   {"prompt": "...", "label": "production", "messages": [...]}
+    POST /v1/feedback       {"trace_id": "...", "value": 1}
+
+Every chat response carries the Langfuse trace id to send feedback for.
+With "stream": true the answer is sent as server-sent events: a "start"
+event with the trace id, one unnamed event per text delta ({"delta": ...})
+and a final "done" (or "error") event.
+
+Non-streamed requests await the providers' async functions on the server's
+event loop; streams run the sync streaming functions in a bounded thread
+pool. Either way the SDK clients (and their connection pools) are the
+shared ones from config.py. Langfuse and the score queue are flushed on
+shutdown.
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from langfuse.decorators import langfuse_context
+
+from context_window import ConversationContext
+from logs import configure_logging, get_logger
+from metering import RequestTooLarge
+from resilience import CircuitOpenError, RateLimitExceeded, status_code
+
+log = get_logger(__name__)
+
+# Threads for streamed answers (each stream holds one for its duration) and
+# for the sync scoring chat.
+API_STREAM_WORKERS = int(os.getenv("API_STREAM_WORKERS", "64"))
+API_MAX_BODY_BYTES = int(os.getenv("API_MAX_BODY_BYTES", str(1 * 2**20)))
+
+PROVIDERS = {
+    "gemini": ("gemini_page", "gemini"),
+    "openai": ("openai_page", "openai"),
+    "anthropic": ("anthropic_page", "anthropic"),
+}
+DEFAULT_MODELS = {
+    "gemini": "gemini-1.5-flash",
+    "openai": "gpt-4.5-preview",
+    "anthropic": "claude-3-5-sonnet-latest",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def error_status(error: Exception) -> int:
+    if isinstance(error, HTTPError):
+        return error.status
+    if isinstance(error, RequestTooLarge):
+        return 413
+    if isinstance(error, RateLimitExceeded):
+        return 429
+    if isinstance(error, CircuitOpenError):
+        return 503
+    # The provider's own 4xx are the client's fault too; anything else is
+    # a failing upstream.
+    status = status_code(error)
+    if status is not None and 400 <= status < 500 and status != 429:
+        return status
+    return 502
+
+
+def provider_functions(provider: str):
+    # (async, stream) API functions; the page module is imported on first use.
+    import importlib
+
+    module_name, prefix = PROVIDERS[provider]
+    module = importlib.import_module(module_name)
+    api_async = getattr(module, f"{prefix}_api_async")
+    return api_async, getattr(module, f"{prefix}_api_stream")
+
+
+def build_context(body: dict):
+    prompt = body.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise HTTPError(400, '"prompt" must be a non-empty string')
+    messages = body.get("messages") or []
+    if not isinstance(messages, list) or not all(
+        isinstance(m, dict) and {"role", "content"} <= m.keys() for m in messages
+    ):
+        raise HTTPError(400, '"messages" must be a list of {"role", "content"}')
+    conversation = ConversationContext()
+    if body.get("conversation_id"):
+        # Same prompt-cache shard for every request of the conversation.
+        conversation.cache_key = f"conv-{body['conversation_id']}"
+    messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+    return prompt, conversation.window(messages, prompt)
+
+
+class ChatAPI:
+    def __init__(self):
+        self._executor: ThreadPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=API_STREAM_WORKERS, thread_name_prefix="api-stream"
+            )
+        return self._executor
+
+    # ASGI plumbing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        try:
+            await self.dispatch(scope, receive, send)
+        except Exception as e:
+            status = error_status(e)
+            if status >= 500:
+                log.warning("%s %s failed: %s", scope["method"], scope["path"], e)
+            await self.send_json(send, status, {"error": str(e)})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                configure_logging()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.to_thread(self.shutdown)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def shutdown(self):
+        from score_queue import score_queue
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        langfuse_context.flush()
+        score_queue.flush()
+
+    async def read_json(self, receive) -> dict:
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise HTTPError(400, "client disconnected")
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > API_MAX_BODY_BYTES:
+                raise HTTPError(413, "request body too large")
+            if not message.get("more_body"):
+                break
+        try:
+            body = json.loads(b"".join(chunks) or b"{}")
+        except ValueError:
+            raise HTTPError(400, "request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "request body must be a JSON object")
+        return body
+
+    async def send_json(self, send, status: int, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def run_sync(self, fn, *args, **kwargs):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, lambda: context.run(fn, *args, **kwargs)
+        )
+
+    # Routes
+
+    async def dispatch(self, scope, receive, send):
+        method, path = scope["method"], scope["path"].rstrip("/")
+        if method == "GET" and path == "/health":
+            return await self.send_json(send, 200, {"status": "ok"})
+        if method == "GET" and path == "/v1/models":
+            from model_catalog import model_catalog
+
+            # Listing may hit the providers when the cached listing is stale.
+            models = await self.run_sync(model_catalog.as_dict)
+            return await self.send_json(send, 200, models)
+        if method == "POST" and path.startswith("/v1/chat/"):
+            provider = path.removeprefix("/v1/chat/")
+            if provider not in PROVIDERS:
+                raise HTTPError(404, f"unknown provider {provider!r}")
+            return await self.chat(
+                provider, await self.read_json(receive), receive, send
+            )
+        if method == "POST" and path == "/v1/scoring/chat":
+            return await self.scoring_chat(await self.read_json(receive), send)
+        if method == "POST" and path == "/v1/feedback":
+            return await self.feedback(await self.read_json(receive), send)
+        raise HTTPError(404, f"no route for {method} {path}")
+
+    async def chat(self, provider: str, body: dict, receive, send):
+        from router import router
+
+        prompt, context = build_context(body)
+        # A routing policy may need the provider's model listing (blocking).
+        route = await self.run_sync(
+            router.decide,
+            provider,
+            body.get("model") or DEFAULT_MODELS[provider],
+            context.input_tokens,
+            default=DEFAULT_MODELS[provider],
+        )
+        # Created up front so a stream can announce it before the answer.
+        trace_id = str(uuid.uuid4())
+        call = {
+            "model": route.model,
+            "context": context,
+            "route": route,
+            "langfuse_parent_trace_id": trace_id,
+        }
+        api_async, api_stream = provider_functions(provider)
+        if not body.get("stream"):
+            output = await api_async(prompt, **call)
+            return await self.send_json(
+                send,
+                200,
+                {"output": output, "model": route.model, "trace_id": trace_id},
+            )
+        await self.stream_sse(
+            lambda: api_stream(prompt, **call),
+            {"trace_id": trace_id, "model": route.model},
+            receive,
+            send,
+        )
+
+    async def scoring_chat(self, body: dict, send):
+        from scoring_page import openai_api
+
+        prompt, context = build_context(body)
+        result = await self.run_sync(
+            openai_api,
+            prompt,
+            prompt_label=body.get("label", "production"),
+            context=context,
+        )
+        await self.send_json(
+            send, 200, {"output": result["output_text"], "trace_id": result["trace_id"]}
+        )
+
+    async def feedback(self, body: dict, send):
+        from scoring_page import submit_feedback
+
+        trace_id, value = body.get("trace_id"), body.get("value")
+        if not isinstance(trace_id, str) or value not in (0, 1, "up", "down"):
+            raise HTTPError(
+                400, '"trace_id" and a "value" of 1/0 or "up"/"down" are required'
+            )
+        queued = submit_feedback(
+            trace_id,
+            1 if value in (1, "up") else 0,
+            comment=body.get("comment", "Feedback"),
+        )
+        await self.send_json(send, 202 if queued else 503, {"queued": queued})
+
+    async def stream_sse(self, generator_factory, start: dict, receive, send):
+        """
+        Runs the sync streaming generator in one pool thread (the observed
+        generator keeps its Langfuse context in that thread) and forwards
+        its chunks as events. A client that disconnects stops the generator
+        at the next chunk, which closes the provider stream.
+        """
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            generator = generator_factory()
+            try:
+                for chunk in generator:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+            finally:
+                generator.close()
+                loop.call_soon_threadsafe(chunks.put_nowait, done)
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            stop.set()
+            chunks.put_nowait(done)
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+
+        async def event(data: dict, name: str | None = None):
+            line = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+            if name:
+                line = f"event: {name}\n{line}"
+            await send(
+                {"type": "http.response.body", "body": line.encode(), "more_body": True}
+            )
+
+        watcher = asyncio.create_task(watch_disconnect())
+        producer = loop.run_in_executor(
+            self.executor, contextvars.copy_context().run, produce
+        )
+        try:
+            await event(start, "start")
+            final = ({"trace_id": start["trace_id"]}, "done")
+            while (chunk := await chunks.get()) is not done:
+                if isinstance(chunk, Exception):
+                    final = (
+                        {"error": str(chunk), "status": error_status(chunk)},
+                        "error",
+                    )
+                else:
+                    await event({"delta": chunk})
+            if not stop.is_set():
+                await event(*final)
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            stop.set()
+            watcher.cancel()
+            await producer
+
+
+app = ChatAPI()
@@ -0,0 +1,411 @@
+"""
+Bulk, non-interactive generation through the providers' batch APIs.
+
+Requests are packed into OpenAI Batch files (`/v1/responses` lines) or
+Anthropic Message Batches, within each provider's limits per batch and
+BATCH_MAX_REQUESTS. The batches are submitted, then polled every
+BATCH_POLL_SECONDS. Each batch is streamed back as soon as it ends. Every
+result gets its own Langfuse trace and generation, spanning submission to
+completion, with the provider's usage and the batch price (half the
+synchronous one).
+
+The submitted batches are recorded next to the output, so an interrupted
+run resumes polling them instead of submitting again. Like eval_runner.py,
+the output JSONL is the checkpoint: rows with a result are not sent again.
+
+    python batch_mode.py data/questions.jsonl --provider openai \\
+        --model gpt-4o-mini --output answers.jsonl --prompt default_prompt
+
+`python benchmarks/stub_servers.py` serves both batch APIs locally.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+from config import get_anthropic_client, get_langfuse, get_openai_client
+from eval_runner import exact_match, read_checkpoint, read_rows, system_prompt_kwargs
+from logs import configure_logging, get_logger
+from metering import Usage, cost_details, usage_from_response
+from resilience import RETRY_MAX_ATTEMPTS, backoff_delay, is_retryable
+from score_queue import score_queue
+from trace_policy import trace_sampler
+
+log = get_logger(__name__)
+
+# Requests per batch, below the providers' own limits. Smaller batches end
+# (and stream back) sooner.
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "10000"))
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+# Provider limits per batch: requests and bytes of the request file/body.
+PROVIDER_LIMITS = {
+    "openai": (50_000, 200 * 2**20),
+    "anthropic": (100_000, 256 * 2**20),
+}
+# Batch requests are billed at half the synchronous price.
+BATCH_PRICE = 0.5
+# Same cap as anthropic_api.
+MAX_TOKENS = 1024
+
+
+@dataclass
+class BatchRequest:
+    custom_id: str
+    prompt: str
+    # Provider-specific system prompt arguments (system_prompt_kwargs).
+    options: dict = field(default_factory=dict)
+
+
+@dataclass
+class BatchResult:
+    custom_id: str
+    batch_id: str
+    output: str | None
+    error: str | None
+    usage: Usage
+    trace_id: str | None = None
+
+
+def custom_id(row_id: str) -> str:
+    # Anthropic only accepts [a-zA-Z0-9_-]{1,64}; other ids are hashed.
+    if re.fullmatch(r"[a-zA-Z0-9_-]{1,64}", row_id):
+        return row_id
+    return "id-" + hashlib.sha256(row_id.encode()).hexdigest()[:40]
+
+
+def _call(fn):
+    # Batch management calls: retried like provider calls, but outside the
+    # per-minute limits, which batches do not count against.
+    for attempt in range(RETRY_MAX_ATTEMPTS):
+        try:
+            return fn()
+        except Exception as e:
+            if not is_retryable(e) or attempt + 1 >= RETRY_MAX_ATTEMPTS:
+                raise
+            time.sleep(backoff_delay(attempt, e))
+
+
+class OpenAIBatches:
+    provider = "openai"
+
+    def line(self, request: BatchRequest, model: str) -> dict:
+        return {
+            "custom_id": request.custom_id,
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": {"model": model, "input": request.prompt, **request.options},
+        }
+
+    def submit(self, lines: list[dict]) -> str:
+        data = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+        client = get_openai_client()
+        upload = _call(
+            lambda: client.files.create(
+                file=("batch.jsonl", io.BytesIO(data.encode("utf-8"))), purpose="batch"
+            )
+        )
+        batch = _call(
+            lambda: client.batches.create(
+                input_file_id=upload.id,
+                endpoint="/v1/responses",
+                completion_window="24h",
+            )
+        )
+        return batch.id
+
+    def ended(self, batch_id: str) -> bool:
+        batch = _call(lambda: get_openai_client().batches.retrieve(batch_id))
+        return batch.status in ("completed", "failed", "expired", "cancelled")
+
+    def results(self, batch_id: str) -> Iterator[tuple]:
+        # (custom_id, output, raw usage, error), streamed from the output and
+        # error files.
+        from openai.types.responses import Response
+
+        client = get_openai_client()
+        batch = _call(lambda: client.batches.retrieve(batch_id))
+        if batch.status != "completed" and batch.errors:
+            log.warning("OpenAI batch %s %s: %s", batch_id, batch.status, batch.errors)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            with client.files.with_streaming_response.content(file_id) as content:
+                for line in content.iter_lines():
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    response = record.get("response") or {}
+                    if record.get("error") or response.get("status_code") != 200:
+                        error = record.get("error") or response.get("body", {}).get(
+                            "error"
+                        )
+                        yield record["custom_id"], None, None, _error_text(error)
+                        continue
+                    # Built without validation, like the SDK's own responses.
+                    body = Response.construct(**response["body"])
+                    yield record["custom_id"], body.output_text, body.usage, None
+
+
+class AnthropicBatches:
+    provider = "anthropic"
+
+    def line(self, request: BatchRequest, model: str) -> dict:
+        return {
+            "custom_id": request.custom_id,
+            "params": {
+                "model": model,
+                "max_tokens": MAX_TOKENS,
+                "messages": [{"role": "user", "content": request.prompt}],
+                **request.options,
+            },
+        }
+
+    def submit(self, lines: list[dict]) -> str:
+        batches = get_anthropic_client().messages.batches
+        return _call(lambda: batches.create(requests=lines)).id
+
+    def ended(self, batch_id: str) -> bool:
+        batches = get_anthropic_client().messages.batches
+        return _call(lambda: batches.retrieve(batch_id)).processing_status == "ended"
+
+    def results(self, batch_id: str) -> Iterator[tuple]:
+        batches = get_anthropic_client().messages.batches
+        for item in _call(lambda: batches.results(batch_id)):
+            result = item.result
+            if result.type != "succeeded":
+                error = getattr(result, "error", None)
+                yield item.custom_id, None, None, _error_text(
+                    getattr(error, "error", error) or result.type
+                )
+                continue
+            text = "".join(
+                block.text for block in result.message.content if block.type == "text"
+            )
+            yield item.custom_id, text, result.message.usage, None
+
+
+BACKENDS = {"openai": OpenAIBatches, "anthropic": AnthropicBatches}
+
+
+def _error_text(error) -> str:
+    if isinstance(error, dict):
+        return error.get("message") or json.dumps(error)
+    return getattr(error, "message", None) or str(error)
+
+
+def pack(lines: list[dict], max_requests: int, max_bytes: int) -> Iterator[list]:
+    # Consecutive runs of lines within both limits (bytes as JSONL).
+    chunk, size = [], 0
+    for line in lines:
+        line_size = len(json.dumps(line, ensure_ascii=False).encode("utf-8")) + 1
+        if chunk and (len(chunk) >= max_requests or size + line_size > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(line)
+        size += line_size
+    if chunk:
+        yield chunk
+
+
+class BatchJob:
+    """
+    The batches of one provider and model. `state_path` records every
+    submitted batch (id, submission time, custom ids) until its results have
+    been collected.
+    """
+
+    def __init__(self, provider: str, model: str, state_path: Path):
+        self.backend = BACKENDS[provider]()
+        self.provider = provider
+        self.model = model
+        self.state_path = state_path
+        self.batches: dict[str, dict] = {}
+        if state_path.exists():
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+            if (state["provider"], state["model"]) == (provider, model):
+                self.batches = state["batches"]
+            else:
+                log.warning("Ignoring %s: batches of another model", state_path)
+
+    def _save(self):
+        state = {"provider": self.provider, "model": self.model}
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({**state, "batches": self.batches}), "utf-8")
+        tmp.replace(self.state_path)
+
+    def pending_ids(self) -> set[str]:
+        return {cid for batch in self.batches.values() for cid in batch["ids"]}
+
+    def submit(self, requests: list[BatchRequest]) -> list[str]:
+        max_requests, max_bytes = PROVIDER_LIMITS[self.provider]
+        lines = [self.backend.line(request, self.model) for request in requests]
+        submitted = []
+        for chunk in pack(lines, min(max_requests, BATCH_MAX_REQUESTS), max_bytes):
+            batch_id = self.backend.submit(chunk)
+            self.batches[batch_id] = {
+                "submitted": time.time(),
+                "ids": [line["custom_id"] for line in chunk],
+            }
+            # Recorded at once: a crash after this point resumes the batch.
+            self._save()
+            submitted.append(batch_id)
+            log.info(
+                "Submitted %s batch %s (%d requests)",
+                self.provider,
+                batch_id,
+                len(chunk),
+            )
+        return submitted
+
+    def results(self, requests: dict[str, BatchRequest]) -> Iterator[BatchResult]:
+        """
+        Polls the pending batches and yields the results of each as soon as
+        it ends. Results for ids not in `requests` (already written by an
+        earlier run) are skipped. A batch is forgotten once fully read.
+        """
+        while self.batches:
+            ended = [
+                batch_id
+                for batch_id in list(self.batches)
+                if self.backend.ended(batch_id)
+            ]
+            for batch_id in ended:
+                submitted = self.batches[batch_id]["submitted"]
+                for cid, output, raw_usage, error in self.backend.results(batch_id):
+                    if cid not in requests:
+                        continue
+                    usage = (
+                        usage_from_response(self.provider, raw_usage)
+                        if raw_usage is not None
+                        else Usage()
+                    )
+                    result = BatchResult(cid, batch_id, output, error, usage)
+                    result.trace_id = self.trace(requests[cid], result, submitted)
+                    yield result
+                del self.batches[batch_id]
+                self._save()
+            if self.batches and not ended:
+                time.sleep(BATCH_POLL_SECONDS)
+        self.state_path.unlink(missing_ok=True)
+
+    def trace(self, request: BatchRequest, result: BatchResult, submitted: float):
+        # One trace per request, as for interactive calls; sampled by the
+        # same rules (page "batch_mode"), and always sent when it failed.
+        trace_id = str(uuid.uuid4())
+        trace_sampler.sample(trace_id, page="batch_mode", model=self.model)
+        costs = cost_details(self.provider, self.model, result.usage)
+        if costs:
+            costs = {k: round(v * BATCH_PRICE, 8) for k, v in costs.items()}
+        metadata = {"batch_id": result.batch_id, "custom_id": result.custom_id}
+        trace = get_langfuse().trace(
+            id=trace_id,
+            name=f"{self.provider}_batch",
+            input=request.prompt,
+            output=result.output,
+            metadata=metadata,
+            tags=["batch", self.provider],
+        )
+        trace.generation(
+            name=f"{self.provider}_batch",
+            model=self.model,
+            input=self.backend.line(request, self.model),
+            output=result.output,
+            start_time=datetime.fromtimestamp(submitted, timezone.utc),
+            end_time=datetime.now(timezone.utc),
+            usage_details=(
+                result.usage.usage_details() if result.error is None else None
+            ),
+            cost_details=costs if result.error is None else None,
+            metadata=metadata,
+            level="ERROR" if result.error else "DEFAULT",
+            status_message=result.error,
+        )
+        return trace_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a JSONL dataset in batches.")
+    parser.add_argument("dataset", type=Path)
+    parser.add_argument("--provider", choices=list(BACKENDS), required=True)
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--prompt", help="Langfuse prompt used as system prompt")
+    parser.add_argument("--label", default="production")
+    args = parser.parse_args()
+
+    configure_logging()
+
+    output = args.output or args.dataset.with_suffix(".batch.jsonl")
+    done, _ = read_checkpoint(output)
+    options = {}
+    if args.prompt:
+        prompt = get_langfuse().get_prompt(args.prompt, label=args.label)
+        options = system_prompt_kwargs(args.provider, prompt.compile())
+
+    job = BatchJob(args.provider, args.model, output.with_suffix(".batches.json"))
+    rows = {
+        custom_id(row["id"]): row
+        for row in read_rows(args.dataset)
+        if (row["id"], args.provider) not in done
+    }
+    requests = {
+        cid: BatchRequest(cid, row["input"], options) for cid, row in rows.items()
+    }
+    pending = job.pending_ids()
+    job.submit([request for cid, request in requests.items() if cid not in pending])
+
+    counts = {"ok": 0, "errors": 0}
+    started = time.perf_counter()
+    with output.open("a", encoding="utf-8") as f:
+        for result in job.results(requests):
+            row = rows[result.custom_id]
+            score = None
+            if result.error is None:
+                score = exact_match(result.output, row.get("expected_output"))
+            if score is not None:
+                score_queue.submit(
+                    id=f"{result.trace_id}-exact_match",
+                    trace_id=result.trace_id,
+                    name="exact_match",
+                    value=score,
+                    data_type="BOOLEAN",
+                )
+            counts["errors" if result.error else "ok"] += 1
+            record = {
+                "id": row["id"],
+                "provider": args.provider,
+                "model": args.model,
+                "input": row["input"],
+                "output": result.output,
+                "expected_output": row.get("expected_output"),
+                "exact_match": score,
+                "error": result.error,
+                "batch_id": result.batch_id,
+                "trace_id": result.trace_id,
+            }
+            # Flushed per result: the file is the checkpoint.
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+
+    log.info(
+        "%d ok, %d errors in %.0fs -> %s",
+        counts["ok"],
+        counts["errors"],
+        time.perf_counter() - started,
+        output,
+    )
+    get_langfuse().flush()
+    score_queue.flush()
+
+
+if __name__ == "__main__":
+    main()
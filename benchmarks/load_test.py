@@ -0,0 +1,298 @@
+"""
+Concurrent-session load and memory soak test for the Streamlit app.
+
+Starts the stub servers from `stub_servers.py` and simulates concurrent users
+of `main.py` in one process, as one Streamlit worker would hold them: every
+user is an `AppTest` session (its own session state and script runs) on a
+thread of its own, opening a page from the sidebar and chatting for a number
+of turns. On pages with thumbs feedback each answer is rated. Reported per
+page:
+
+- rerun latency (p50/p95/p99) of the chat turns and the feedback clicks;
+- session-state size after the first and the last turn, and its growth per
+  turn over the second half of the run, which should be ~0 once the history
+  window is full (anything else is a leak in what a session keeps);
+- process RSS before, during and after the run, per session;
+- score submissions per second, through the score queue to the stub
+  Langfuse.
+
+Run from the repository root:
+
+    python benchmarks/load_test.py --sessions 8 --turns 30
+    python benchmarks/load_test.py --pages "OpenAI Chat with Score" --sessions 32
+"""
+
+import argparse
+import gc
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_servers import StubConfig, start_all  # noqa: E402
+
+PROMPT = "Summarise the plot of Hamlet in two sentences."
+
+
+def rss_mb() -> float:
+    # Current resident set size; the peak where /proc is not available.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+def shared_objects() -> set[int]:
+    # Module-level objects of the app (clients, stores, caches, singletons)
+    # are shared by every session and not counted in a session's size.
+    shared = set()
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if path.startswith(str(ROOT)) and "benchmarks" not in path:
+            shared.update(id(value) for value in vars(module).values())
+    return shared
+
+
+def deep_size(obj, shared: set[int]) -> int:
+    # Bytes reachable from `obj`, excluding shared objects, modules, classes
+    # and functions.
+    seen, stack, size = set(), [obj], 0
+    skip = (types.ModuleType, type, types.FunctionType, types.BuiltinFunctionType)
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or id(item) in shared or isinstance(item, skip):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        stack.extend(gc.get_referents(item))
+    return size
+
+
+def share_runtime():
+    """
+    AppTest installs a mock Streamlit runtime for the length of each run and
+    removes it afterwards, which breaks the other sessions' runs when they
+    overlap. Here every session shares one mock runtime (with real media,
+    dataframe and cache managers), as the sessions of a server share its
+    runtime, and AppTest's per-run swaps go to a detached class.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import (
+        MemoryCacheStorageManager,
+    )
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import app_test
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.bidi_component_registry = app_test.BidiComponentManager()
+    runtime.bidi_component_registry.discover_and_register_components(
+        start_file_watching=False
+    )
+    Runtime._instance = runtime
+    app_test.Runtime = type("DetachedRuntime", (), {"_instance": None})
+
+
+class Session:
+    """One simulated user: an AppTest session on one page."""
+
+    def __init__(self, page: str, turns: int, timeout: float):
+        from streamlit.testing.v1 import AppTest
+
+        self.page = page
+        self.turns = turns
+        self.app = AppTest.from_file(str(ROOT / "main.py"), default_timeout=timeout)
+        self.turn_latencies: list[float] = []
+        self.feedback_latencies: list[float] = []
+        self.state_sizes: list[int] = []
+        self.feedback = 0
+        self.errors = 0
+
+    def timed_run(self, element) -> float:
+        started = time.perf_counter()
+        element.run()
+        return time.perf_counter() - started
+
+    def run(self, shared: set[int]):
+        self.app.run()
+        self.app.sidebar.radio[0].set_value(self.page).run()
+        for turn in range(self.turns):
+            if self.app.chat_input:
+                element = self.app.chat_input[0].set_value(f"{PROMPT} ({turn})")
+            else:
+                element = self.app
+            self.turn_latencies.append(self.timed_run(element))
+            self.errors += len(self.app.error) + len(self.app.exception)
+            if self.app.feedback:
+                element = self.app.feedback[-1].set_value(turn % 2)
+                self.feedback_latencies.append(self.timed_run(element))
+                self.feedback += 1
+            self.state_sizes.append(deep_size(self.app.session_state.to_dict(), shared))
+
+
+def percentiles(values: list[float]) -> str:
+    if not values:
+        return f"{'-':>8} {'-':>8} {'-':>8}"
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return f"{p50:>8.1f} {p95:>8.1f} {p99:>8.1f}"
+
+
+def state_growth(sessions: list[Session]) -> float:
+    # Mean bytes per turn over the second half of each session's turns.
+    slopes = []
+    for session in sessions:
+        sizes = session.state_sizes
+        half = len(sizes) // 2
+        if len(sizes) - half >= 2:
+            slopes.append((sizes[-1] - sizes[half]) / (len(sizes) - 1 - half))
+    return float(np.mean(slopes)) if slopes else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=8, help="users per page")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--pages", nargs="+", help="sidebar labels (default: all)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=2000.0)
+    parser.add_argument("--output-tokens", type=int, default=32)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        args.latency, args.token_rate, args.output_tokens, args.error_rate
+    )
+    servers = start_all(config)
+    # Must happen before the pages (and their SDKs) are imported.
+    os.environ.update(servers["env"])
+    os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+    os.environ["CONVERSATION_DB"] = str(
+        Path(tempfile.mkdtemp()) / "conversations.sqlite3"
+    )
+    # The load is the point: no client-side rate limiting.
+    os.environ.setdefault("RATE_LIMIT_RPM", "1000000")
+    os.environ.setdefault("RATE_LIMIT_TPM", "1000000000")
+    # The stub Langfuse has no read API (prompts, model listings): the
+    # fallbacks apply and their warnings would drown the report.
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    logging.getLogger("langfuse").addFilter(lambda record: False)
+    # AppTest sets up each session's state outside a script run, which warns.
+    logging.getLogger(
+        "streamlit.runtime.scriptrunner_utils.script_run_context"
+    ).addFilter(lambda record: False)
+
+    from main import PAGES
+
+    pages = args.pages or list(PAGES)
+    unknown = set(pages) - set(PAGES)
+    if unknown:
+        parser.error(f"unknown pages: {', '.join(sorted(unknown))}")
+
+    share_runtime()
+    # Warm-up: one short session per page imports the modules and builds the
+    # clients, so the baseline RSS is that of a started worker.
+    for page in pages:
+        Session(page, 1, args.timeout).run(shared_objects())
+    gc.collect()
+    baseline = rss_mb()
+    shared = shared_objects()
+
+    sessions = [
+        Session(page, args.turns, args.timeout)
+        for page in pages
+        for _ in range(args.sessions)
+    ]
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample_rss():
+        while not done.wait(0.2):
+            peak[0] = max(peak[0], rss_mb())
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    from score_queue import score_queue
+
+    sent_before = score_queue.stats()["sent"]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        for future in [pool.submit(session.run, shared) for session in sessions]:
+            future.result()
+    wall = time.perf_counter() - started
+    # Scores still queued count towards the submission time.
+    score_queue.flush(timeout=60)
+    scores_wall = time.perf_counter() - started
+    drain = scores_wall - wall
+    done.set()
+    sampler.join()
+    after = rss_mb()
+    gc.collect()
+    collected = rss_mb()
+    queue = score_queue.stats()
+
+    header = (
+        f"{'page':<30} {'users':>5} {'turn p50':>8} {'p95':>8} {'p99':>8} "
+        f"{'fb p50':>8} {'p95':>8} {'p99':>8} {'state KiB':>9} {'B/turn':>7} "
+        f"{'errors':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    for page in pages:
+        group = [session for session in sessions if session.page == page]
+        turns = [latency for s in group for latency in s.turn_latencies]
+        clicks = [latency for s in group for latency in s.feedback_latencies]
+        last = np.mean([s.state_sizes[-1] for s in group if s.state_sizes] or [0])
+        print(
+            f"{page:<30} {len(group):>5} {percentiles(turns)} {percentiles(clicks)} "
+            f"{last / 1024:>9.1f} {state_growth(group):>7.0f} "
+            f"{sum(s.errors for s in group):>6}"
+        )
+
+    total_turns = sum(len(s.turn_latencies) for s in sessions)
+    feedback = sum(s.feedback for s in sessions)
+    print()
+    print(
+        f"{len(sessions)} sessions, {total_turns} turns in {wall:.1f}s "
+        f"({total_turns / wall:.1f} turns/s)"
+    )
+    print(
+        f"RSS: {baseline:.0f} MiB warm, {peak[0]:.0f} MiB peak, {after:.0f} MiB after "
+        f"({collected:.0f} MiB after gc); "
+        f"{(after - baseline) * 1024 / len(sessions):.0f} KiB per session"
+    )
+    print(
+        f"Scores: {feedback} submitted, {queue['sent'] - sent_before} sent, "
+        f"{queue['dropped']} dropped, {queue['depth']} pending; "
+        f"{feedback / scores_wall:.1f} scores/s including the queue drain "
+        f"({drain:.1f}s after the last turn)"
+    )
+    print(
+        f"Langfuse stub ingested {servers['langfuse'].stats.ingested_events} events "
+        f"in {servers['langfuse'].stats.requests} batches"
+    )
+    for name in ["openai", "anthropic", "gemini", "langfuse"]:
+        servers[name].stop()
+
+
+if __name__ == "__main__":
+    main()
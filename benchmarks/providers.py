@@ -0,0 +1,179 @@
+"""
+Offline throughput/latency benchmark for the provider calls.
+
+Starts the stub servers from `stub_servers.py`, points the SDKs and Langfuse
+at them and drives `gemini_api`, `openai_api` and `anthropic_api` (plus their
+stream and async variants) at several concurrency levels. Every scenario runs
+twice:
+
+- observed: the functions as the pages call them, wrapped in @observe.
+- raw:      the same functions with @observe peeled off (`__wrapped__`).
+
+The difference between the two is the overhead added by tracing. The response
+cache is disabled so every request reaches a stub. Run from the repository
+root:
+
+    python benchmarks/providers.py --requests 200 --concurrency 1 4 16
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_servers import StubConfig, start_all  # noqa: E402
+
+PROVIDERS = {
+    "gemini": ("gemini_page", "gemini_api"),
+    "openai": ("openai_page", "openai_api"),
+    "anthropic": ("anthropic_page", "anthropic_api"),
+}
+VARIANTS = ["sync", "stream", "async"]
+PROMPT = "Summarise the plot of Hamlet in two sentences."
+
+
+def load(provider: str, variant: str):
+    import importlib
+
+    module_name, func_name = PROVIDERS[provider]
+    suffix = {"sync": "", "stream": "_stream", "async": "_async"}[variant]
+    return getattr(importlib.import_module(module_name), func_name + suffix)
+
+
+def call_once(func, variant: str) -> tuple[float, bool]:
+    started = time.perf_counter()
+    try:
+        if variant == "stream":
+            "".join(func(PROMPT))
+        else:
+            func(PROMPT)
+    except Exception:
+        return time.perf_counter() - started, True
+    return time.perf_counter() - started, False
+
+
+async def call_once_async(func) -> tuple[float, bool]:
+    started = time.perf_counter()
+    try:
+        await func(PROMPT)
+    except Exception:
+        return time.perf_counter() - started, True
+    return time.perf_counter() - started, False
+
+
+def run_threads(func, variant: str, requests: int, concurrency: int) -> list:
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda _: call_once(func, variant), range(requests)))
+
+
+def run_async_batch(func, requests: int, concurrency: int) -> list:
+    from config import run_async
+
+    async def batch():
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with gate:
+                return await call_once_async(func)
+
+        return await asyncio.gather(*(one() for _ in range(requests)))
+
+    return run_async(batch()).result()
+
+
+def run_scenario(func, variant: str, requests: int, concurrency: int) -> dict:
+    started = time.perf_counter()
+    if variant == "async":
+        results = run_async_batch(func, requests, concurrency)
+    else:
+        results = run_threads(func, variant, requests, concurrency)
+    wall = time.perf_counter() - started
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "req/s": requests / wall,
+        "p50": p50,
+        "p95": p95,
+        "p99": p99,
+        "errors": sum(error for _, error in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--providers", nargs="+", default=list(PROVIDERS))
+    parser.add_argument("--variants", nargs="+", default=VARIANTS)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=2000.0)
+    parser.add_argument("--output-tokens", type=int, default=32)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        args.latency, args.token_rate, args.output_tokens, args.error_rate
+    )
+    servers = start_all(config)
+    # Must happen before the pages (and their SDKs) are imported.
+    os.environ.update(servers["env"])
+    os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+    # Measure the wrappers, not a configured client-side rate limit.
+    os.environ["RATE_LIMIT_RPM"] = os.environ["RATE_LIMIT_TPM"] = "0"
+    os.environ["RATE_LIMITS"] = "{}"
+    # Outside @observe the context updates only log warnings; keep them quiet.
+    # A filter, because the Langfuse clients reset the logger level.
+    logging.getLogger("langfuse").addFilter(lambda record: False)
+
+    header = (
+        f"{'scenario':<28} {'mode':<9} {'conc':>4} {'req/s':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    overheads = []
+    for provider in args.providers:
+        for variant in args.variants:
+            observed = load(provider, variant)
+            modes = {"observed": observed, "raw": observed.__wrapped__}
+            # Warm-up: builds the client and opens the connection pool.
+            for func in modes.values():
+                run_scenario(func, variant, 1, 1)
+            for concurrency in args.concurrency:
+                rows = {
+                    mode: run_scenario(func, variant, args.requests, concurrency)
+                    for mode, func in modes.items()
+                }
+                for mode, row in rows.items():
+                    print(
+                        f"{provider + '/' + variant:<28} {mode:<9} {concurrency:>4} "
+                        f"{row['req/s']:>8.1f} {row['p50']:>8.1f} {row['p95']:>8.1f} "
+                        f"{row['p99']:>8.1f} {row['errors']:>6}"
+                    )
+                overheads.append(rows["observed"]["p50"] - rows["raw"]["p50"])
+
+    from config import get_langfuse
+
+    get_langfuse().flush()
+    print()
+    print(f"@observe overhead (median of p50 deltas): {np.median(overheads):.2f} ms")
+    print(
+        f"Langfuse stub ingested {servers['langfuse'].stats.ingested_events} events "
+        f"in {servers['langfuse'].stats.requests} batches"
+    )
+    for name in ["openai", "anthropic", "gemini", "langfuse"]:
+        servers[name].stop()
+
+
+if __name__ == "__main__":
+    main()
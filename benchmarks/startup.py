@@ -0,0 +1,96 @@
+"""
+Cold-start benchmark for the Streamlit app.
+
+Each scenario runs in a fresh interpreter so module and client caches start
+empty, mirroring what a new server process pays before the first page renders:
+
+- eager: what the app used to do - import every page and build every client.
+- lazy:  import the router and open a single page, building only its client.
+
+Run from the repository root:
+
+    python benchmarks/startup.py --runs 10
+
+Dummy API keys are injected so the clients can be constructed offline; the
+network-bound `get_prompt` calls of the scoring pages are not included, so the
+real gap on a cold start is larger than reported.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "eager (all pages + all clients)": """
+import gemini_page, openai_page, anthropic_page, compare_page
+import scoring_page
+import config
+config.get_gemini_client()
+config.get_openai_client()
+config.get_anthropic_client()
+config.get_openai_async_client()
+config.get_anthropic_async_client()
+""",
+    "lazy (router + OpenAI page)": """
+import main, importlib
+importlib.import_module("openai_page")
+import config
+config.get_openai_client()
+""",
+    "lazy (router + Gemini page)": """
+import main, importlib
+importlib.import_module("gemini_page")
+import config
+config.get_gemini_client()
+""",
+}
+
+TIMER = """
+import time
+_started = time.perf_counter()
+{body}
+print(time.perf_counter() - _started)
+"""
+
+
+def run_once(body: str) -> float:
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "ANTHROPIC_API_KEY": "bench",
+        "GEMINI_API_KEY": "bench",
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", TIMER.format(body=body)],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<36}{'median':>10}{'min':>10}{'max':>10}")
+    for name, body in SCENARIOS.items():
+        timings = [run_once(body) for _ in range(args.runs)]
+        print(
+            f"{name:<36}"
+            f"{statistics.median(timings) * 1000:>8.0f}ms"
+            f"{min(timings) * 1000:>8.0f}ms"
+            f"{max(timings) * 1000:>8.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
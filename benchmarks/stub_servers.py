@@ -0,0 +1,665 @@
+"""
+Local stand-ins for the provider and Langfuse HTTP APIs.
+
+Each stub speaks just enough of the real wire format for the official SDKs:
+
+- OpenAI Responses:           POST /v1/responses (JSON or SSE with "stream": true)
+- Anthropic Messages:         POST /v1/messages (JSON or SSE with "stream": true)
+- Gemini generateContent:     POST /v1beta/models/{model}:generateContent
+                              POST /v1beta/models/{model}:streamGenerateContent
+- OpenAI Batch:               POST /v1/files, /v1/batches
+                              GET /v1/batches/{id}, /v1/files/{id}/content
+- Anthropic Message Batches:  POST /v1/messages/batches
+                              GET /v1/messages/batches/{id}, .../{id}/results
+- Langfuse ingestion:         POST /api/public/ingestion
+- Langfuse datasets:          POST /api/public/v2/datasets, /dataset-items,
+                              /dataset-run-items
+
+Batches end `batch_seconds` after they are created; each of their requests
+fails with the error rate. Latency, token rate and error rate are
+configurable per server, so the
+benchmarks and load tests can run without keys or network. Run standalone to
+point a local `streamlit run main.py` at the stubs:
+
+    python benchmarks/stub_servers.py --latency 0.2 --token-rate 200
+"""
+
+import argparse
+import email.policy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.05  # seconds before the first token
+    token_rate: float = 500.0  # output tokens per second
+    output_tokens: int = 32
+    error_rate: float = 0.0  # share of requests answered with a 503
+    batch_seconds: float = 1.0  # from creating a batch until it has ended
+
+
+@dataclass
+class StubStats:
+    requests: int = 0
+    errors: int = 0
+    ingested_events: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+
+def _tokens(config: StubConfig) -> list[str]:
+    return [f"tok{i} " for i in range(config.output_tokens)]
+
+
+def _prompt_tokens(body: dict) -> int:
+    # Rough whitespace count of the request, good enough for usage numbers.
+    return max(1, len(json.dumps(body).split()))
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: StubConfig
+    stats: StubStats
+    # Files and batches of the server, guarded by stats.lock.
+    store: dict
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw or b"{}")
+
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_bytes(self, data: bytes, content_type: str = "application/jsonl"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _batch_failure(self) -> bool:
+        # Whether one request of a batch fails (no latency: batches are slow).
+        return random.random() < self.config.error_rate
+
+    def _start_sse(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _sse(self, data: dict, event: str | None = None):
+        chunk = f"event: {event}\n" if event else ""
+        chunk += f"data: {json.dumps(data)}\n\n"
+        self.wfile.write(chunk.encode("utf-8"))
+        self.wfile.flush()
+
+    def _maybe_fail(self) -> bool:
+        self.stats.add(requests=1)
+        if random.random() < self.config.error_rate:
+            self.stats.add(errors=1)
+            self._send_json(
+                503, {"error": {"message": "stub overloaded", "type": "overloaded"}}
+            )
+            return True
+        time.sleep(self.config.latency)
+        return False
+
+    def _stream_tokens(self, emit):
+        delay = 1.0 / self.config.token_rate if self.config.token_rate else 0.0
+        for token in _tokens(self.config):
+            emit(token)
+            if delay:
+                time.sleep(delay)
+
+    def _generate(self) -> str:
+        tokens = _tokens(self.config)
+        if self.config.token_rate:
+            time.sleep(len(tokens) / self.config.token_rate)
+        return "".join(tokens)
+
+
+def _openai_response(body: dict, text: str, output_tokens: int) -> dict:
+    usage = {
+        "input_tokens": _prompt_tokens(body),
+        "input_tokens_details": {"cached_tokens": 0},
+        "output_tokens": output_tokens,
+        "output_tokens_details": {"reasoning_tokens": 0},
+        "total_tokens": _prompt_tokens(body) + output_tokens,
+    }
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model"),
+        "status": "completed",
+        "output": [
+            {
+                "id": f"msg_{uuid.uuid4().hex}",
+                "type": "message",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        ],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": usage,
+    }
+
+
+class OpenAIStubHandler(_StubHandler):
+    def do_POST(self):
+        if self.path.endswith("/files"):
+            return self._upload_file()
+        body = self._read_json()
+        if self.path.endswith("/batches"):
+            return self._create_batch(body)
+        if not self.path.endswith("/responses"):
+            return self._send_json(404, {"error": {"message": self.path}})
+        if self._maybe_fail():
+            return
+
+        def response(text):
+            return _openai_response(body, text, self.config.output_tokens)
+
+        if not body.get("stream"):
+            return self._send_json(200, response(self._generate()))
+
+        self._start_sse()
+        sequence = iter(range(1_000_000))
+        self._sse(
+            {
+                "type": "response.created",
+                "sequence_number": next(sequence),
+                "response": {**response(""), "status": "in_progress", "usage": None},
+            },
+            "response.created",
+        )
+        self._stream_tokens(
+            lambda token: self._sse(
+                {
+                    "type": "response.output_text.delta",
+                    "item_id": "msg_stub",
+                    "output_index": 0,
+                    "content_index": 0,
+                    "delta": token,
+                    "sequence_number": next(sequence),
+                },
+                "response.output_text.delta",
+            )
+        )
+        self._sse(
+            {
+                "type": "response.completed",
+                "sequence_number": next(sequence),
+                "response": response("".join(_tokens(self.config))),
+            },
+            "response.completed",
+        )
+
+    def do_GET(self):
+        self.stats.add(requests=1)
+        match = re.fullmatch(r"/v1/batches/([^/]+)", self.path)
+        if match and match.group(1) in self.store:
+            return self._send_json(200, self._finish_batch(match.group(1)))
+        match = re.fullmatch(r"/v1/files/([^/]+)/content", self.path)
+        if match and match.group(1) in self.store:
+            return self._send_bytes(self.store[match.group(1)])
+        self._send_json(404, {"error": {"message": self.path}})
+
+    def _upload_file(self):
+        # multipart/form-data with "purpose" and "file" parts.
+        self.stats.add(requests=1)
+        length = int(self.headers.get("Content-Length") or 0)
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        form = BytesParser(policy=email.policy.default).parsebytes(
+            header + self.rfile.read(length)
+        )
+        parts = {
+            part.get_param("name", header="content-disposition"): part
+            for part in form.iter_parts()
+        }
+        content = parts["file"].get_payload(decode=True)
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self.stats.lock:
+            self.store[file_id] = content
+        self._send_json(
+            200,
+            {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": parts["file"].get_filename() or "batch.jsonl",
+                "purpose": "batch",
+                "status": "processed",
+            },
+        )
+
+    def _create_batch(self, body: dict):
+        self.stats.add(requests=1)
+        content = self.store.get(body.get("input_file_id"))
+        if content is None:
+            return self._send_json(404, {"error": {"message": "no such file"}})
+        lines = [json.loads(line) for line in content.splitlines() if line.strip()]
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "metadata": body.get("metadata"),
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+        }
+        with self.stats.lock:
+            self.store[batch["id"]] = batch
+            self.store[f"{batch['id']}/requests"] = lines
+        self._send_json(200, batch)
+
+    def _finish_batch(self, batch_id: str) -> dict:
+        # Writes the output and error files once the batch is due.
+        with self.stats.lock:
+            batch = self.store[batch_id]
+            if (
+                batch["status"] != "in_progress"
+                or time.time() - batch["created_at"] < self.config.batch_seconds
+            ):
+                return batch
+            output, errors = [], []
+            for line in self.store.pop(f"{batch_id}/requests"):
+                record = {
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": line["custom_id"],
+                    "error": None,
+                }
+                if self._batch_failure():
+                    record["response"] = {
+                        "status_code": 503,
+                        "request_id": f"req_{uuid.uuid4().hex}",
+                        "body": {"error": {"message": "stub overloaded"}},
+                    }
+                    errors.append(record)
+                    continue
+                text = "".join(_tokens(self.config))
+                record["response"] = {
+                    "status_code": 200,
+                    "request_id": f"req_{uuid.uuid4().hex}",
+                    "body": _openai_response(
+                        line["body"], text, self.config.output_tokens
+                    ),
+                }
+                output.append(record)
+            for name, records in (("output", output), ("error", errors)):
+                if records:
+                    file_id = f"file-{uuid.uuid4().hex}"
+                    self.store[file_id] = "".join(
+                        json.dumps(record) + "\n" for record in records
+                    ).encode()
+                    batch[f"{name}_file_id"] = file_id
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+            batch["request_counts"].update(completed=len(output), failed=len(errors))
+            return batch
+
+
+def _anthropic_message(body: dict) -> dict:
+    return {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model"),
+        "content": [],
+        "stop_reason": None,
+        "stop_sequence": None,
+        "usage": {"input_tokens": _prompt_tokens(body), "output_tokens": 0},
+    }
+
+
+class AnthropicStubHandler(_StubHandler):
+    def do_POST(self):
+        body = self._read_json()
+        if self.path.endswith("/messages/batches"):
+            return self._create_batch(body)
+        if not self.path.endswith("/messages"):
+            return self._send_json(404, {"error": {"message": self.path}})
+        if self._maybe_fail():
+            return
+        message = _anthropic_message(body)
+        if not body.get("stream"):
+            message["content"] = [{"type": "text", "text": self._generate()}]
+            message["stop_reason"] = "end_turn"
+            message["usage"]["output_tokens"] = self.config.output_tokens
+            return self._send_json(200, message)
+
+        self._start_sse()
+        self._sse({"type": "message_start", "message": message}, "message_start")
+        self._sse(
+            {
+                "type": "content_block_start",
+                "index": 0,
+                "content_block": {"type": "text", "text": ""},
+            },
+            "content_block_start",
+        )
+        self._stream_tokens(
+            lambda token: self._sse(
+                {
+                    "type": "content_block_delta",
+                    "index": 0,
+                    "delta": {"type": "text_delta", "text": token},
+                },
+                "content_block_delta",
+            )
+        )
+        self._sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        self._sse(
+            {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": self.config.output_tokens},
+            },
+            "message_delta",
+        )
+        self._sse({"type": "message_stop"}, "message_stop")
+
+    def do_GET(self):
+        self.stats.add(requests=1)
+        match = re.fullmatch(r"/v1/messages/batches/([^/]+)(/results)?", self.path)
+        if match is None or match.group(1) not in self.store:
+            return self._send_json(404, {"error": {"message": self.path}})
+        batch = self._finish_batch(match.group(1))
+        if not match.group(2):
+            return self._send_json(200, batch)
+        results = self.store.get(f"{batch['id']}/results")
+        if results is None:
+            return self._send_json(404, {"error": {"message": "batch not ended"}})
+        self._send_bytes(results)
+
+    def _create_batch(self, body: dict):
+        self.stats.add(requests=1)
+        now = datetime.now(timezone.utc)
+        batch = {
+            "id": f"msgbatch_{uuid.uuid4().hex}",
+            "type": "message_batch",
+            "processing_status": "in_progress",
+            "request_counts": {
+                "processing": len(body["requests"]),
+                "succeeded": 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": now.isoformat(),
+            "expires_at": (now + timedelta(days=1)).isoformat(),
+            "ended_at": None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": None,
+        }
+        with self.stats.lock:
+            self.store[batch["id"]] = batch
+            self.store[f"{batch['id']}/requests"] = (time.time(), body["requests"])
+        self._send_json(200, batch)
+
+    def _finish_batch(self, batch_id: str) -> dict:
+        # Writes the results once the batch is due.
+        with self.stats.lock:
+            batch = self.store[batch_id]
+            pending = self.store.get(f"{batch_id}/requests")
+            if pending is None or time.time() - pending[0] < self.config.batch_seconds:
+                return batch
+            del self.store[f"{batch_id}/requests"]
+            results = []
+            for request in pending[1]:
+                if self._batch_failure():
+                    result = {
+                        "type": "errored",
+                        "error": {
+                            "type": "error",
+                            "error": {
+                                "type": "overloaded_error",
+                                "message": "stub overloaded",
+                            },
+                        },
+                    }
+                else:
+                    message = _anthropic_message(request["params"])
+                    message["content"] = [
+                        {"type": "text", "text": "".join(_tokens(self.config))}
+                    ]
+                    message["stop_reason"] = "end_turn"
+                    message["usage"]["output_tokens"] = self.config.output_tokens
+                    result = {"type": "succeeded", "message": message}
+                results.append({"custom_id": request["custom_id"], "result": result})
+            self.store[f"{batch_id}/results"] = "".join(
+                json.dumps(result) + "\n" for result in results
+            ).encode()
+            succeeded = sum(r["result"]["type"] == "succeeded" for r in results)
+            batch["request_counts"].update(
+                processing=0, succeeded=succeeded, errored=len(results) - succeeded
+            )
+            batch["processing_status"] = "ended"
+            batch["ended_at"] = datetime.now(timezone.utc).isoformat()
+            batch["results_url"] = (
+                f"http://{self.headers['Host']}/v1/messages/batches/{batch_id}/results"
+            )
+            return batch
+
+
+class GeminiStubHandler(_StubHandler):
+    _route = re.compile(
+        r"/v1beta/models/([^:]+):(generateContent|streamGenerateContent)"
+    )
+
+    def _chunk(self, text: str, body: dict, output_tokens: int) -> dict:
+        prompt_tokens = _prompt_tokens(body)
+        return {
+            "candidates": [
+                {
+                    "content": {"parts": [{"text": text}], "role": "model"},
+                    "finishReason": "STOP",
+                    "index": 0,
+                }
+            ],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": prompt_tokens + output_tokens,
+            },
+        }
+
+    def do_POST(self):
+        body = self._read_json()
+        match = self._route.search(self.path)
+        if match is None:
+            return self._send_json(404, {"error": {"message": self.path}})
+        if self._maybe_fail():
+            return
+        if match.group(2) == "generateContent":
+            return self._send_json(
+                200, self._chunk(self._generate(), body, self.config.output_tokens)
+            )
+
+        self._start_sse()
+        emitted = 0
+
+        def emit(token):
+            nonlocal emitted
+            emitted += 1
+            self._sse(self._chunk(token, body, emitted))
+
+        self._stream_tokens(emit)
+
+
+class LangfuseStubHandler(_StubHandler):
+    def _record(self, body: dict, **fields) -> dict:
+        now = datetime.now(timezone.utc).isoformat()
+        return {
+            **body,
+            "id": body.get("id") or uuid.uuid4().hex,
+            "projectId": "stub",
+            "createdAt": now,
+            "updatedAt": now,
+            **fields,
+        }
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path.startswith("/api/public/ingestion"):
+            events = body.get("batch", [])
+            self.stats.add(requests=1, ingested_events=len(events))
+            return self._send_json(
+                207,
+                {
+                    "successes": [
+                        {"id": event["id"], "status": 201} for event in events
+                    ],
+                    "errors": [],
+                },
+            )
+        self.stats.add(requests=1)
+        if self.path.startswith("/api/public/v2/datasets"):
+            return self._send_json(200, self._record(body))
+        if self.path.startswith("/api/public/dataset-items"):
+            return self._send_json(
+                200,
+                self._record(body, status="ACTIVE", datasetId=body["datasetName"]),
+            )
+        if self.path.startswith("/api/public/dataset-run-items"):
+            return self._send_json(
+                200,
+                self._record(
+                    body, datasetRunId=body["runName"], datasetRunName=body["runName"]
+                ),
+            )
+        self._send_json(404, {"message": self.path})
+
+
+class StubServer:
+    """Runs one stub handler on a background thread; use as a context manager."""
+
+    def __init__(
+        self,
+        handler: type[_StubHandler],
+        config: StubConfig | None = None,
+        port: int = 0,
+    ):
+        self.config = config or StubConfig()
+        self.stats = StubStats()
+        self.store: dict = {}
+        handler_class = type(
+            handler.__name__,
+            (handler,),
+            {"config": self.config, "stats": self.stats, "store": self.store},
+        )
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), handler_class)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def start_all(config: StubConfig | None = None, ports: dict | None = None) -> dict:
+    """
+    Starts every stub and returns {"openai": server, ...} plus "env", the
+    environment variables that point config.py and Langfuse at them.
+    """
+    ports = ports or {}
+    servers = {
+        "openai": StubServer(OpenAIStubHandler, config, ports.get("openai", 0)).start(),
+        "anthropic": StubServer(
+            AnthropicStubHandler, config, ports.get("anthropic", 0)
+        ).start(),
+        "gemini": StubServer(GeminiStubHandler, config, ports.get("gemini", 0)).start(),
+        "langfuse": StubServer(
+            LangfuseStubHandler, None, ports.get("langfuse", 0)
+        ).start(),
+    }
+    servers["env"] = {
+        "OPENAI_BASE_URL": f"{servers['openai'].url}/v1",
+        "OPENAI_API_KEY": "stub",
+        "ANTHROPIC_BASE_URL": servers["anthropic"].url,
+        "ANTHROPIC_API_KEY": "stub",
+        "GEMINI_BASE_URL": servers["gemini"].url,
+        "GEMINI_API_KEY": "stub",
+        "LANGFUSE_HOST": servers["langfuse"].url,
+        "LANGFUSE_PUBLIC_KEY": "pk-lf-stub",
+        "LANGFUSE_SECRET_KEY": "sk-lf-stub",
+    }
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the stub provider servers.")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-rate", type=float, default=200.0)
+    parser.add_argument("--output-tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--base-port", type=int, default=8701)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        args.latency, args.token_rate, args.output_tokens, args.error_rate
+    )
+    ports = {
+        name: args.base_port + offset
+        for offset, name in enumerate(["openai", "anthropic", "gemini", "langfuse"])
+    }
+    servers = start_all(config, ports)
+    print("Stub servers running. Export these before `streamlit run main.py`:")
+    for name, value in servers["env"].items():
+        print(f"export {name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
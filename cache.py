@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Cache configuration, overridable through the environment like the API keys.
+CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_SEMANTIC", "0") == "1"
+SEMANTIC_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+
+
+@dataclass
+class CacheEntry:
+    response: str
+    created_at: float
+    latency: float
+    scope: str
+
+
+@dataclass
+class CacheLookup:
+    """
+    Result of a cache lookup. Misses are returned too, so the caller can hand
+    the lookup back to `ResponseCache.store` without hashing or embedding the
+    prompt a second time.
+    """
+
+    key: str
+    scope: str
+    hit: bool = False
+    tier: str | None = None
+    similarity: float | None = None
+    response: str | None = None
+    latency_saved: float | None = None
+    embedding: np.ndarray | None = field(default=None, repr=False)
+
+    def as_metadata(self) -> dict:
+        # Shape recorded on the Langfuse observation to measure the hit rate.
+        metadata = {"hit": self.hit}
+        if self.hit:
+            metadata.update(
+                tier=self.tier,
+                similarity=self.similarity,
+                latency_saved=self.latency_saved,
+            )
+        return metadata
+
+
+class SemanticIndex:
+    """
+    Brute-force cosine-similarity index over unit-normalised embeddings.
+
+    Vectors are partitioned by scope (provider, model, instructions, kwargs) so
+    a near-duplicate prompt only ever matches answers produced under the same
+    settings.
+    """
+
+    def __init__(self):
+        self._keys: dict[str, list[str]] = {}
+        self._vectors: dict[str, np.ndarray] = {}
+
+    def add(self, scope: str, key: str, vector: np.ndarray):
+        vectors = self._vectors.get(scope)
+        row = vector[np.newaxis, :]
+        self._vectors[scope] = row if vectors is None else np.vstack([vectors, row])
+        self._keys.setdefault(scope, []).append(key)
+
+    def remove(self, scope: str, key: str):
+        keys = self._keys.get(scope)
+        if not keys or key not in keys:
+            return
+        index = keys.index(key)
+        del keys[index]
+        self._vectors[scope] = np.delete(self._vectors[scope], index, axis=0)
+        if not keys:
+            del self._keys[scope]
+            del self._vectors[scope]
+
+    def search(self, scope: str, vector: np.ndarray) -> tuple[str | None, float]:
+        vectors = self._vectors.get(scope)
+        if vectors is None:
+            return None, 0.0
+        similarities = vectors @ vector
+        best = int(np.argmax(similarities))
+        return self._keys[scope][best], float(similarities[best])
+
+
+class ResponseCache:
+    """
+    LRU/TTL cache of provider responses with an optional semantic tier.
+
+    The exact tier is keyed on (provider, model, instructions, prompt, kwargs).
+    When an `embed` callable is given, prompts that miss the exact tier are
+    matched against earlier prompts in the same scope and served if their
+    cosine similarity reaches `similarity_threshold`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        embed=None,
+        similarity_threshold: float = 0.95,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._index = SemanticIndex()
+        self._lock = threading.Lock()
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+
+    @staticmethod
+    def _scope(provider, model, instructions, params) -> str:
+        raw = json.dumps(
+            [provider, model, instructions, params], sort_keys=True, default=str
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _key(scope: str, prompt: str) -> str:
+        return hashlib.sha256(f"{scope}:{prompt}".encode("utf-8")).hexdigest()
+
+    def _get_live(self, key: str) -> CacheEntry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created_at > self.ttl_seconds:
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _evict(self, key: str):
+        entry = self._entries.pop(key)
+        self._index.remove(entry.scope, key)
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        vector = np.asarray(self.embed(prompt), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(
+        self,
+        provider: str,
+        model: str,
+        prompt: str,
+        instructions: str | None = None,
+        params: dict | None = None,
+    ) -> CacheLookup:
+        scope = self._scope(provider, model, instructions, params or {})
+        lookup = CacheLookup(key=self._key(scope, prompt), scope=scope)
+
+        with self._lock:
+            entry = self._get_live(lookup.key)
+            if entry is not None:
+                self.hits["exact"] += 1
+                lookup.hit, lookup.tier, lookup.similarity = True, "exact", 1.0
+                lookup.response, lookup.latency_saved = entry.response, entry.latency
+                return lookup
+
+        if self.embed is None:
+            with self._lock:
+                self.misses += 1
+            return lookup
+
+        # Embed outside the lock: it is usually a network call.
+        try:
+            lookup.embedding = self._embed(prompt)
+        except Exception:
+            with self._lock:
+                self.misses += 1
+            return lookup
+
+        with self._lock:
+            key, similarity = self._index.search(scope, lookup.embedding)
+            entry = self._get_live(key) if key is not None else None
+            if entry is not None and similarity >= self.similarity_threshold:
+                self.hits["semantic"] += 1
+                lookup.hit, lookup.tier, lookup.similarity = (
+                    True,
+                    "semantic",
+                    similarity,
+                )
+                lookup.response, lookup.latency_saved = entry.response, entry.latency
+            else:
+                self.misses += 1
+        return lookup
+
+    def store(self, lookup: CacheLookup, response: str, latency: float):
+        with self._lock:
+            if lookup.key in self._entries:
+                self._evict(lookup.key)
+            self._entries[lookup.key] = CacheEntry(
+                response=response,
+                created_at=time.monotonic(),
+                latency=latency,
+                scope=lookup.scope,
+            )
+            if lookup.embedding is not None:
+                self._index.add(lookup.scope, lookup.key, lookup.embedding)
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._evict(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = sum(self.hits.values())
+            total = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+
+class NullCache(ResponseCache):
+    # Drop-in replacement used when caching is switched off.
+
+    def lookup(self, provider, model, prompt, instructions=None, params=None):
+        return CacheLookup(key="", scope="")
+
+    def store(self, lookup, response, latency):
+        pass
+
+
+def openai_embedder(model: str = "text-embedding-3-small"):
+    # Embedding function for the semantic tier, backed by the shared OpenAI client.
+    from config import get_openai_client
+
+    def embed(text: str) -> list[float]:
+        response = get_openai_client().embeddings.create(model=model, input=text)
+        return response.data[0].embedding
+
+    return embed
+
+
+def build_response_cache() -> ResponseCache:
+    if not CACHE_ENABLED:
+        return NullCache()
+    return ResponseCache(
+        max_entries=CACHE_MAX_ENTRIES,
+        ttl_seconds=CACHE_TTL_SECONDS,
+        embed=openai_embedder() if SEMANTIC_CACHE_ENABLED else None,
+        similarity_threshold=SEMANTIC_THRESHOLD,
+    )
+
+
+response_cache = build_response_cache()
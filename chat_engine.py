@@ -0,0 +1,192 @@
+"""
+The chat page shared by the provider pages and the scoring page.
+
+A page is a ChatSpec: the session-state key of its conversation, its texts,
+the sidebar settings and the function that answers a prompt. Conversations
+live in the conversation store, and the session only keeps a handle on one
+(its id is in the URL, so a reload resumes it). The history is drawn inside
+an `st.fragment` and only its last CHAT_PAGE_SIZE messages at that (older
+ones are a click away and read from the store), so a rerun costs the same
+however long the conversation gets. Each feedback widget is a fragment of
+its own: a thumbs click reruns that widget, not the page.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+import streamlit as st
+
+from config import run_async
+from context_window import ContextWindow
+from conversation_store import Conversation, conversation_store
+from hedging import hedged_request
+from model_catalog import model_catalog
+from router import POLICIES, router
+from timing import request_timer
+from trace_policy import page_scope
+
+# Messages of the history drawn per page (kept even, so turns stay whole).
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "20")) // 2 * 2
+
+
+@dataclass(frozen=True)
+class ChatSpec:
+    key: str  # session-state prefix ({key}_conversation, ...) and URL parameter
+    name: str  # provider name for the input placeholder and errors
+    title: str
+    description: str
+    # (prompt, context, settings) -> answer text, or an iterator of chunks
+    # to stream.
+    respond: Callable[[str, ContextWindow, dict], str | Iterator[str]]
+    # Draws the page's settings (sidebar) and returns them.
+    settings: Callable[[], dict] = dict
+    # (trace_id, value) -> queued; answers get thumbs feedback when set.
+    feedback: Callable[[str, int], bool] | None = None
+    timer: str = ""  # request timer and page name, {key}_page by default
+
+
+def model_choice(provider: str, default: str) -> str:
+    # Sidebar picker: a routing policy or one of the provider's models.
+    models = [info.id for info in model_catalog.models(provider)]
+    if default not in models:
+        models.insert(0, default)
+    options = [*POLICIES, *models]
+    return st.sidebar.selectbox(
+        "Model",
+        options,
+        index=options.index(default),
+        key=f"{provider}_model",
+        format_func=lambda o: f"auto: {o.replace('_', ' ')}" if o in POLICIES else o,
+    )
+
+
+def provider_spec(
+    provider: str,
+    name: str,
+    title: str,
+    description: str,
+    default_model: str,
+    api: Callable,
+    api_stream: Callable,
+) -> ChatSpec:
+    # The provider pages: streaming, hedging and model routing.
+
+    def settings() -> dict:
+        stream = st.sidebar.toggle(
+            "Stream responses", value=True, key=f"{provider}_stream"
+        )
+        # Hedging races a backup request against a slow answer (hedging.py).
+        hedge = not stream and st.sidebar.toggle(
+            "Hedge slow requests", value=False, key=f"{provider}_hedge"
+        )
+        model = model_choice(provider, default=default_model)
+        return {"stream": stream, "hedge": hedge, "model": model}
+
+    def respond(prompt: str, context: ContextWindow, settings: dict):
+        # A fixed model, or one picked by the router for this request.
+        route = router.decide(
+            provider, settings["model"], context.input_tokens, default=default_model
+        )
+        call = {"model": route.model, "context": context, "route": route}
+        if settings["stream"]:
+            return api_stream(prompt, **call)
+        if settings["hedge"]:
+            return run_async(hedged_request(prompt, provider, **call)).result()
+        return api(prompt, **call)
+
+    return ChatSpec(provider, name, title, description, respond, settings)
+
+
+def chat_page(spec: ChatSpec):
+    st.title(spec.title)
+    st.write(spec.description)
+    settings = spec.settings()
+
+    if f"{spec.key}_conversation" not in st.session_state:
+        st.session_state[f"{spec.key}_conversation"] = Conversation.open(
+            conversation_store, spec.key, st.query_params.get(spec.key)
+        )
+    st.query_params[spec.key] = st.session_state[f"{spec.key}_conversation"].id
+
+    history(spec)
+    if prompt := st.chat_input(f"Say something to {spec.name}..."):
+        chat_turn(spec, prompt, settings)
+
+
+def chat_turn(spec: ChatSpec, prompt: str, settings: dict):
+    conversation: Conversation = st.session_state[f"{spec.key}_conversation"]
+    # One timer per chat turn: the API call joins it, and the phases
+    # (render excluding provider time) are attached to the trace.
+    page = spec.timer or f"{spec.key}_page"
+    with page_scope(page), request_timer(page) as timer:
+        # Earlier turns go to the model too, within the token budget.
+        context = conversation.window(prompt)
+        conversation.append("user", prompt)
+        with timer.phase("render"), st.chat_message("user"):
+            st.markdown(prompt)
+
+        with timer.phase("render"), st.chat_message("assistant"):
+            try:
+                answer = spec.respond(prompt, context, settings)
+                if isinstance(answer, str):
+                    st.markdown(answer)
+                else:
+                    answer = st.write_stream(answer)
+            except Exception as e:
+                st.error(f"{spec.name} request failed: {e}")
+                # Drop the unanswered prompt so the history stays in pairs.
+                conversation.pop()
+                return
+            # The traced API call left its trace id on the timer.
+            message = conversation.append("assistant", answer, timer.trace_id)
+            if spec.feedback and timer.trace_id:
+                feedback_widget(spec, message["position"])
+
+
+def _show_earlier(key: str):
+    st.session_state[f"{key}_shown"] += CHAT_PAGE_SIZE
+
+
+@st.fragment
+def history(spec: ChatSpec):
+    conversation: Conversation = st.session_state[f"{spec.key}_conversation"]
+    st.session_state.setdefault(f"{spec.key}_shown", CHAT_PAGE_SIZE)
+    start = max(0, len(conversation) - st.session_state[f"{spec.key}_shown"])
+    if start:
+        st.button(
+            f"Show earlier messages ({start} hidden)",
+            key=f"{spec.key}_show_earlier",
+            on_click=_show_earlier,
+            args=(spec.key,),
+        )
+    for message in conversation.messages(start, len(conversation)):
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            if spec.feedback and message["trace_id"]:
+                feedback_widget(spec, message["position"])
+
+
+def _save_feedback(spec: ChatSpec, position: int):
+    conversation: Conversation = st.session_state[f"{spec.key}_conversation"]
+    value = st.session_state[f"{spec.key}_feedback_{position}"]
+    conversation.set_feedback(position, value)
+    (message,) = conversation.messages(position, position + 1)
+    # Thumbs up is 1 (helpful), thumbs down 0.
+    spec.feedback(message["trace_id"], 1 if value == 1 else 0)
+
+
+@st.fragment
+def feedback_widget(spec: ChatSpec, position: int):
+    conversation: Conversation = st.session_state[f"{spec.key}_conversation"]
+    (message,) = conversation.messages(position, position + 1)
+    # The widget state follows the stored feedback.
+    key = f"{spec.key}_feedback_{position}"
+    st.session_state.setdefault(key, message["feedback"])
+    st.feedback(
+        "thumbs",
+        key=key,
+        disabled=message["feedback"] is not None,
+        on_change=_save_feedback,
+        args=(spec, position),
+    )
@@ -0,0 +1,140 @@
+import asyncio
+import queue
+import time
+
+import streamlit as st
+from langfuse.decorators import langfuse_context, observe
+
+from anthropic_page import anthropic_api_async
+from config import run_async
+from gemini_page import gemini_api_async
+from logs import get_logger
+from openai_page import openai_api_async
+from timing import RequestTimer, current_timer, request_timer, use_timer
+from trace_policy import page_scope
+
+log = get_logger(__name__)
+
+PROVIDERS = {
+    "Gemini": gemini_api_async,
+    "OpenAI": openai_api_async,
+    "Anthropic": anthropic_api_async,
+}
+
+
+@observe(capture_input=False)
+async def compare_providers(prompt: str, on_result) -> dict:
+    """
+    Sends one prompt to every provider concurrently.
+
+    Each provider call is its own generation nested under this trace, so the
+    wall time of a comparison is that of the slowest provider. `on_result` is
+    called with (provider, text, seconds, error) as soon as each answer lands;
+    a failing provider reports its error without holding up the others.
+    """
+    langfuse_context.update_current_observation(input=prompt)
+    # The page's timings go to this trace.
+    current_timer().trace_id = langfuse_context.get_current_trace_id()
+    started = time.perf_counter()
+
+    async def timed(name, api):
+        # Each provider call on a timer of its own, recorded under the API
+        # function's name: sharing the page's would mix up their phases.
+        with use_timer(RequestTimer(api.__name__)) as timer:
+            try:
+                text, error = await api(prompt), None
+            except Exception as e:
+                text, error = None, str(e)
+        timer.record()
+        return name, text, time.perf_counter() - started, error
+
+    tasks = [asyncio.create_task(timed(name, api)) for name, api in PROVIDERS.items()]
+    results = {}
+    for task in asyncio.as_completed(tasks):
+        name, text, elapsed, error = await task
+        results[name] = text
+        on_result(name, text, elapsed, error)
+    return results
+
+
+def show_answer(placeholder, text, elapsed, error):
+    with placeholder.container():
+        if error is None:
+            st.markdown(text)
+            st.caption(f"Answered in {elapsed:.2f}s")
+        else:
+            st.error(error)
+            st.caption(f"Failed after {elapsed:.2f}s")
+
+
+def compare_page():
+    st.title("Compare Gemini, OpenAI and Claude")
+    st.write(
+        "Sends one prompt to all three providers at once; every answer is traced "
+        "under a single Langfuse trace."
+    )
+
+    if "compare_results" not in st.session_state:
+        st.session_state.compare_results = None
+
+    prompt = st.chat_input("Ask all three models...")
+    if prompt:
+        st.session_state.compare_results = {"prompt": prompt, "answers": {}}
+
+    if st.session_state.compare_results is None:
+        return
+
+    with st.chat_message("user"):
+        st.markdown(st.session_state.compare_results["prompt"])
+
+    columns = dict(zip(PROVIDERS, st.columns(len(PROVIDERS))))
+    placeholders = {}
+    for name, column in columns.items():
+        column.subheader(name)
+        placeholders[name] = column.empty()
+
+    answers = st.session_state.compare_results["answers"]
+    if not prompt:
+        # Rerun without a new prompt: redraw the last comparison.
+        for name, answer in answers.items():
+            show_answer(placeholders[name], *answer)
+        return
+
+    with page_scope("compare_page"), request_timer("compare_page") as timer:
+        for placeholder in placeholders.values():
+            placeholder.info("Waiting for answer...")
+
+        # The fan-out runs on the shared client loop; answers come back
+        # through a queue so they are rendered from this script thread as
+        # they land. The wait for them is the page's provider time.
+        finished = queue.Queue()
+        started = time.perf_counter()
+        future = run_async(
+            compare_providers(prompt, lambda *result: finished.put(result))
+        )
+        pending = set(PROVIDERS)
+        while pending:
+            try:
+                with timer.phase("provider_call"):
+                    name, *answer = finished.get(timeout=0.1)
+            except queue.Empty:
+                # Every answer is queued before the comparison ends, so a
+                # done future with an empty queue means the rest never come.
+                if future.done() and finished.empty():
+                    break
+                continue
+            pending.discard(name)
+            answers[name] = answer
+            with timer.phase("render"):
+                show_answer(placeholders[name], *answer)
+
+        if error := future.exception():
+            log.warning("Comparison failed: %r", error)
+        for name in pending:
+            answers[name] = [
+                None,
+                time.perf_counter() - started,
+                f"Comparison failed: {type(error).__name__}: {error}",
+            ]
+            with timer.phase("render"):
+                show_answer(placeholders[name], *answers[name])
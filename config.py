@@ -1,8 +1,10 @@
+import asyncio
+import contextvars
+import functools
 import os
+import threading
+
 from dotenv import load_dotenv
-import google.genai as generativeai  # For Gemini API
-from openai import OpenAI           # For OpenAI API (new interface)
-import anthropic                   # For Anthropics' API (Claude)
 
 load_dotenv()
 
@@ -10,8 +12,106 @@ load_dotenv()
 GENERATIVE_AI_API_KEY = os.getenv("GEMINI_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+# The OpenAI and Anthropic SDKs read OPENAI_BASE_URL / ANTHROPIC_BASE_URL
+# themselves; Gemini needs it passed explicitly (e.g. for the stub servers).
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+
+# API clients are built on first use and shared by every Streamlit session, so
+# a page only pays for the SDK it actually talks to. The SDK imports live
+# inside the getters for the same reason. SDK retries are off: resilience.py
+# retries, rate-limits and circuit-breaks every provider call.
+
+
+def shared_resource(fn):
+    """
+    Builds the getter's resource once per process, like st.cache_resource,
+    but without needing a Streamlit script run: the getters are also called
+    from the event loop thread, the API server and the CLIs.
+    """
+    cached = functools.cache(fn)
+    lock = threading.Lock()
+
+    @functools.wraps(fn)
+    def getter():
+        with lock:
+            return cached()
+
+    getter.clear = cached.cache_clear
+    return getter
+
+
+@shared_resource
+def get_gemini_client():
+    import google.genai as generativeai  # For Gemini API
+
+    http_options = {"base_url": GEMINI_BASE_URL} if GEMINI_BASE_URL else None
+    return generativeai.Client(api_key=GENERATIVE_AI_API_KEY, http_options=http_options)
+
+
+@shared_resource
+def get_openai_client():
+    from openai import OpenAI  # For OpenAI API (new interface)
+
+    return OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+
+
+@shared_resource
+def get_anthropic_client():
+    import anthropic  # For Anthropics' API (Claude)
+
+    return anthropic.Client(api_key=ANTHROPIC_API_KEY, max_retries=0)
+
+
+@shared_resource
+def get_openai_async_client():
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+
+
+@shared_resource
+def get_anthropic_async_client():
+    import anthropic
+
+    return anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, max_retries=0)
+
+
+@shared_resource
+def get_langfuse():
+    from langfuse import Langfuse
+
+    from trace_policy import reduce_payload, trace_sampler
+
+    # Same sampling and payload policy as the @observe client.
+    return trace_sampler.install(Langfuse(mask=reduce_payload))
+
+
+@shared_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Long-lived event loop that owns the async clients.
+
+    Async connection pools are bound to the loop that opened them, so the
+    shared async clients are only ever used from this loop instead of a fresh
+    asyncio.run() per rerun.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="async-clients", daemon=True).start()
+    return loop
+
+
+def run_async(coro):
+    """
+    Schedules a coroutine on the shared loop and returns a concurrent Future.
+
+    The coroutine runs in a copy of the caller's context, so what the page
+    set up carries over to the loop thread: its request timer, which names
+    the page for trace sampling, collects the phase timings and takes the
+    trace id for the feedback widget.
+    """
+    context = contextvars.copy_context()
+
+    async def in_context():
+        return await asyncio.create_task(coro, context=context)
 
-# Set up API clients
-gemini_client = generativeai.Client(api_key=GENERATIVE_AI_API_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-anthropic_client = anthropic.Client(api_key=ANTHROPIC_API_KEY)
+    return asyncio.run_coroutine_threadsafe(in_context(), get_event_loop())
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import uuid
+from dataclasses import dataclass, field
+
+# Token budget for everything sent to the model except the fixed instructions:
+# the summary of older turns, the recent turns and the new prompt.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Most recent user/assistant pairs that are always sent verbatim.
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "2"))
+# Upper bound for the running summary of folded turns.
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "500"))
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text; close enough for budgeting
+    # and avoids a tokenizer dependency per provider.
+    return len(text) // 4 + 1
+
+
+def clip(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[: max_chars - 3].rstrip() + "..."
+
+
+def extractive_summary(
+    summary: str, folded: list[dict], max_tokens: int = CONTEXT_SUMMARY_TOKENS
+) -> str:
+    """
+    Default summarizer: appends the start of every folded message to the
+    running summary and drops the oldest lines once it outgrows its budget.
+    Deterministic and free, so folding never costs an extra model call.
+    """
+    lines = summary.splitlines() if summary else []
+    lines += [
+        f"{m['role']}: {clip(' '.join(m['content'].split()), 60)}" for m in folded
+    ]
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return clip("\n".join(lines), max_tokens)
+
+
+@dataclass
+class ContextWindow:
+    """
+    What is sent for one turn: the running summary, the recent turns and the
+    new prompt, with helpers that render it in each provider's format.
+
+    Everything before the new prompt is the stable prefix: it only changes
+    when turns are folded into the summary, so provider prompt caches stay
+    warm between folds.
+    """
+
+    prompt: str
+    summary: str = ""
+    messages: list[dict] = field(default_factory=list)
+    tokens: int = 0
+    folded: int = 0
+    truncated: int = 0
+    cache_key: str | None = None
+
+    @property
+    def is_multi_turn(self) -> bool:
+        return bool(self.summary or self.messages)
+
+    @property
+    def input_tokens(self) -> int:
+        return self.tokens or estimate_tokens(self.prompt)
+
+    @property
+    def fingerprint(self) -> str:
+        payload = json.dumps([self.summary, self.messages], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def cache_params(self, params: dict) -> dict:
+        # Response-cache scope: the same prompt after a different history is
+        # a different request.
+        if not self.is_multi_turn:
+            return params
+        return {**params, "context": self.fingerprint}
+
+    def as_metadata(self) -> dict:
+        return {
+            "tokens": self.tokens,
+            "messages": len(self.messages),
+            "folded": self.folded,
+            "truncated": self.truncated,
+            "summary_tokens": estimate_tokens(self.summary) if self.summary else 0,
+        }
+
+    def openai_input(self) -> str | list[dict]:
+        # Responses API: a bare string for single-turn requests, otherwise a
+        # message list. OpenAI caches long identical prefixes automatically.
+        if not self.is_multi_turn:
+            return self.prompt
+        items = []
+        if self.summary:
+            items.append(
+                {"role": "developer", "content": f"{SUMMARY_HEADER}\n{self.summary}"}
+            )
+        items += self.messages
+        items.append({"role": "user", "content": self.prompt})
+        return items
+
+    def openai_options(self) -> dict:
+        # Through extra_body: Responses.create in openai 1.66 has no
+        # prompt_cache_key parameter.
+        if not self.is_multi_turn:
+            return {}
+        return {"extra_body": {"prompt_cache_key": self.cache_key}}
+
+    def anthropic_options(self, instructions: str | None = None) -> dict:
+        # The summary joins the system prompt; the breakpoint on the last
+        # system block caches both.
+        blocks = []
+        if instructions:
+            blocks.append({"type": "text", "text": instructions})
+        if self.summary:
+            blocks.append({"type": "text", "text": f"{SUMMARY_HEADER}\n{self.summary}"})
+        if not blocks:
+            return {}
+        blocks[-1]["cache_control"] = {"type": "ephemeral"}
+        return {"system": blocks}
+
+    def anthropic_messages(self) -> list[dict]:
+        # Cache breakpoint on the last turn before the new prompt, so the
+        # next request reads the whole history from the prompt cache.
+        messages = [dict(m) for m in self.messages]
+        if messages:
+            messages[-1]["content"] = [
+                {
+                    "type": "text",
+                    "text": messages[-1]["content"],
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ]
+        messages.append({"role": "user", "content": self.prompt})
+        return messages
+
+    def gemini_contents(self) -> str | list[dict]:
+        if not self.is_multi_turn:
+            return self.prompt
+        contents = []
+        if self.summary:
+            contents.append(
+                {
+                    "role": "user",
+                    "parts": [{"text": f"{SUMMARY_HEADER}\n{self.summary}"}],
+                }
+            )
+        contents += [
+            {
+                "role": "model" if m["role"] == "assistant" else "user",
+                "parts": [{"text": m["content"]}],
+            }
+            for m in self.messages
+        ]
+        contents.append({"role": "user", "parts": [{"text": self.prompt}]})
+        return contents
+
+
+class ConversationContext:
+    """
+    Builds the context window of one conversation under a token budget.
+
+    Recent turns are sent verbatim. When the history outgrows the budget, the
+    oldest turns are folded into a running summary until the window is back
+    under 75% of the budget; the headroom means folding (and the cache misses
+    it causes) happens every few turns rather than on every turn. A single
+    message too long for what is left of the budget is truncated.
+
+    `summarizer(summary, folded_messages, max_tokens)` returns the new
+    summary; the default is extractive, an LLM call can be plugged in.
+    Keep one instance per conversation, e.g. in st.session_state.
+    """
+
+    def __init__(
+        self,
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        keep_turns: int = CONTEXT_KEEP_TURNS,
+        summary_tokens: int = CONTEXT_SUMMARY_TOKENS,
+        summarizer=extractive_summary,
+    ):
+        self.budget = budget
+        self.keep_turns = keep_turns
+        # Never let the summary take more than a quarter of the budget.
+        self.summary_tokens = min(summary_tokens, budget // 4)
+        self.summarizer = summarizer
+        self.summary = ""
+        self.summarized = 0  # history messages already folded into the summary
+        # Routes the conversation to the same OpenAI prompt-cache shard.
+        self.cache_key = f"conv-{uuid.uuid4().hex[:12]}"
+
+    def reset(self):
+        self.summary = ""
+        self.summarized = 0
+
+    def _tokens(self, messages: list[dict], prompt: str) -> int:
+        tokens = estimate_tokens(prompt)
+        if self.summary:
+            tokens += estimate_tokens(self.summary)
+        return tokens + sum(estimate_tokens(m["content"]) for m in messages)
+
+    def window(self, history: list[dict], prompt: str) -> ContextWindow:
+        """
+        `history` is the conversation so far, excluding `prompt`; messages are
+        dicts with at least "role" and "content".
+        """
+        if len(history) < self.summarized:
+            # The history was cleared or replaced.
+            self.reset()
+        messages = [
+            {"role": m["role"], "content": m["content"]}
+            for m in history[self.summarized :]
+        ]
+        keep = 2 * self.keep_turns
+        folded = 0
+        if self._tokens(messages, prompt) > self.budget:
+            target = int(self.budget * 0.75)
+            while len(messages) > keep and self._tokens(messages, prompt) > target:
+                # Fold whole user/assistant pairs so the roles keep alternating.
+                pair = messages[:2]
+                messages = messages[2:]
+                self.summary = self.summarizer(self.summary, pair, self.summary_tokens)
+                self.summarized += len(pair)
+                folded += len(pair)
+
+        truncated = 0
+        over = self._tokens(messages, prompt) - self.budget
+        for message in messages:
+            if over <= 0:
+                break
+            tokens = estimate_tokens(message["content"])
+            allowed = max(tokens - over, 32)
+            if allowed < tokens:
+                message["content"] = clip(message["content"], allowed)
+                over -= tokens - estimate_tokens(message["content"])
+                truncated += 1
+
+        return ContextWindow(
+            prompt=prompt,
+            summary=self.summary,
+            messages=messages,
+            tokens=self._tokens(messages, prompt),
+            folded=folded,
+            truncated=truncated,
+            cache_key=self.cache_key,
+        )
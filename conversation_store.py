@@ -0,0 +1,246 @@
+"""
+Chat conversations on SQLite.
+
+The store keeps every message with its trace id and feedback, plus each
+conversation's running summary. It is opened in WAL mode, so the sessions
+of a server read concurrently while one of them writes. A session only
+holds a Conversation handle: the id, the message count, the last
+CONVERSATION_WINDOW messages and the context summary. Older messages are
+read from the store when the history is paged back.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Sequence
+
+from context_window import ContextWindow, ConversationContext
+
+CONVERSATION_DB = os.getenv("CONVERSATION_DB", ".conversations.sqlite3")
+# Messages of a conversation kept in session state.
+CONVERSATION_WINDOW = int(os.getenv("CONVERSATION_WINDOW", "20"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    page TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    trace_id TEXT,
+    feedback INTEGER,
+    created REAL NOT NULL,
+    PRIMARY KEY (conversation_id, position)
+) WITHOUT ROWID;
+"""
+
+
+class ConversationStore:
+    """
+    Thin data access over one SQLite file. Each thread gets its own
+    connection (WAL allows readers alongside the writer); statements run in
+    autocommit, so no transaction outlives a call.
+    """
+
+    def __init__(self, path: str = CONVERSATION_DB):
+        self.path = path
+        self._local = threading.local()
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            # Durable at checkpoints rather than on every commit.
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._local.db = db
+        return db
+
+    def create(self, conversation_id: str, page: str):
+        now = time.time()
+        self._db().execute(
+            "INSERT OR IGNORE INTO conversations (id, page, created, updated)"
+            " VALUES (?, ?, ?, ?)",
+            (conversation_id, page, now, now),
+        )
+
+    def load(self, conversation_id: str) -> dict | None:
+        # The conversation row plus its message count, None if unknown.
+        row = (
+            self._db()
+            .execute(
+                "SELECT c.*, (SELECT COUNT(*) FROM messages m"
+                " WHERE m.conversation_id = c.id) AS count"
+                " FROM conversations c WHERE c.id = ?",
+                (conversation_id,),
+            )
+            .fetchone()
+        )
+        return dict(row) if row else None
+
+    def append(
+        self, conversation_id: str, role: str, content: str, trace_id: str | None
+    ) -> int:
+        # Returns the message's position; computed in the insert, so two
+        # tabs on one conversation cannot collide.
+        db = self._db()
+        now = time.time()
+        position = db.execute(
+            "INSERT INTO messages"
+            " (conversation_id, position, role, content, trace_id, created)"
+            " SELECT ?, COALESCE(MAX(position) + 1, 0), ?, ?, ?, ?"
+            " FROM messages WHERE conversation_id = ? RETURNING position",
+            (conversation_id, role, content, trace_id, now, conversation_id),
+        ).fetchone()[0]
+        db.execute(
+            "UPDATE conversations SET updated = ? WHERE id = ?", (now, conversation_id)
+        )
+        return position
+
+    def messages(self, conversation_id: str, start: int, stop: int) -> list[dict]:
+        rows = self._db().execute(
+            "SELECT position, role, content, trace_id, feedback FROM messages"
+            " WHERE conversation_id = ? AND position >= ? AND position < ?"
+            " ORDER BY position",
+            (conversation_id, start, stop),
+        )
+        return [dict(row) for row in rows]
+
+    def truncate(self, conversation_id: str, position: int):
+        # Deletes the messages from `position` on.
+        self._db().execute(
+            "DELETE FROM messages WHERE conversation_id = ? AND position >= ?",
+            (conversation_id, position),
+        )
+
+    def set_feedback(self, conversation_id: str, position: int, value: int | None):
+        self._db().execute(
+            "UPDATE messages SET feedback = ? WHERE conversation_id = ? AND position = ?",
+            (value, conversation_id, position),
+        )
+
+    def save_summary(self, conversation_id: str, summary: str, summarized: int):
+        self._db().execute(
+            "UPDATE conversations SET summary = ?, summarized = ? WHERE id = ?",
+            (summary, summarized, conversation_id),
+        )
+
+
+class _History(Sequence):
+    # The whole conversation as a list for ConversationContext.window, which
+    # only slices off the messages not yet in the summary.
+
+    def __init__(self, conversation: "Conversation"):
+        self.conversation = conversation
+
+    def __len__(self) -> int:
+        return len(self.conversation)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(len(self))
+            return self.conversation.messages(start, stop)
+        return self.conversation.messages(index, index + 1)[0]
+
+
+class Conversation:
+    """
+    A session's handle on one stored conversation. Messages are dicts with
+    "position", "role", "content", "trace_id" and "feedback".
+    """
+
+    def __init__(self, store: ConversationStore, page: str, row: dict | None):
+        self.store = store
+        self.page = page
+        # A new conversation is only written with its first message, so
+        # sessions that never chat leave nothing behind.
+        self.stored = row is not None
+        row = row or {
+            "id": uuid.uuid4().hex,
+            "count": 0,
+            "summary": "",
+            "summarized": 0,
+        }
+        self.id = row["id"]
+        self.count = row["count"]
+        self.context = ConversationContext()
+        self.context.summary = row["summary"]
+        self.context.summarized = row["summarized"]
+        # Same OpenAI prompt-cache shard across restarts.
+        self.context.cache_key = f"conv-{self.id[:12]}"
+        start = max(0, self.count - CONVERSATION_WINDOW)
+        self.recent = store.messages(self.id, start, self.count) if self.count else []
+
+    @classmethod
+    def open(cls, store: ConversationStore, page: str, conversation_id=None):
+        # Resumes `conversation_id`, or starts a new conversation.
+        row = store.load(conversation_id) if conversation_id else None
+        return cls(store, page, row)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def messages(self, start: int, stop: int) -> list[dict]:
+        cached = self.count - len(self.recent)
+        if start >= cached:
+            return self.recent[start - cached : stop - cached]
+        return self.store.messages(self.id, start, stop)
+
+    def append(self, role: str, content: str, trace_id: str | None = None) -> dict:
+        if not self.stored:
+            self.store.create(self.id, self.page)
+            self.stored = True
+        position = self.store.append(self.id, role, content, trace_id)
+        message = {
+            "position": position,
+            "role": role,
+            "content": content,
+            "trace_id": trace_id,
+            "feedback": None,
+        }
+        if position != self.count:
+            # Another session appended meanwhile: re-read the tail.
+            self.count = position + 1
+            start = max(0, self.count - CONVERSATION_WINDOW)
+            self.recent = self.store.messages(self.id, start, self.count)
+            return message
+        self.count += 1
+        self.recent = (self.recent + [message])[-CONVERSATION_WINDOW:]
+        return message
+
+    def pop(self):
+        # Drops the last message (an unanswered prompt).
+        self.count -= 1
+        self.store.truncate(self.id, self.count)
+        if self.recent and self.recent[-1]["position"] >= self.count:
+            self.recent.pop()
+
+    def set_feedback(self, position: int, value: int | None):
+        self.store.set_feedback(self.id, position, value)
+        for message in self.recent:
+            if message["position"] == position:
+                message["feedback"] = value
+
+    def window(self, prompt: str) -> ContextWindow:
+        # The context for a new prompt; folding into the summary is saved.
+        summarized = self.context.summarized
+        window = self.context.window(_History(self), prompt)
+        if self.context.summarized != summarized:
+            self.store.save_summary(
+                self.id, self.context.summary, self.context.summarized
+            )
+        return window
+
+
+conversation_store = ConversationStore()
@@ -0,0 +1,371 @@
+"""
+Offline evaluation of a JSONL dataset against the provider functions.
+
+Each line of the dataset is an object with an "input" (or "prompt") string
+and optionally an "id" and an "expected_output":
+
+    {"id": "q1", "input": "What is the capital of Italy?", "expected_output": "Rome"}
+
+Every row runs through the selected providers' async API functions on the
+shared event loop, with a global cap on in-flight requests and a separate cap
+per provider. Each result is appended to the output JSONL as soon as it
+finishes; that file doubles as the checkpoint, so rerunning the same command
+skips rows that already succeeded. Every row is traced in Langfuse and linked
+to a run of the Langfuse dataset (uploaded from the JSONL on the fly).
+
+    python eval_runner.py data/questions.jsonl --providers openai anthropic \\
+        --output results.jsonl --limit openai=16 anthropic=8 --prompt default_prompt
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from langfuse.api import CreateDatasetRunItemRequest
+from langfuse.decorators import langfuse_context, observe
+
+# Evaluations measure the models, not the response cache.
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "0")
+
+from config import get_langfuse, run_async  # noqa: E402
+from logs import configure_logging, get_logger  # noqa: E402
+from score_queue import score_queue  # noqa: E402
+
+log = get_logger(__name__)
+
+PROVIDERS = {
+    "gemini": ("gemini_page", "gemini_api_async"),
+    "openai": ("openai_page", "openai_api_async"),
+    "anthropic": ("anthropic_page", "anthropic_api_async"),
+}
+
+
+def load_provider(name: str):
+    import importlib
+
+    module_name, func_name = PROVIDERS[name]
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def system_prompt_kwargs(provider: str, text: str) -> dict:
+    # Each SDK takes the system prompt under a different name.
+    if provider == "openai":
+        return {"instructions": text}
+    if provider == "anthropic":
+        return {"system": text}
+    return {"config": {"system_instruction": text}}
+
+
+def read_rows(path: Path) -> list[dict]:
+    rows = []
+    with path.open(encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            row.setdefault("id", str(number))
+            row["id"] = str(row["id"])
+            row["input"] = row.get("input", row.get("prompt"))
+            rows.append(row)
+    return rows
+
+
+def read_checkpoint(path: Path) -> tuple[set, str | None]:
+    """
+    Returns the (row id, provider) pairs that already succeeded and the run
+    name recorded in the output file, if any.
+    """
+    done, run_name = set(), None
+    if not path.exists():
+        return done, run_name
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run.
+                continue
+            run_name = record.get("run_name", run_name)
+            if record.get("error") is None:
+                done.add((record["id"], record["provider"]))
+    return done, run_name
+
+
+def exact_match(output: str, expected) -> int | None:
+    if expected is None:
+        return None
+    return int(
+        " ".join(output.split()).lower() == " ".join(str(expected).split()).lower()
+    )
+
+
+class DatasetRun:
+    """
+    Links traces to a run of a Langfuse dataset. Rows are upserted as dataset
+    items (with ids derived from the row ids) the first time they are seen.
+    """
+
+    def __init__(self, dataset_name: str, run_name: str, run_metadata: dict):
+        self.dataset_name = dataset_name
+        self.run_name = run_name
+        self.run_metadata = run_metadata
+        self._items: dict[str, asyncio.Task] = {}
+        get_langfuse().create_dataset(name=dataset_name)
+
+    def item_id(self, row: dict) -> str:
+        return f"{self.dataset_name}:{row['id']}"
+
+    async def ensure_item(self, row: dict):
+        if row["id"] not in self._items:
+            self._items[row["id"]] = asyncio.create_task(
+                asyncio.to_thread(
+                    get_langfuse().create_dataset_item,
+                    dataset_name=self.dataset_name,
+                    input=row["input"],
+                    expected_output=row.get("expected_output"),
+                    id=self.item_id(row),
+                )
+            )
+        await self._items[row["id"]]
+
+    async def link(self, row: dict, trace_id: str, observation_id: str):
+        await self.ensure_item(row)
+        request = CreateDatasetRunItemRequest(
+            runName=self.run_name,
+            metadata=self.run_metadata,
+            datasetItemId=self.item_id(row),
+            traceId=trace_id,
+            observationId=observation_id,
+        )
+        await asyncio.to_thread(
+            get_langfuse().client.dataset_run_items.create, request=request
+        )
+
+
+@observe(name="eval_item")
+async def evaluate(row: dict, provider: str, func, run_name: str, kwargs: dict):
+    langfuse_context.update_current_trace(
+        name=f"eval:{run_name}",
+        input=row["input"],
+        tags=["eval", provider],
+        metadata={"run_name": run_name, "row_id": row["id"], "provider": provider},
+    )
+    # A failed row is still traced (and linked), with the error on the span.
+    try:
+        output, error = await func(row["input"], **kwargs), None
+        langfuse_context.update_current_observation(output=output)
+    except Exception as e:
+        output, error = None, f"{type(e).__name__}: {e}"
+        langfuse_context.update_current_observation(level="ERROR", status_message=error)
+    return (
+        output,
+        error,
+        langfuse_context.get_current_trace_id(),
+        langfuse_context.get_current_observation_id(),
+    )
+
+
+class EvalRunner:
+    def __init__(
+        self,
+        providers: list[str],
+        output: Path,
+        run_name: str,
+        dataset: DatasetRun | None,
+        workers: int,
+        limits: dict[str, int],
+        provider_kwargs: dict[str, dict],
+    ):
+        self.providers = {name: load_provider(name) for name in providers}
+        self.output = output
+        self.run_name = run_name
+        self.dataset = dataset
+        self.workers = workers
+        self.limits = limits
+        self.provider_kwargs = provider_kwargs
+        self.counts = {"ok": 0, "errors": 0}
+
+    def _write(self, f, record: dict):
+        # One line per result, flushed at once: the file is the checkpoint.
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+
+    async def _run_one(self, f, row: dict, provider: str, limit: asyncio.Semaphore):
+        async with limit:
+            started = time.perf_counter()
+            try:
+                output, error, trace_id, observation_id = await evaluate(
+                    row,
+                    provider,
+                    self.providers[provider],
+                    self.run_name,
+                    self.provider_kwargs.get(provider, {}),
+                )
+            except Exception as e:
+                output, error, trace_id, observation_id = None, str(e), None, None
+            latency = time.perf_counter() - started
+
+        score = None if error else exact_match(output, row.get("expected_output"))
+        if trace_id is not None:
+            if score is not None:
+                score_queue.submit(
+                    id=f"{trace_id}-exact_match",
+                    trace_id=trace_id,
+                    name="exact_match",
+                    value=score,
+                    data_type="BOOLEAN",
+                )
+            if self.dataset is not None:
+                try:
+                    await self.dataset.link(row, trace_id, observation_id)
+                except Exception as e:
+                    log.warning("Could not link row %s to the run: %s", row["id"], e)
+
+        self.counts["errors" if error else "ok"] += 1
+        self._write(
+            f,
+            {
+                "id": row["id"],
+                "provider": provider,
+                "run_name": self.run_name,
+                "input": row["input"],
+                "output": output,
+                "expected_output": row.get("expected_output"),
+                "exact_match": score,
+                "error": error,
+                "latency": round(latency, 3),
+                "trace_id": trace_id,
+            },
+        )
+
+    async def run(self, pending: list[tuple[dict, str]]):
+        limits = {
+            name: asyncio.Semaphore(self.limits.get(name, self.workers))
+            for name in self.providers
+        }
+        # Bounds the number of tasks alive at once, so memory stays flat
+        # however large the dataset is.
+        in_flight = asyncio.Semaphore(self.workers)
+        tasks = set()
+        started = time.perf_counter()
+        with self.output.open("a", encoding="utf-8") as f:
+            for index, (row, provider) in enumerate(pending, start=1):
+                await in_flight.acquire()
+                task = asyncio.create_task(
+                    self._run_one(f, row, provider, limits[provider])
+                )
+                task.add_done_callback(lambda _: in_flight.release())
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if index % 100 == 0:
+                    elapsed = time.perf_counter() - started
+                    log.info(
+                        "%d/%d submitted, %d ok, %d errors, %.1f items/s",
+                        index,
+                        len(pending),
+                        self.counts["ok"],
+                        self.counts["errors"],
+                        sum(self.counts.values()) / elapsed,
+                    )
+            await asyncio.gather(*tasks)
+
+
+def parse_limits(values: list[str]) -> dict[str, int]:
+    limits = {}
+    for value in values:
+        name, _, limit = value.partition("=")
+        if name not in PROVIDERS or not limit.isdigit():
+            raise argparse.ArgumentTypeError(f"expected provider=N, got {value!r}")
+        limits[name] = int(limit)
+    return limits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a JSONL dataset.")
+    parser.add_argument("dataset", type=Path)
+    parser.add_argument(
+        "--providers", nargs="+", choices=list(PROVIDERS), default=list(PROVIDERS)
+    )
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--run-name")
+    parser.add_argument("--dataset-name", help="Langfuse dataset (default: file stem)")
+    parser.add_argument("--no-dataset-run", action="store_true")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--limit", nargs="*", default=[], metavar="PROVIDER=N")
+    parser.add_argument("--prompt", help="Langfuse prompt used as system prompt")
+    parser.add_argument("--label", default="production")
+    args = parser.parse_args()
+
+    configure_logging()
+
+    output = args.output or args.dataset.with_suffix(".results.jsonl")
+    done, previous_run = read_checkpoint(output)
+    run_name = (
+        args.run_name
+        or previous_run
+        or f"{args.dataset.stem}-{datetime.now():%Y%m%d-%H%M%S}"
+    )
+    rows = read_rows(args.dataset)
+    pending = [
+        (row, provider)
+        for row in rows
+        for provider in args.providers
+        if (row["id"], provider) not in done
+    ]
+    log.info(
+        "Run %s: %d rows x %d providers, %d already done, %d to go",
+        run_name,
+        len(rows),
+        len(args.providers),
+        len(done),
+        len(pending),
+    )
+
+    run_metadata = {"providers": args.providers}
+    provider_kwargs = {}
+    if args.prompt:
+        prompt = get_langfuse().get_prompt(args.prompt, label=args.label)
+        run_metadata["prompt"] = {
+            "name": args.prompt,
+            "label": args.label,
+            "version": prompt.version,
+        }
+        provider_kwargs = {
+            name: system_prompt_kwargs(name, prompt.prompt) for name in args.providers
+        }
+
+    dataset = None
+    if not args.no_dataset_run:
+        dataset = DatasetRun(
+            args.dataset_name or args.dataset.stem, run_name, run_metadata
+        )
+    runner = EvalRunner(
+        args.providers,
+        output,
+        run_name,
+        dataset,
+        args.workers,
+        parse_limits(args.limit),
+        provider_kwargs,
+    )
+    started = time.perf_counter()
+    run_async(runner.run(pending)).result()
+    elapsed = time.perf_counter() - started
+
+    langfuse_context.flush()
+    score_queue.flush()
+    log.info(
+        "Done in %.1fs: %d ok, %d errors, results in %s",
+        elapsed,
+        runner.counts["ok"],
+        runner.counts["errors"],
+        output,
+    )
+
+
+if __name__ == "__main__":
+    main()
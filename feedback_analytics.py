@@ -0,0 +1,399 @@
+"""
+Helpfulness analytics per prompt version, model and user.
+
+The `helpfulness` scores and the scoring page's generations (prompt version,
+model, latency, cost) are bulk-fetched from the Langfuse public API and kept
+locally as NumPy columns, one `.npz` file per table in FEEDBACK_CACHE_DIR.
+A refresh only fetches what was ingested since the previous one (plus
+FEEDBACK_REFRESH_OVERLAP seconds for late events), merging on the row id,
+so after the first load a report over hundreds of thousands of scores is a
+few vectorised group-bys.
+
+    python feedback_analytics.py --by prompt model
+    python feedback_analytics.py --by user --no-refresh
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+from config import get_langfuse
+from logs import configure_logging, get_logger
+
+log = get_logger(__name__)
+
+FEEDBACK_CACHE_DIR = Path(os.getenv("FEEDBACK_CACHE_DIR", ".feedback_cache"))
+# Each refresh re-reads this many seconds before the last one, for events
+# Langfuse ingested late.
+FEEDBACK_REFRESH_OVERLAP = float(os.getenv("FEEDBACK_REFRESH_OVERLAP", "3600"))
+# Pages of the public API fetched concurrently (100 rows per page).
+FEEDBACK_FETCH_WORKERS = int(os.getenv("FEEDBACK_FETCH_WORKERS", "8"))
+FETCH_PAGE_SIZE = 100
+
+SCORE_NAME = "helpfulness"
+# The scoring page's generations (scoring_page.openai_api).
+GENERATION_NAME = "scoring_openai_api"
+DIMENSIONS = ("prompt", "model", "user")
+# Two-sided 95% normal quantile for the Wilson interval.
+Z = 1.96
+
+
+def _epoch(value: datetime | None) -> float:
+    return value.timestamp() if value else np.nan
+
+
+def _metadata_user(metadata) -> str:
+    # Set by provider_call.ProviderCall; older generations lack it.
+    return (metadata.get("user_id") or "") if isinstance(metadata, dict) else ""
+
+
+def score_columns(rows) -> dict:
+    return {
+        "id": np.array([row.id for row in rows], dtype=str),
+        "trace_id": np.array([row.trace_id for row in rows], dtype=str),
+        "user": np.array(
+            [(row.trace.user_id if row.trace else None) or "" for row in rows],
+            dtype=str,
+        ),
+        "value": np.array([row.value for row in rows], dtype=float),
+        "time": np.array([_epoch(row.timestamp) for row in rows], dtype=float),
+    }
+
+
+def generation_columns(rows) -> dict:
+    return {
+        "id": np.array([row.id for row in rows], dtype=str),
+        "trace_id": np.array([row.trace_id for row in rows], dtype=str),
+        "prompt": np.array(
+            [
+                f"{row.prompt_name} v{row.prompt_version}" if row.prompt_name else ""
+                for row in rows
+            ],
+            dtype=str,
+        ),
+        "model": np.array([row.model or "" for row in rows], dtype=str),
+        "user": np.array([_metadata_user(row.metadata) for row in rows], dtype=str),
+        # Seconds, None while the generation has not ended.
+        "latency": np.array(
+            [np.nan if row.latency is None else row.latency for row in rows],
+            dtype=float,
+        ),
+        "cost": np.array(
+            [
+                (
+                    np.nan
+                    if row.calculated_total_cost is None
+                    else row.calculated_total_cost
+                )
+                for row in rows
+            ],
+            dtype=float,
+        ),
+        "time": np.array([_epoch(row.start_time) for row in rows], dtype=float),
+    }
+
+
+def fetch_scores(page: int, start: datetime | None, end: datetime):
+    return get_langfuse().api.score.get(
+        name=SCORE_NAME,
+        page=page,
+        limit=FETCH_PAGE_SIZE,
+        from_timestamp=start,
+        to_timestamp=end,
+    )
+
+
+def fetch_generations(page: int, start: datetime | None, end: datetime):
+    return get_langfuse().api.observations.get_many(
+        type="GENERATION",
+        name=GENERATION_NAME,
+        page=page,
+        limit=FETCH_PAGE_SIZE,
+        from_start_time=start,
+        to_start_time=end,
+    )
+
+
+class Table:
+    """
+    One cached table: a dict of equal-length columns (always including "id")
+    and the upper time bound of the last refresh.
+    """
+
+    def __init__(self, name: str, fetch_page, to_columns):
+        self.path = FEEDBACK_CACHE_DIR / f"{name}.npz"
+        self.fetch_page = fetch_page
+        self.to_columns = to_columns
+        self.columns: dict | None = None
+        self.watermark: float | None = None
+
+    def __len__(self) -> int:
+        return len(self.columns["id"]) if self.columns else 0
+
+    def load(self):
+        if self.columns is None and self.path.exists():
+            with np.load(self.path) as data:
+                self.columns = {k: data[k] for k in data.files if k != "_watermark"}
+                self.watermark = float(data["_watermark"])
+        return self
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp.npz")
+        np.savez(tmp, _watermark=self.watermark, **self.columns)
+        tmp.replace(self.path)
+
+    def fetch(self, start: datetime | None, end: datetime) -> list:
+        # The end is fixed per refresh, so pages stay stable while fetching.
+        first = self.fetch_page(1, start, end)
+        rows = list(first.data)
+        pages = range(2, first.meta.total_pages + 1)
+        with ThreadPoolExecutor(FEEDBACK_FETCH_WORKERS) as pool:
+            for result in pool.map(lambda p: self.fetch_page(p, start, end), pages):
+                rows.extend(result.data)
+        return rows
+
+    def refresh(self) -> int:
+        # Fetches rows newer than the watermark; returns how many came in.
+        self.load()
+        end = datetime.now(timezone.utc)
+        start = None
+        if self.watermark is not None:
+            start = datetime.fromtimestamp(self.watermark, timezone.utc) - timedelta(
+                seconds=FEEDBACK_REFRESH_OVERLAP
+            )
+        rows = self.fetch(start, end)
+        if rows:
+            self.columns = _merge(self.columns, self.to_columns(rows))
+        elif self.columns is None:
+            self.columns = self.to_columns([])
+        self.watermark = end.timestamp()
+        self.save()
+        return len(rows)
+
+
+def _merge(old: dict | None, new: dict) -> dict:
+    # Concatenates and keeps the newest row per id (the fetched one).
+    if old is None:
+        columns = new
+    else:
+        columns = {k: np.concatenate([old[k], new[k]]) for k in new}
+    ids = columns["id"][::-1]
+    _, first = np.unique(ids, return_index=True)
+    keep = np.sort(len(ids) - 1 - first)
+    return {k: v[keep] for k, v in columns.items()}
+
+
+def join(scores: dict, generations: dict) -> dict:
+    """
+    Generations with their trace's score (NaN without feedback). The user is
+    the one in the generation's metadata, else the scored trace's.
+    """
+    order = np.argsort(scores["trace_id"], kind="stable")
+    trace_ids = scores["trace_id"][order]
+    pos = np.searchsorted(trace_ids, generations["trace_id"])
+    pos = np.minimum(pos, max(len(trace_ids) - 1, 0))
+    matched = (
+        trace_ids[pos] == generations["trace_id"]
+        if len(trace_ids)
+        else np.zeros(len(generations["id"]), dtype=bool)
+    )
+    score_rows = order[pos[matched]]
+    value = np.full(len(generations["id"]), np.nan)
+    value[matched] = scores["value"][score_rows]
+    # Wide enough for the users taken from the scores.
+    user = generations["user"].astype(
+        np.result_type(generations["user"], scores["user"])
+    )
+    fill = matched.copy()
+    fill[matched] = user[matched] == ""
+    user[fill] = scores["user"][order[pos[fill]]]
+    return {**generations, "user": user, "value": value}
+
+
+def _group_quantile(codes, values, groups: int, q: float) -> np.ndarray:
+    # Per-group quantile (linear interpolation), NaN for empty groups.
+    valid = ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    counts = np.bincount(codes, minlength=groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    result = np.full(groups, np.nan)
+    has = counts > 0
+    rank = (counts[has] - 1) * q
+    low = np.floor(rank).astype(int)
+    high = np.minimum(low + 1, counts[has] - 1)
+    weight = rank - low
+    result[has] = (1 - weight) * values[starts[has] + low] + weight * values[
+        starts[has] + high
+    ]
+    return result
+
+
+def wilson_interval(helpful, n) -> tuple[np.ndarray, np.ndarray]:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = helpful / n
+        denominator = 1 + Z**2 / n
+        centre = (p + Z**2 / (2 * n)) / denominator
+        half = Z * np.sqrt(p * (1 - p) / n + Z**2 / (4 * n**2)) / denominator
+    return centre - half, centre + half
+
+
+def aggregate(rows: dict, by: tuple[str, ...]) -> list[dict]:
+    """
+    Helpfulness rate with its 95% Wilson interval over the generations with
+    feedback, and latency and cost over all generations, per group of `by`.
+    Sorted by number of generations.
+    """
+    if not len(rows["id"]):
+        return []
+    keys = [np.unique(rows[dim], return_inverse=True) for dim in by]
+    # One integer code per combination of the dimensions.
+    combined = np.zeros(len(rows["id"]), dtype=np.int64)
+    for values, inverse in keys:
+        combined = combined * len(values) + inverse
+    group_keys, codes = np.unique(combined, return_inverse=True)
+    groups = len(group_keys)
+
+    scored = ~np.isnan(rows["value"])
+    generations = np.bincount(codes, minlength=groups)
+    n = np.bincount(codes[scored], minlength=groups)
+    helpful = np.bincount(codes[scored], rows["value"][scored], minlength=groups)
+    low, high = wilson_interval(helpful, n)
+    has_cost = ~np.isnan(rows["cost"])
+    cost = np.bincount(codes[has_cost], rows["cost"][has_cost], minlength=groups)
+    priced = np.bincount(codes[has_cost], minlength=groups)
+    p50 = _group_quantile(codes, rows["latency"], groups, 0.5)
+    p95 = _group_quantile(codes, rows["latency"], groups, 0.95)
+
+    # Decode each group's combined code back into its dimension values.
+    labels = {}
+    remainder = group_keys
+    for dim, (values, _) in reversed(list(zip(by, keys))):
+        labels[dim] = values[remainder % len(values)]
+        remainder = remainder // len(values)
+
+    report = []
+    for i in np.argsort(-generations, kind="stable"):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rate = helpful[i] / n[i] if n[i] else np.nan
+            mean_cost = cost[i] / priced[i] if priced[i] else np.nan
+        report.append(
+            {
+                **{dim: str(labels[dim][i]) or "(none)" for dim in by},
+                "generations": int(generations[i]),
+                "feedback": int(n[i]),
+                "helpful_rate": _round(rate, 3),
+                "ci_low": _round(low[i], 3),
+                "ci_high": _round(high[i], 3),
+                "latency_p50_s": _round(p50[i], 3),
+                "latency_p95_s": _round(p95[i], 3),
+                "cost_mean_usd": _round(mean_cost, 6),
+            }
+        )
+    return report
+
+
+def _round(value, digits: int) -> float | None:
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+class FeedbackAnalytics:
+    def __init__(self):
+        self.scores = Table("scores", fetch_scores, score_columns)
+        # Cached under the generation name, so renaming it starts afresh.
+        self.generations = Table(GENERATION_NAME, fetch_generations, generation_columns)
+
+    def refresh(self) -> dict:
+        # Both tables incrementally; returns the rows fetched per table.
+        started = time.perf_counter()
+        fetched = {
+            "scores": self.scores.refresh(),
+            "generations": self.generations.refresh(),
+        }
+        log.info(
+            "Feedback analytics refreshed in %.1fs: %s (cached %d scores, %d generations)",
+            time.perf_counter() - started,
+            fetched,
+            len(self.scores),
+            len(self.generations),
+        )
+        return fetched
+
+    def report(self, by=("prompt",)) -> list[dict]:
+        self.scores.load()
+        self.generations.load()
+        if not len(self.generations):
+            return []
+        return aggregate(join(self.scores.columns, self.generations.columns), by)
+
+
+feedback_analytics = FeedbackAnalytics()
+
+
+def feedback_analytics_page():
+    import streamlit as st
+
+    st.title("Feedback Analytics")
+    st.write(
+        "Helpfulness feedback and latency/cost of the scoring page, per prompt"
+        " version, model and user (95% Wilson intervals)."
+    )
+    by = st.multiselect("Group by", DIMENSIONS, default=["prompt"])
+    if st.button("Refresh from Langfuse"):
+        with st.spinner("Fetching new scores and generations..."):
+            try:
+                fetched = feedback_analytics.refresh()
+                st.caption(
+                    f"Fetched {fetched['scores']} scores and"
+                    f" {fetched['generations']} generations."
+                )
+            except Exception as e:
+                st.error(f"Refresh failed: {e}")
+    if not by:
+        return
+    rows = feedback_analytics.report(tuple(by))
+    if not rows:
+        st.caption("No cached data yet. Refresh to fetch it.")
+        return
+    st.dataframe(rows, hide_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Helpfulness feedback report.")
+    parser.add_argument("--by", nargs="+", choices=DIMENSIONS, default=["prompt"])
+    parser.add_argument(
+        "--no-refresh", action="store_true", help="report on the local cache only"
+    )
+    args = parser.parse_args()
+
+    configure_logging()
+
+    if not args.no_refresh:
+        feedback_analytics.refresh()
+    started = time.perf_counter()
+    rows = feedback_analytics.report(tuple(args.by))
+    elapsed = time.perf_counter() - started
+    if not rows:
+        print("No data.")
+        return
+    columns = list(rows[0])
+    widths = [max(len(c), *(len(str(row[c])) for row in rows)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+    log.info(
+        "Report over %d generations in %.2fs",
+        len(feedback_analytics.generations),
+        elapsed,
+    )
+
+
+if __name__ == "__main__":
+    main()
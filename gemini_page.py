@@ -1,60 +1,105 @@
-import random
-
 import langfuse  # Observability tool for language models
-import streamlit as st
-from langfuse.decorators import langfuse_context, observe
+from langfuse.decorators import observe
 
-from config import gemini_client
+from chat_engine import chat_page, provider_spec
+from config import get_gemini_client
+from context_window import ContextWindow
+from provider_call import ProviderCall
+from resilience import primed
+from router import RouteDecision
+from timing import timed
 
 
-@observe(as_type="generation")
-def gemini_api(prompt: str, model: str = "gemini-1.5-flash", **kwargs) -> str:
-    langfuse_context.update_current_observation(
-        input=prompt, model=model, metadata=kwargs
-    )
+@observe(as_type="generation", capture_input=False)
+@timed("gemini_api")
+def gemini_api(
+    prompt: str,
+    model: str = "gemini-1.5-flash",
+    context: ContextWindow | None = None,
+    route: RouteDecision | None = None,
+    **kwargs,
+) -> str:
+    call = ProviderCall("gemini", model, prompt, context, route, kwargs)
+    if call.lookup.hit:
+        return call.lookup.response
+    with call.reporting():
+        response = call.request(
+            lambda: get_gemini_client().models.generate_content(
+                model=model, contents=call.context.gemini_contents(), **kwargs
+            )
+        )
+        call.record(response.usage_metadata)
+        return call.finish(response.text)
 
-    user_ids = ["user-1", "user-2", "user-3"]
-    selected_user_id = random.choice(user_ids)
 
-    try:
-        response = gemini_client.models.generate_content(
-            model=model, contents=prompt, **kwargs
-        )
-        langfuse_context.update_current_trace(user_id=selected_user_id)
-        if hasattr(response, "usage"):
-            langfuse_context.update_current_observation(
-                usage_details={
-                    "input": getattr(response.usage, "input_tokens", None),
-                    "output": getattr(response.usage, "output_tokens", None),
-                }
+@observe(as_type="generation", capture_input=False)
+@timed("gemini_api_async")
+async def gemini_api_async(
+    prompt: str,
+    model: str = "gemini-1.5-flash",
+    context: ContextWindow | None = None,
+    route: RouteDecision | None = None,
+    **kwargs,
+) -> str:
+    # Async twin of gemini_api, used when several providers run concurrently.
+    call = ProviderCall("gemini", model, prompt, context, route, kwargs)
+    if call.lookup.hit:
+        return call.lookup.response
+    with call.reporting():
+        response = await call.request_async(
+            lambda: get_gemini_client().aio.models.generate_content(
+                model=model, contents=call.context.gemini_contents(), **kwargs
             )
-        return response.text
-    except Exception as e:
-        return f"An error occurred: {str(e)}"
+        )
+        call.record(response.usage_metadata)
+        return call.finish(response.text)
 
 
-def gemini_page():
-    st.title("Chat with Gemini via Google AI Studio")
-    st.write(
-        "This chatbot uses Google AI Studio's Gemini API and Langfuse for observability."
-    )
-
-    if "gemini_messages" not in st.session_state:
-        st.session_state.gemini_messages = []
+@observe(as_type="generation", capture_input=False)
+@timed("gemini_api_stream")
+def gemini_api_stream(
+    prompt: str,
+    model: str = "gemini-1.5-flash",
+    context: ContextWindow | None = None,
+    route: RouteDecision | None = None,
+    **kwargs,
+):
+    # Streaming variant of gemini_api: yields each chunk's text as it arrives.
+    call = ProviderCall("gemini", model, prompt, context, route, kwargs)
+    if call.lookup.hit:
+        yield call.lookup.response
+        return
+    with call.reporting():
+        # The request only goes out on the first next(); priming it keeps
+        # connection errors inside the retry loop.
+        stream = call.request(
+            lambda: primed(
+                get_gemini_client().models.generate_content_stream(
+                    model=model, contents=call.context.gemini_contents(), **kwargs
+                )
+            )
+        )
+        usage = None
+        for chunk in call.timed(stream):
+            if chunk.usage_metadata is not None:
+                usage = chunk.usage_metadata
+            if chunk.text:
+                yield call.chunk(chunk.text)
+        # Gemini reports cumulative usage; the last chunk carries the totals.
+        call.record(usage)
+        call.finish()
 
-    for message in st.session_state.gemini_messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
 
-    if prompt := st.chat_input("Say something to Gemini..."):
-        st.session_state.gemini_messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
+GEMINI_CHAT = provider_spec(
+    "gemini",
+    "Gemini",
+    title="Chat with Gemini via Google AI Studio",
+    description="This chatbot uses Google AI Studio's Gemini API and Langfuse for observability.",
+    default_model="gemini-1.5-flash",
+    api=gemini_api,
+    api_stream=gemini_api_stream,
+)
 
-        with st.chat_message("assistant"):
-            response_text = gemini_api(prompt)
-            st.markdown(response_text)
 
-        st.session_state.gemini_messages.append(
-            {"role": "assistant", "content": response_text}
-        )
+def gemini_page():
+    chat_page(GEMINI_CHAT)
@@ -0,0 +1,176 @@
+import asyncio
+import importlib
+import os
+
+from langfuse.decorators import langfuse_context, observe
+
+from context_window import ContextWindow
+from model_catalog import model_catalog
+from resilience import RATE_LIMIT_OUTPUT_TOKENS, TokenBucket, guards
+from router import RouteDecision, router
+from timing import RequestTimer, current_timer, use_timer
+
+# Delay before the backup request when the primary model has fewer than
+# HEDGE_MIN_SAMPLES recorded calls (so no meaningful p95 yet).
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "3"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.25"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Caps on the extra spend: a single backup request may cost at most
+# HEDGE_MAX_COST USD, and all backups together HEDGE_BUDGET_PER_HOUR USD.
+HEDGE_MAX_COST = float(os.getenv("HEDGE_MAX_COST", "0.01"))
+HEDGE_BUDGET_PER_HOUR = float(os.getenv("HEDGE_BUDGET_PER_HOUR", "1"))
+
+API_FUNCTIONS = {
+    "gemini": ("gemini_page", "gemini_api_async"),
+    "openai": ("openai_page", "openai_api_async"),
+    "anthropic": ("anthropic_page", "anthropic_api_async"),
+}
+
+# Holds up to an hour's budget, so the cap is per hour rather than per minute.
+hedge_budget = TokenBucket(HEDGE_BUDGET_PER_HOUR / 60, capacity=HEDGE_BUDGET_PER_HOUR)
+
+
+def api_function(provider: str):
+    module_name, func_name = API_FUNCTIONS[provider]
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def hedge_delay(provider: str, model: str) -> float:
+    # The primary's recent p95: only the slowest ~5% of requests get hedged.
+    health = guards[provider].health(model)
+    if health.samples < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return max(HEDGE_MIN_DELAY, health.latency.percentiles((95,))["p95"])
+
+
+def choose_backup(
+    provider: str, model: str, input_tokens: int
+) -> tuple[str, str] | None:
+    # Another provider first (independent failures), else another model.
+    others = [name for name in API_FUNCTIONS if name != provider]
+    exclude = (f"{provider}/{model}",)
+    for providers in (others, [provider]):
+        decision = router.route(
+            providers,
+            "within_budget",
+            input_tokens,
+            max_cost=HEDGE_MAX_COST,
+            exclude=exclude,
+        )
+        if decision.model is not None:
+            return decision.provider, decision.model
+    return None
+
+
+def reserve_budget(provider: str, model: str, input_tokens: int) -> float | None:
+    # Returns the estimated cost of the backup, or None when over a cap.
+    info = model_catalog.get(provider, model)
+    if info is None:
+        return None
+    cost = info.cost(input_tokens, RATE_LIMIT_OUTPUT_TOKENS)
+    if cost > HEDGE_MAX_COST or not hedge_budget.try_acquire(cost):
+        return None
+    return cost
+
+
+@observe(name="hedged_request", capture_input=False)
+async def hedged_request(
+    prompt: str,
+    provider: str,
+    model: str,
+    context: ContextWindow | None = None,
+    backup: tuple[str, str] | None = None,
+    delay: float | None = None,
+    route: RouteDecision | None = None,
+    **kwargs,
+) -> str:
+    """
+    Sends the prompt to `provider`/`model` and, if it has not answered
+    within its recent p95 (or has already failed), sends it again to a
+    backup model. The first answer wins and the other request is cancelled.
+
+    Both attempts are generations under this span, which records whether
+    and why the request was hedged and which attempt won. `kwargs` only go to
+    the primary, as they are provider specific. The backup defaults to the
+    router's pick on another provider within HEDGE_MAX_COST.
+    """
+    context = context or ContextWindow(prompt)
+    delay = hedge_delay(provider, model) if delay is None else delay
+    metadata = {
+        "primary": f"{provider}/{model}",
+        "hedge_delay": round(delay, 3),
+        "hedged": False,
+    }
+    langfuse_context.update_current_observation(input=prompt, metadata=metadata)
+
+    # Each attempt has a timer of its own; the winner's joins the request's.
+    request = current_timer()
+    timers: dict[asyncio.Task, RequestTimer] = {}
+
+    def attempt(provider: str, **call) -> asyncio.Task:
+        timer = RequestTimer(request.name)
+
+        async def run():
+            with use_timer(timer):
+                return await api_function(provider)(prompt, context=context, **call)
+
+        task = asyncio.create_task(run())
+        timers[task] = timer
+        return task
+
+    def won(task: asyncio.Task) -> str:
+        request.merge(timers[task])
+        return task.result()
+
+    primary = attempt(provider, model=model, route=route, **kwargs)
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done and primary.exception() is None:
+            langfuse_context.update_current_observation(
+                metadata={**metadata, "winner": "primary"}
+            )
+            return won(primary)
+
+        metadata["reason"] = "primary_failed" if done else "primary_slow"
+        backup = backup or choose_backup(provider, model, context.input_tokens)
+        cost = backup and reserve_budget(*backup, context.input_tokens)
+        if cost is None:
+            # No backup within the spend caps: the primary is all we have.
+            metadata["skipped"] = "no backup" if backup is None else "budget"
+            langfuse_context.update_current_observation(metadata=metadata)
+            await asyncio.wait({primary})
+            return won(primary)
+
+        metadata.update(
+            hedged=True, backup="/".join(backup), backup_cost=round(cost, 6)
+        )
+        secondary = attempt(backup[0], model=backup[1])
+        tasks.append(secondary)
+        attempts = (
+            {secondary: "backup"} if done else {primary: "primary", secondary: "backup"}
+        )
+        pending = set(attempts)
+        winner, error = None, primary.exception() if done else None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    break
+                error = error or task.exception()
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        metadata["winner"] = attempts[winner] if winner else None
+        langfuse_context.update_current_observation(metadata=metadata)
+        if winner is None:
+            raise error
+        return won(winner)
+    finally:
+        # Also when this request itself is cancelled.
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,50 @@
+import logging
+import os
+import random
+
+# LOG_LEVEL sets the threshold (DEBUG, INFO, ...). DEBUG records on the hot
+# path are further sampled with DEBUG_LOG_SAMPLE_RATE (0.0 - 1.0) so turning
+# on debug logging does not flood the console under load.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+DEBUG_LOG_SAMPLE_RATE = float(os.getenv("DEBUG_LOG_SAMPLE_RATE", "0.1"))
+
+
+class SamplingFilter(logging.Filter):
+    # Passes every INFO+ record and a random `rate` share of DEBUG records.
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        return random.random() < self.rate
+
+
+# Every app module logs below this parent, so one handler covers them all
+# without picking up the SDKs' own loggers.
+APP_LOGGER = "chat"
+
+_configured = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{APP_LOGGER}.{name}")
+
+
+def configure_logging():
+    # Idempotent: Streamlit re-executes the entry script on every rerun.
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    handler.addFilter(SamplingFilter(DEBUG_LOG_SAMPLE_RATE))
+    logger = logging.getLogger(APP_LOGGER)
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(handler)
+    logger.propagate = False
+    _configured = True
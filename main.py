@@ -1,34 +1,63 @@
+import importlib
+
 import streamlit as st
-from gemini_page import gemini_page
-from openai_page import openai_page
-from anthropic_page import anthropic_page
-from scoring_page import openai_chat_page
-from scoring_page_latest import openai_chat_page as openai_chat_page_latest
+
+import timing
+from logs import configure_logging
+
+# Sidebar label -> (module, page function). Page modules are imported only
+# when selected, so opening one chat never loads the other providers' SDKs.
+PAGES = {
+    "Gemini Chat": ("gemini_page", "gemini_page"),
+    "OpenAI Chat": ("openai_page", "openai_page"),
+    "Anthropic Chat": ("anthropic_page", "anthropic_page"),
+    "Compare Providers": ("compare_page", "compare_page"),
+    "OpenAI Chat with Score": ("scoring_page", "openai_chat_page"),
+    "OpenAI Chat with Score Latest": ("scoring_page", "openai_chat_page_latest"),
+    "Feedback Analytics": ("feedback_analytics", "feedback_analytics_page"),
+}
+
+
+def latency_panel():
+    # Rolling p50/p95/p99 per page/function phase, in milliseconds.
+    stats = timing.snapshot()
+    with st.sidebar.expander("Latency"):
+        if not stats:
+            st.caption("No requests yet.")
+            return
+        rows = [
+            {
+                "metric": name,
+                "count": values["count"],
+                **{q: round(values[q] * 1000, 1) for q in ("p50", "p95", "p99")},
+            }
+            for name, values in stats.items()
+        ]
+        st.dataframe(rows, hide_index=True)
+
+
+def usage_panel():
+    # Tokens, cost and throughput per user and per model since start-up.
+    from metering import meter  # Loaded with the first page anyway.
+
+    rows = meter.snapshot()
+    with st.sidebar.expander("Usage"):
+        if not rows:
+            st.caption("No requests yet.")
+            return
+        st.dataframe(rows, hide_index=True)
 
 
 def main():
+    configure_logging()
     st.sidebar.title("Chat Options")
-    chat_option = st.sidebar.radio(
-        "Choose a chat",
-        (
-            "Gemini Chat",
-            "OpenAI Chat",
-            "Anthropic Chat",
-            "OpenAI Chat with Score",
-            "OpenAI Chat with Score Latest",
-        ),
-    )
-
-    if chat_option == "Gemini Chat":
-        gemini_page()
-    elif chat_option == "OpenAI Chat":
-        openai_page()
-    elif chat_option == "Anthropic Chat":
-        anthropic_page()
-    elif chat_option == "OpenAI Chat with Score":
-        openai_chat_page()
-    elif chat_option == "OpenAI Chat with Score Latest":
-        openai_chat_page_latest()
+    chat_option = st.sidebar.radio("Choose a chat", tuple(PAGES))
+
+    module_name, page_name = PAGES[chat_option]
+    page = getattr(importlib.import_module(module_name), page_name)
+    page()
+    latency_panel()
+    usage_panel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,258 @@
+import base64
+import hashlib
+import io
+import mimetypes
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+# Encoded media kept in memory, keyed by content hash and processing options.
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(256 * 2**20)))
+# Longest image side sent to the providers (larger images are downscaled);
+# 1568px is the largest size Claude uses without resizing it again.
+MEDIA_IMAGE_MAX_SIDE = int(os.getenv("MEDIA_IMAGE_MAX_SIDE", "1568"))
+MEDIA_IMAGE_QUALITY = int(os.getenv("MEDIA_IMAGE_QUALITY", "85"))
+
+# A multiple of 3, so every chunk base64-encodes without padding and the
+# chunks can be concatenated.
+CHUNK_SIZE = 3 * 2**20
+
+
+def iter_base64(buffer, chunk_size: int = CHUNK_SIZE):
+    # Yields base64 bytes chunk by chunk; `buffer` is anything supporting the
+    # buffer protocol (bytes, mmap), sliced without copying.
+    view = memoryview(buffer)
+    for start in range(0, len(view), chunk_size):
+        yield base64.b64encode(view[start : start + chunk_size])
+
+
+def encode_base64(buffer) -> str:
+    """
+    Base64 of `buffer`, encoded chunk by chunk into one preallocated buffer,
+    so the peak is the output plus a chunk rather than input + output + the
+    intermediate copies of `b64encode(f.read())`.
+    """
+    out = bytearray(4 * ((len(buffer) + 2) // 3))
+    position = 0
+    for chunk in iter_base64(buffer):
+        out[position : position + len(chunk)] = chunk
+        position += len(chunk)
+    return out.decode("ascii")
+
+
+def _mapped(path: str):
+    # mmap keeps the file in the page cache instead of the Python heap.
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def encode_file(path: str) -> str:
+    # Drop-in for the notebooks' encode_file(), without reading the file into memory.
+    mapped = _mapped(path)
+    try:
+        return encode_base64(mapped)
+    finally:
+        if isinstance(mapped, mmap.mmap):
+            mapped.close()
+
+
+@dataclass
+class MediaInput:
+    """
+    One attachment, base64-encoded once and shared by every request (and
+    every session) that sends the same content.
+    """
+
+    digest: str
+    mime_type: str
+    data: str  # base64
+    size: int  # bytes after processing
+    original_size: int
+
+    @property
+    def data_uri(self) -> str:
+        return f"data:{self.mime_type};base64,{self.data}"
+
+    @property
+    def audio_format(self) -> str:
+        # audio/x-wav -> wav, audio/mpeg -> mp3
+        subtype = self.mime_type.partition("/")[2].removeprefix("x-")
+        return {"mpeg": "mp3", "wave": "wav"}.get(subtype, subtype)
+
+    def openai_chat_part(self) -> dict:
+        # Chat Completions content part.
+        if self.mime_type.startswith("audio/"):
+            return {
+                "type": "input_audio",
+                "input_audio": {"data": self.data, "format": self.audio_format},
+            }
+        return {"type": "image_url", "image_url": {"url": self.data_uri}}
+
+    def openai_input_part(self) -> dict:
+        # Responses API content part.
+        if self.mime_type == "application/pdf":
+            return {
+                "type": "input_file",
+                "filename": f"{self.digest[:12]}.pdf",
+                "file_data": self.data_uri,
+            }
+        return {"type": "input_image", "image_url": self.data_uri}
+
+    def anthropic_block(self) -> dict:
+        kind = "document" if self.mime_type == "application/pdf" else "image"
+        return {
+            "type": kind,
+            "source": {
+                "type": "base64",
+                "media_type": self.mime_type,
+                "data": self.data,
+            },
+        }
+
+    def langfuse_media(self):
+        # Langfuse uploads this once per content hash and stores a reference
+        # in the trace instead of the inlined base64.
+        from langfuse.media import LangfuseMedia
+
+        return LangfuseMedia(base64_data_uri=self.data_uri)
+
+
+def prepare_image(
+    source, max_side: int, quality: int = MEDIA_IMAGE_QUALITY
+) -> tuple[bytes, str] | None:
+    """
+    Downscales an image so its longest side is at most `max_side` and
+    recompresses it. Returns (bytes, mime type), or None when the original is
+    already small enough or the result would not be smaller.
+    """
+    from PIL import Image  # Only needed when images are resized.
+
+    with Image.open(source) as image:
+        if max(image.size) <= max_side:
+            return None
+        if image.format == "JPEG":
+            # Lets the decoder skip detail we are about to throw away.
+            image.draft("RGB", (max_side, max_side))
+        image.thumbnail((max_side, max_side))
+        output = io.BytesIO()
+        if image.mode in ("RGBA", "LA", "P"):
+            image.save(output, format="PNG", optimize=True)
+            mime_type = "image/png"
+        else:
+            image.convert("RGB").save(
+                output, format="JPEG", quality=quality, optimize=True
+            )
+            mime_type = "image/jpeg"
+    return output.getvalue(), mime_type
+
+
+class MediaCache:
+    """
+    LRU of encoded media bounded by total encoded size. Files are hashed
+    through mmap; the (path, size, mtime) -> hash memo skips rehashing files
+    that have not changed.
+    """
+
+    def __init__(self, max_bytes: int = MEDIA_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, MediaInput] = OrderedDict()
+        self._digests: dict[tuple, str] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, path: str, stat: os.stat_result) -> str:
+        key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key in self._digests:
+                return self._digests[key]
+        mapped = _mapped(path)
+        try:
+            digest = hashlib.sha256(mapped).hexdigest()
+        finally:
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        with self._lock:
+            self._digests[key] = digest
+        return digest
+
+    def _get(self, key: tuple) -> MediaInput | None:
+        with self._lock:
+            media = self._entries.get(key)
+            if media is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return media
+
+    def _put(self, key: tuple, media: MediaInput):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = media
+            self._bytes += len(media.data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.data)
+
+    def load(
+        self,
+        path: str,
+        mime_type: str | None = None,
+        max_side: int | None = MEDIA_IMAGE_MAX_SIDE,
+        quality: int = MEDIA_IMAGE_QUALITY,
+    ) -> MediaInput:
+        """
+        Returns the encoded media for `path`. Images are downscaled to
+        `max_side` (None sends them untouched).
+        """
+        mime_type = mime_type or mimetypes.guess_type(path)[0]
+        if mime_type is None:
+            raise ValueError(f"Cannot tell the media type of {path}")
+        stat = os.stat(path)
+        digest = self._digest(path, stat)
+        is_image = mime_type.startswith("image/") and max_side is not None
+        key = (digest, max_side, quality) if is_image else (digest,)
+        if (media := self._get(key)) is not None:
+            return media
+
+        prepared = prepare_image(path, max_side, quality) if is_image else None
+        if prepared is not None and len(prepared[0]) < stat.st_size:
+            content, mime_type = prepared
+            log.debug(
+                "media: %s resized %d -> %d bytes", path, stat.st_size, len(content)
+            )
+            data = encode_base64(content)
+            size = len(content)
+        else:
+            data = encode_file(path)
+            size = stat.st_size
+        media = MediaInput(digest, mime_type, data, size, stat.st_size)
+        self._put(key, media)
+        return media
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+media_cache = MediaCache()
+
+
+def load_media(path: str, **options) -> MediaInput:
+    return media_cache.load(path, **options)
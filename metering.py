@@ -0,0 +1,282 @@
+import dataclasses
+import functools
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from langfuse.decorators import langfuse_context
+
+from context_window import ContextWindow, estimate_tokens
+from logs import get_logger
+from model_catalog import model_catalog
+from resilience import RATE_LIMIT_OUTPUT_TOKENS, guards
+
+log = get_logger(__name__)
+
+# Hard cap on the prompt tokens of a single request, on top of the model's
+# context window.
+METER_MAX_INPUT_TOKENS = int(os.getenv("METER_MAX_INPUT_TOKENS", "100000"))
+# Window of the tokens-per-minute throughput counters, in seconds.
+METER_THROUGHPUT_WINDOW = 60.0
+
+# Price of cached input tokens relative to the input price: reads are
+# discounted, Anthropic charges extra for writing the cache.
+CACHE_READ_PRICE = {"openai": 0.5, "anthropic": 0.1, "gemini": 0.25}
+CACHE_WRITE_PRICE = {"anthropic": 1.25}
+# tiktoken counts OpenAI tokens exactly; Claude's tokenizer yields somewhat
+# more tokens for the same text, Gemini's about as many.
+TOKENIZER_FACTOR = {"openai": 1.0, "anthropic": 1.15, "gemini": 1.0}
+# Framing tokens per message (role, separators).
+MESSAGE_OVERHEAD = 4
+
+
+class RequestTooLarge(ValueError):
+    pass
+
+
+@dataclass
+class Usage:
+    """
+    Token usage of one response. `input` excludes the cached input tokens
+    (`cache_read`, `cache_write`), so the parts add up to `total`.
+    `reasoning` is the share of `output` spent on thinking.
+    """
+
+    input: int = 0
+    output: int = 0
+    cache_read: int = 0
+    cache_write: int = 0
+    reasoning: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.input + self.cache_read + self.cache_write + self.output
+
+    def usage_details(self) -> dict:
+        # Explicit total: reasoning is already part of output.
+        details = {
+            "input": self.input,
+            "output": self.output,
+            "input_cache_read": self.cache_read,
+            "input_cache_write": self.cache_write,
+            "output_reasoning": self.reasoning,
+        }
+        return {k: v for k, v in details.items() if v} | {"total": self.total}
+
+
+def usage_from_response(provider: str, usage) -> Usage:
+    """
+    Usage from the provider's usage object: `response.usage` for OpenAI's
+    Responses API and Anthropic, `response.usage_metadata` for Gemini.
+    """
+    if provider == "openai":
+        input_details = getattr(usage, "input_tokens_details", None)
+        output_details = getattr(usage, "output_tokens_details", None)
+        cached = getattr(input_details, "cached_tokens", None) or 0
+        return Usage(
+            input=(usage.input_tokens or 0) - cached,
+            output=usage.output_tokens or 0,
+            cache_read=cached,
+            reasoning=getattr(output_details, "reasoning_tokens", None) or 0,
+        )
+    if provider == "anthropic":
+        return Usage(
+            input=usage.input_tokens or 0,
+            output=usage.output_tokens or 0,
+            cache_read=getattr(usage, "cache_read_input_tokens", None) or 0,
+            cache_write=getattr(usage, "cache_creation_input_tokens", None) or 0,
+        )
+    # Gemini bills thinking tokens as output but reports them separately.
+    cached = usage.cached_content_token_count or 0
+    thoughts = getattr(usage, "thoughts_token_count", None) or 0
+    return Usage(
+        input=(usage.prompt_token_count or 0) - cached,
+        output=(usage.candidates_token_count or 0) + thoughts,
+        cache_read=cached,
+        reasoning=thoughts,
+    )
+
+
+def cost_details(provider: str, model: str, usage: Usage) -> dict | None:
+    # USD, in the same keys as the usage details; None for unpriced models.
+    info = model_catalog.get(provider, model)
+    if info is None:
+        return None
+    per_input = info.input_price / 1_000_000
+    details = {
+        "input": usage.input * per_input,
+        "output": usage.output * info.output_price / 1_000_000,
+        "input_cache_read": usage.cache_read
+        * per_input
+        * CACHE_READ_PRICE.get(provider, 1.0),
+        "input_cache_write": usage.cache_write
+        * per_input
+        * CACHE_WRITE_PRICE.get(provider, 1.0),
+    }
+    details = {k: round(v, 8) for k, v in details.items() if v}
+    return details | {"total": round(sum(details.values()), 8)}
+
+
+@functools.cache
+def _encoding(model: str):
+    # tiktoken is optional (it comes with langchain-openai); without it the
+    # character heuristic from context_window is used.
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # The encodings are downloaded on first use, which fails offline.
+        # Cached like a success, so this is not retried on every count.
+        log.warning("tiktoken unavailable for %s, estimating tokens: %s", model, e)
+        return None
+
+
+def count_tokens(text: str, provider: str, model: str) -> int:
+    encoding = _encoding(model if provider == "openai" else "gpt-4o")
+    if encoding is None:
+        return estimate_tokens(text)
+    tokens = len(encoding.encode(text, disallowed_special=()))
+    return int(tokens * TOKENIZER_FACTOR.get(provider, 1.0)) + 1
+
+
+def estimate_input_tokens(
+    provider: str, model: str, context: ContextWindow, instructions: str = ""
+) -> int:
+    texts = [instructions, context.summary, context.prompt]
+    texts += [m["content"] for m in context.messages]
+    return sum(count_tokens(t, provider, model) for t in texts if t) + (
+        MESSAGE_OVERHEAD * (len(context.messages) + 2)
+    )
+
+
+@dataclass
+class _Counter:
+    requests: int = 0
+    input: int = 0
+    output: int = 0
+    cache_read: int = 0
+    reasoning: int = 0
+    cost: float = 0.0
+    # (timestamp, tokens) of the requests in the throughput window.
+    recent: deque = field(default_factory=deque)
+
+    def add(self, usage: Usage, cost: float, now: float):
+        self.requests += 1
+        self.input += usage.input + usage.cache_write
+        self.output += usage.output
+        self.cache_read += usage.cache_read
+        self.reasoning += usage.reasoning
+        self.cost += cost
+        self.recent.append((now, usage.total))
+
+    def tokens_per_minute(self, now: float) -> float:
+        while self.recent and now - self.recent[0][0] > METER_THROUGHPUT_WINDOW:
+            self.recent.popleft()
+        return sum(tokens for _, tokens in self.recent) * 60 / METER_THROUGHPUT_WINDOW
+
+
+class Meter:
+    """
+    Token and cost metering for every provider call.
+
+    `admit` estimates the prompt tokens locally before the call and drops
+    the oldest history (or rejects the request) when it would not fit the
+    model. `record` turns the provider's usage into Usage, reports it as the
+    generation's usage_details/cost_details, settles the rate limiter's
+    token estimate against the real count and adds it to the per-user and
+    per-model counters.
+    """
+
+    def __init__(self):
+        self._counters: dict[tuple[str, str], _Counter] = {}
+        self._lock = threading.Lock()
+
+    def admit(
+        self,
+        provider: str,
+        model: str,
+        context: ContextWindow,
+        instructions: str = "",
+        max_output: int = RATE_LIMIT_OUTPUT_TOKENS,
+    ) -> ContextWindow:
+        info = model_catalog.get(provider, model)
+        limit = METER_MAX_INPUT_TOKENS
+        if info is not None:
+            limit = min(limit, info.context_window - max_output)
+        tokens = estimate_input_tokens(provider, model, context, instructions)
+        dropped = 0
+        while tokens > limit and (context.summary or context.messages):
+            # The oldest context goes first: the summary, then whole turns.
+            if context.summary:
+                context = dataclasses.replace(context, summary="")
+            else:
+                context = dataclasses.replace(context, messages=context.messages[2:])
+                dropped += 2
+            tokens = estimate_input_tokens(provider, model, context, instructions)
+        if tokens > limit:
+            raise RequestTooLarge(
+                f"prompt is ~{tokens} tokens, {provider}/{model} takes at most {limit}"
+            )
+        if dropped:
+            log.info("%s/%s: dropped %d messages to fit", provider, model, dropped)
+        return dataclasses.replace(
+            context, tokens=tokens, truncated=context.truncated + dropped
+        )
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        raw_usage,
+        user_id: str | None = None,
+        context: ContextWindow | None = None,
+    ) -> Usage:
+        if raw_usage is None:
+            return Usage()
+        usage = usage_from_response(provider, raw_usage)
+        costs = cost_details(provider, model, usage)
+        langfuse_context.update_current_observation(
+            usage_details=usage.usage_details(), cost_details=costs
+        )
+        if context is not None:
+            # The limiter charged the estimate; correct it with the real count.
+            estimated = context.input_tokens + RATE_LIMIT_OUTPUT_TOKENS
+            guards[provider].limiter(model).adjust(usage.total - estimated)
+
+        now = time.monotonic()
+        cost = costs["total"] if costs else 0.0
+        with self._lock:
+            for key in ((f"user:{user_id}", ""), ("", f"{provider}/{model}")):
+                if key not in self._counters:
+                    self._counters[key] = _Counter()
+                self._counters[key].add(usage, cost, now)
+        return usage
+
+    def snapshot(self) -> list[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "user": user.removeprefix("user:") or None,
+                    "model": model or None,
+                    "requests": c.requests,
+                    "input": c.input,
+                    "output": c.output,
+                    "cache_read": c.cache_read,
+                    "reasoning": c.reasoning,
+                    "cost_usd": round(c.cost, 6),
+                    "tokens_per_min": round(c.tokens_per_minute(now)),
+                }
+                for (user, model), c in sorted(self._counters.items())
+            ]
+
+
+meter = Meter()
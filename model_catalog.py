@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+# Where the providers' model listings are cached, and for how long.
+MODEL_CATALOG_PATH = Path(os.getenv("MODEL_CATALOG_PATH", ".model_catalog.json"))
+MODEL_CATALOG_TTL = float(os.getenv("MODEL_CATALOG_TTL", str(24 * 3600)))
+# After a failed listing, don't ask the provider again for this long.
+MODEL_CATALOG_RETRY = 300.0
+# Optional JSON file with extra or corrected entries, same shape as KNOWN_MODELS.
+MODEL_CATALOG_OVERRIDES = os.getenv("MODEL_CATALOG_OVERRIDES")
+
+
+@dataclass(frozen=True)
+class ModelInfo:
+    provider: str
+    id: str
+    context_window: int
+    # USD per million tokens.
+    input_price: float
+    output_price: float
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (
+            input_tokens * self.input_price + output_tokens * self.output_price
+        ) / 1_000_000
+
+
+# Chat models the pages can use, with list prices. The providers' listing
+# APIs say which models exist but not what they cost or how much they take.
+KNOWN_MODELS = {
+    "openai": {
+        "gpt-4.5-preview": (128_000, 75.0, 150.0),
+        "gpt-4o": (128_000, 2.5, 10.0),
+        "gpt-4o-mini": (128_000, 0.15, 0.6),
+        "o3-mini": (200_000, 1.1, 4.4),
+        "o1": (200_000, 15.0, 60.0),
+        "gpt-4-turbo": (128_000, 10.0, 30.0),
+        "gpt-3.5-turbo": (16_385, 0.5, 1.5),
+    },
+    "anthropic": {
+        "claude-3-7-sonnet-latest": (200_000, 3.0, 15.0),
+        "claude-3-5-sonnet-latest": (200_000, 3.0, 15.0),
+        "claude-3-5-haiku-latest": (200_000, 0.8, 4.0),
+        "claude-3-opus-latest": (200_000, 15.0, 75.0),
+    },
+    "gemini": {
+        "gemini-2.0-flash": (1_048_576, 0.1, 0.4),
+        "gemini-2.0-flash-lite": (1_048_576, 0.075, 0.3),
+        "gemini-1.5-flash": (1_048_576, 0.075, 0.3),
+        "gemini-1.5-pro": (2_097_152, 1.25, 5.0),
+    },
+}
+
+
+def list_provider_models(provider: str) -> list[str]:
+    # Model ids the API key can use, straight from the provider.
+    from config import get_anthropic_client, get_gemini_client, get_openai_client
+
+    if provider == "openai":
+        return [model.id for model in get_openai_client().models.list()]
+    if provider == "anthropic":
+        return [model.id for model in get_anthropic_client().models.list(limit=1000)]
+    return [
+        model.name.removeprefix("models/")
+        for model in get_gemini_client().models.list()
+    ]
+
+
+class ModelCatalog:
+    """
+    Model metadata (context window, prices) for the models each provider
+    actually serves.
+
+    The providers' model listings are cached in `path` for `ttl` seconds, so
+    they are fetched at most once a day instead of being dumped by hand. They
+    are fetched in the background; until a provider's first listing arrives,
+    or when it cannot be fetched, every known model of that provider is
+    assumed available. Aliases ("-latest") are kept when the provider lists a
+    dated snapshot of them.
+    """
+
+    def __init__(
+        self,
+        path: Path = MODEL_CATALOG_PATH,
+        ttl: float = MODEL_CATALOG_TTL,
+        lister=list_provider_models,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self._lister = lister
+        self._known = {
+            provider: {
+                model_id: ModelInfo(provider, model_id, *values)
+                for model_id, values in models.items()
+            }
+            for provider, models in KNOWN_MODELS.items()
+        }
+        if MODEL_CATALOG_OVERRIDES:
+            self._load_overrides(Path(MODEL_CATALOG_OVERRIDES))
+        self._listings: dict[str, dict] = {}
+        self._failed_at: dict[str, float] = {}
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="model-catalog"
+        )
+        self._read_cache()
+
+    def _load_overrides(self, path: Path):
+        for provider, models in json.loads(path.read_text()).items():
+            for model_id, values in models.items():
+                self._known.setdefault(provider, {})[model_id] = ModelInfo(
+                    provider, model_id, *values
+                )
+
+    def _read_cache(self):
+        try:
+            self._listings = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self._listings = {}
+
+    def _write_cache(self):
+        try:
+            self.path.write_text(json.dumps(self._listings, indent=1))
+        except OSError as e:
+            log.warning("Could not write the model catalog cache: %s", e)
+
+    def _listing(self, provider: str) -> list[str] | None:
+        # Never waits on the provider: a missing or expired listing is
+        # refreshed in the background while the last-known one is served.
+        with self._lock:
+            listing = self._listings.get(provider)
+            models = listing["models"] if listing else None
+            if listing and time.time() - listing["fetched_at"] < self.ttl:
+                return models
+            recently_failed = (
+                time.time() - self._failed_at.get(provider, 0) < MODEL_CATALOG_RETRY
+            )
+            if provider not in self._refreshing and not recently_failed:
+                self._refreshing.add(provider)
+                self._executor.submit(self._refresh, provider)
+            return models
+
+    def _refresh(self, provider: str):
+        try:
+            models = self._lister(provider)
+        except Exception as e:
+            log.warning("Listing %s models failed: %s", provider, e)
+            with self._lock:
+                self._failed_at[provider] = time.time()
+                self._refreshing.discard(provider)
+            return
+        with self._lock:
+            self._listings[provider] = {"fetched_at": time.time(), "models": models}
+            self._write_cache()
+            self._refreshing.discard(provider)
+
+    def get(self, provider: str, model_id: str) -> ModelInfo | None:
+        return self._known.get(provider, {}).get(model_id)
+
+    def models(self, provider: str) -> list[ModelInfo]:
+        known = self._known.get(provider, {})
+        listed = self._listing(provider)
+        if listed is None:
+            return list(known.values())
+        listed = set(listed)
+        return [
+            info
+            for model_id, info in known.items()
+            if model_id in listed
+            or (
+                model_id.endswith("-latest")
+                and any(m.startswith(model_id[: -len("latest")]) for m in listed)
+            )
+        ]
+
+    def as_dict(self) -> dict:
+        return {
+            provider: [asdict(info) for info in self.models(provider)]
+            for provider in self._known
+        }
+
+
+model_catalog = ModelCatalog()
@@ -1,65 +1,117 @@
-import random
+from langfuse.decorators import observe
 
-import streamlit as st
-from langfuse.decorators import langfuse_context, observe
+from chat_engine import chat_page, provider_spec
+from config import get_openai_async_client, get_openai_client
+from context_window import ContextWindow
+from provider_call import ProviderCall
+from router import RouteDecision
+from timing import timed
 
-from config import openai_client
 
-
-@observe(as_type="generation")
+@observe(as_type="generation", capture_input=False)
+@timed("openai_api")
 def openai_api(
     prompt: str,
     model: str = "gpt-4.5-preview",
     instructions: str = "You are a coding assistant that talks like a pirate.",
+    context: ContextWindow | None = None,
+    route: RouteDecision | None = None,
     **kwargs,
 ) -> str:
-    langfuse_context.update_current_observation(
-        input=prompt, model=model, metadata=kwargs
-    )
-
-    user_ids = ["user-1", "user-2", "user-3"]
-    selected_user_id = random.choice(user_ids)
-
-    try:
-        response = openai_client.responses.create(
-            model=model, instructions=instructions, input=prompt, **kwargs
-        )
-        langfuse_context.update_current_trace(user_id=selected_user_id)
-        if hasattr(response, "usage"):
-            langfuse_context.update_current_observation(
-                usage_details={
-                    "input": getattr(response.usage, "input_tokens", None),
-                    "output": getattr(response.usage, "output_tokens", None),
-                }
+    call = ProviderCall("openai", model, prompt, context, route, kwargs, instructions)
+    if call.lookup.hit:
+        return call.lookup.response
+    with call.reporting():
+        response = call.request(
+            lambda: get_openai_client().responses.create(
+                model=model,
+                instructions=instructions,
+                input=call.context.openai_input(),
+                **call.context.openai_options(),
+                **kwargs,
             )
-        return response.output_text
-    except Exception as e:
-        return f"An error occurred: {str(e)}"
+        )
+        call.record(response.usage)
+        return call.finish(response.output_text)
 
 
-def openai_page():
-    st.title("Chat with OpenAI's GPT Model")
-    st.write(
-        "This chatbot uses OpenAI's GPT API (via the new Responses interface) and Langfuse for observability."
-    )
+@observe(as_type="generation", capture_input=False)
+@timed("openai_api_async")
+async def openai_api_async(
+    prompt: str,
+    model: str = "gpt-4.5-preview",
+    instructions: str = "You are a coding assistant that talks like a pirate.",
+    context: ContextWindow | None = None,
+    route: RouteDecision | None = None,
+    **kwargs,
+) -> str:
+    # Async twin of openai_api, used when several providers run concurrently.
+    call = ProviderCall("openai", model, prompt, context, route, kwargs, instructions)
+    if call.lookup.hit:
+        return call.lookup.response
+    with call.reporting():
+        response = await call.request_async(
+            lambda: get_openai_async_client().responses.create(
+                model=model,
+                instructions=instructions,
+                input=call.context.openai_input(),
+                **call.context.openai_options(),
+                **kwargs,
+            )
+        )
+        call.record(response.usage)
+        return call.finish(response.output_text)
 
-    if "openai_messages" not in st.session_state:
-        st.session_state.openai_messages = []
 
-    for message in st.session_state.openai_messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+@observe(as_type="generation", capture_input=False)
+@timed("openai_api_stream")
+def openai_api_stream(
+    prompt: str,
+    model: str = "gpt-4.5-preview",
+    instructions: str = "You are a coding assistant that talks like a pirate.",
+    context: ContextWindow | None = None,
+    route: RouteDecision | None = None,
+    **kwargs,
+):
+    """
+    Streaming variant of openai_api: yields text deltas as they arrive.
+    The decorator joins the yielded chunks into the generation output once
+    the stream is exhausted; the first delta marks the completion start so
+    Langfuse can report time-to-first-token.
+    """
+    call = ProviderCall("openai", model, prompt, context, route, kwargs, instructions)
+    if call.lookup.hit:
+        yield call.lookup.response
+        return
+    with call.reporting():
+        stream = call.request(
+            lambda: get_openai_client().responses.create(
+                model=model,
+                instructions=instructions,
+                input=call.context.openai_input(),
+                stream=True,
+                **call.context.openai_options(),
+                **kwargs,
+            )
+        )
+        for event in call.timed(stream):
+            if event.type == "response.output_text.delta":
+                yield call.chunk(event.delta)
+            elif event.type == "response.completed":
+                call.record(event.response.usage)
+        call.finish()
 
-    if prompt := st.chat_input("Say something to OpenAI..."):
-        st.session_state.openai_messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
 
-        response_text = openai_api(prompt)
+OPENAI_CHAT = provider_spec(
+    "openai",
+    "OpenAI",
+    title="Chat with OpenAI's GPT Model",
+    description="This chatbot uses OpenAI's GPT API (via the new Responses interface) and Langfuse for observability.",
+    default_model="gpt-4.5-preview",
+    api=openai_api,
+    api_stream=openai_api_stream,
+)
 
-        with st.chat_message("assistant"):
-            st.markdown(response_text)
 
-        st.session_state.openai_messages.append(
-            {"role": "assistant", "content": response_text}
-        )
+def openai_page():
+    chat_page(OPENAI_CHAT)
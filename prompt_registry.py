@@ -0,0 +1,182 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+from langfuse.api.resources.prompts import Prompt_Text
+from langfuse.model import PromptClient, TextPromptClient
+
+from config import get_langfuse
+from logs import get_logger
+
+log = get_logger(__name__)
+
+
+@dataclass
+class _Entry:
+    prompt: PromptClient
+    fetched_at: float
+    failures: int = 0
+    last_error: str | None = None
+
+
+class PromptRegistry:
+    """
+    In-memory registry of Langfuse prompts, keyed by (name, label).
+
+    Prompts are served from memory. Once an entry is older than `ttl_seconds`
+    it is still returned (stale-while-revalidate) while a background worker
+    fetches the new version; a daemon thread also revalidates idle entries
+    every `refresh_interval` seconds. If Langfuse is slow or down the last good
+    version keeps being served. Only the very first request for a prompt waits,
+    and for at most `cold_fetch_timeout` seconds before the fallback is used.
+    The fallback is then served from memory too, and refetched in the
+    background after `fallback_retry_seconds`, doubling per failure up to
+    `ttl_seconds`.
+    """
+
+    def __init__(
+        self,
+        client_factory=get_langfuse,
+        ttl_seconds: float = 60.0,
+        refresh_interval: float = 30.0,
+        cold_fetch_timeout: float = 3.0,
+        fallback_retry_seconds: float = 5.0,
+    ):
+        self._client_factory = client_factory
+        self.ttl_seconds = ttl_seconds
+        self.refresh_interval = refresh_interval
+        self.cold_fetch_timeout = cold_fetch_timeout
+        self.fallback_retry_seconds = fallback_retry_seconds
+        self._entries: dict[tuple[str, str], _Entry] = {}
+        self._inflight: dict[tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="prompt-refresh"
+        )
+        self._refresher: threading.Thread | None = None
+
+    def _fetch(self, name: str, label: str) -> PromptClient:
+        # Bypass the SDK's own prompt cache: this registry owns freshness.
+        return self._client_factory().get_prompt(
+            name, label=label, cache_ttl_seconds=0, max_retries=1
+        )
+
+    def _refresh(self, key: tuple[str, str]) -> Future:
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._refresh_task, key)
+                self._inflight[key] = future
+            return future
+
+    def _refresh_task(self, key: tuple[str, str]) -> PromptClient:
+        try:
+            prompt = self._fetch(*key)
+        except Exception as e:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.failures += 1
+                    entry.last_error = str(e)
+                    if entry.prompt.is_fallback:
+                        # The retry backoff counts from the last attempt.
+                        entry.fetched_at = time.monotonic()
+            log.warning("Refreshing prompt %s failed, serving last good: %s", key, e)
+            raise
+        else:
+            with self._lock:
+                self._entries[key] = _Entry(prompt=prompt, fetched_at=time.monotonic())
+            return prompt
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            with self._lock:
+                stale = [
+                    key for key, entry in self._entries.items() if self._is_stale(entry)
+                ]
+            for key in stale:
+                self._refresh(key)
+
+    def _ensure_refresher(self):
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(
+                    target=self._refresh_loop, name="prompt-registry", daemon=True
+                )
+                self._refresher.start()
+
+    def _is_stale(self, entry: _Entry) -> bool:
+        max_age = self.ttl_seconds
+        if entry.prompt.is_fallback:
+            max_age = min(max_age, self.fallback_retry_seconds * 2**entry.failures)
+        return time.monotonic() - entry.fetched_at > max_age
+
+    def get(
+        self, name: str, label: str = "production", fallback: str | None = None
+    ) -> PromptClient:
+        """
+        Returns the prompt for `name`/`label` without touching the network
+        whenever a version is already in memory. `fallback` is served as an
+        unversioned text prompt if the first fetch fails or times out, and
+        until a later fetch succeeds.
+        """
+        self._ensure_refresher()
+        key = (name, label)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if self._is_stale(entry):
+                self._refresh(key)
+            return entry.prompt
+
+        try:
+            return self._refresh(key).result(timeout=self.cold_fetch_timeout)
+        except Exception as e:
+            if fallback is None:
+                raise
+            log.warning("Serving fallback for prompt %s: %r", key, e)
+            prompt = TextPromptClient(
+                Prompt_Text(
+                    name=name,
+                    version=0,
+                    prompt=fallback,
+                    config={},
+                    labels=[label],
+                    tags=[],
+                    type="text",
+                ),
+                is_fallback=True,
+            )
+            with self._lock:
+                # Unless the fetch landed in the meantime.
+                entry = self._entries.setdefault(
+                    key,
+                    _Entry(
+                        prompt=prompt,
+                        fetched_at=time.monotonic(),
+                        failures=int(not isinstance(e, TimeoutError)),
+                        last_error=str(e),
+                    ),
+                )
+            return entry.prompt
+
+    def status(self) -> dict:
+        # Snapshot of what is being served, for debugging and dashboards.
+        with self._lock:
+            return {
+                f"{name}@{label}": {
+                    "version": entry.prompt.version,
+                    "fallback": entry.prompt.is_fallback,
+                    "age": time.monotonic() - entry.fetched_at,
+                    "failures": entry.failures,
+                    "last_error": entry.last_error,
+                }
+                for (name, label), entry in self._entries.items()
+            }
+
+
+prompt_registry = PromptRegistry()
@@ -0,0 +1,157 @@
+"""
+What the provider API functions (openai_page, anthropic_page, gemini_page,
+scoring_page) share around their request: metering, the demo user, trace
+sampling, the response cache, the generation's input and metadata, the
+guarded call with its phase timings, usage recording and error reporting.
+The pages keep only their request and how to read the response.
+"""
+
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from langfuse.decorators import langfuse_context
+
+from cache import response_cache
+from context_window import ContextWindow
+from metering import meter
+from resilience import guards, record_cancelled, record_error
+from router import RouteDecision
+from timing import current_timer
+from trace_policy import sample_trace
+
+USER_IDS = ["user-1", "user-2", "user-3"]
+
+# The generation's input: the messages as each provider gets them.
+PROVIDER_INPUT = {
+    "openai": ContextWindow.openai_input,
+    "anthropic": ContextWindow.anthropic_messages,
+    "gemini": ContextWindow.gemini_contents,
+}
+
+
+class ProviderCall:
+    """
+    One call of a provider API function, made inside its `@observe`d
+    generation. Creating it does everything up to the request; when the
+    cache has the answer (`lookup.hit`) the function returns
+    `lookup.response` instead. Otherwise, within `reporting()`:
+
+        response = call.request(lambda: client.create(...))
+        call.record(response.usage)
+        return call.finish(response.text)
+
+    Streams pass each text chunk through `chunk()` and end with `finish()`.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        model: str,
+        prompt: str,
+        context: ContextWindow | None,
+        route: RouteDecision | None,
+        kwargs: dict,
+        instructions: str = "",
+    ):
+        self.provider = provider
+        self.model = model
+        self.timer = current_timer()
+        self.context = meter.admit(
+            provider, model, context or ContextWindow(prompt), instructions
+        )
+        self.user_id = random.choice(USER_IDS)
+        # Whether this trace goes to Langfuse (trace_policy.py).
+        sample_trace(model, self.user_id)
+        self.lookup = response_cache.lookup(
+            provider,
+            model,
+            prompt,
+            instructions=instructions or None,
+            params=self.context.cache_params(kwargs),
+        )
+        self.metadata = {
+            **kwargs,
+            # Read by feedback_analytics.py to group feedback by user.
+            "user_id": self.user_id,
+            "cache": self.lookup.as_metadata(),
+            "context": self.context.as_metadata(),
+            "route": route and route.as_metadata(),
+        }
+        with self.timer.phase("tracing"):
+            langfuse_context.update_current_observation(
+                input=PROVIDER_INPUT[provider](self.context),
+                model=model,
+                metadata=self.metadata,
+            )
+        if self.lookup.hit:
+            langfuse_context.update_current_observation(
+                usage_details={"input": 0, "output": 0},
+                metadata={**self.metadata, "timings": self.timer.as_dict()},
+            )
+        self.chunks: list[str] = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def reporting(self):
+        try:
+            yield
+        except asyncio.CancelledError:
+            # Lost a hedged race (hedging.py) or the caller went away.
+            record_cancelled()
+            raise
+        except Exception as e:
+            record_error(e)
+            raise
+
+    def _traced(self):
+        with self.timer.phase("tracing"):
+            langfuse_context.update_current_trace(user_id=self.user_id)
+
+    def request(self, fn):
+        with self.timer.phase("provider_call"):
+            response = guards[self.provider].call(
+                fn, model=self.model, tokens=self.context.input_tokens
+            )
+        self._traced()
+        return response
+
+    async def request_async(self, fn):
+        with self.timer.phase("provider_call"):
+            response = await guards[self.provider].call_async(
+                fn, model=self.model, tokens=self.context.input_tokens
+            )
+        self._traced()
+        return response
+
+    def timed(self, stream):
+        # The waits for the next chunk count as provider time.
+        return self.timer.timed_iter(stream, "provider_call")
+
+    def chunk(self, text: str) -> str:
+        # The first chunk marks the completion start, so Langfuse can report
+        # time-to-first-token.
+        if not self.chunks:
+            self.timer.mark("ttft")
+            langfuse_context.update_current_observation(
+                completion_start_time=datetime.now(timezone.utc)
+            )
+        self.chunks.append(text)
+        return text
+
+    def record(self, usage):
+        with self.timer.phase("tracing"):
+            meter.record(self.provider, self.model, usage, self.user_id, self.context)
+
+    def finish(self, text: str | None = None) -> str:
+        # A stream's answer is its chunks.
+        if text is None:
+            text = "".join(self.chunks)
+        with self.timer.phase("post_processing"):
+            response_cache.store(self.lookup, text, time.perf_counter() - self.started)
+        langfuse_context.update_current_observation(
+            metadata={**self.metadata, "timings": self.timer.as_dict()}
+        )
+        return text
@@ -0,0 +1,464 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import httpx
+from langfuse.decorators import langfuse_context
+
+from logs import get_logger
+from timing import Histogram
+
+log = get_logger(__name__)
+
+# Defaults per provider, 0 for no limit (the provider's own 429s still apply);
+# RATE_LIMITS overrides them per provider or model, e.g.
+# RATE_LIMITS='{"openai": {"rpm": 500}, "openai/gpt-4o-mini": {"tpm": 200000}}'
+DEFAULT_RPM = int(os.getenv("RATE_LIMIT_RPM", "0"))
+DEFAULT_TPM = int(os.getenv("RATE_LIMIT_TPM", "0"))
+RATE_LIMITS = json.loads(os.getenv("RATE_LIMITS", "{}"))
+# A request that would wait longer than this for the rate limiter fails at
+# once instead of piling up behind the others.
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+# Output tokens charged against the TPM bucket on top of the input estimate.
+RATE_LIMIT_OUTPUT_TOKENS = int(os.getenv("RATE_LIMIT_OUTPUT_TOKENS", "256"))
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.5"))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "20"))
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+# Calls per model kept for the rolling latency and error statistics.
+HEALTH_WINDOW = int(os.getenv("HEALTH_WINDOW", "200"))
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute` units per minute up to `capacity`. Reservations
+    may take the balance negative; the deficit is the caller's wait, so
+    concurrent callers queue up in arrival order.
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (amount - self.tokens) / self.rate)
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def try_acquire(self, amount: float) -> bool:
+        # Takes `amount` only if the balance covers it, in one step, so
+        # concurrent callers cannot overdraw the bucket.
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens < amount:
+                return False
+            self.tokens -= amount
+            return True
+
+    def adjust(self, amount: float):
+        # Charges (or refunds, if negative) the difference between an
+        # estimate that was reserved and the actual amount.
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets for one model. A limit
+    of 0 leaves that bucket out.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    def _buckets(self, tokens: int) -> list[tuple[TokenBucket, int]]:
+        pairs = [(self.requests, 1), (self.tokens, tokens)]
+        return [(bucket, amount) for bucket, amount in pairs if bucket]
+
+    def reserve(self, tokens: int) -> float:
+        # Both buckets must have room; refuse before reserving anything so a
+        # rejected request does not eat into the budget of the next ones.
+        buckets = self._buckets(tokens)
+        wait = max((bucket.wait_time(amount) for bucket, amount in buckets), default=0)
+        if wait > RATE_LIMIT_MAX_WAIT:
+            raise RateLimitExceeded(
+                f"rate limit: would wait {wait:.1f}s (max {RATE_LIMIT_MAX_WAIT:.0f}s)"
+            )
+        return max((bucket.reserve(amount) for bucket, amount in buckets), default=0.0)
+
+    def adjust(self, tokens: int):
+        if self.tokens:
+            self.tokens.adjust(tokens)
+
+    def refund(self, tokens: int):
+        for bucket, amount in self._buckets(tokens):
+            bucket.adjust(-amount)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive provider failures and fails
+    fast for `reset_seconds`. Then a single probe request is let through:
+    success closes the circuit, failure opens it again.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        # The probe ended without an outcome (cancelled, closed stream), so
+        # the next request may probe instead.
+        with self._lock:
+            self._probing = False
+
+
+class ModelHealth:
+    """
+    Rolling latency (successful attempts) and error rate (retryable
+    failures) over the last `window` calls to one model. For streams the
+    latency is the time to the start of the response.
+    """
+
+    def __init__(self, window: int = HEALTH_WINDOW):
+        self.latency = Histogram(window)
+        self._outcomes: deque[bool] = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool):
+        if ok:
+            self.latency.observe(latency)
+        self._outcomes.append(ok)
+
+    @property
+    def samples(self) -> int:
+        return len(self._outcomes)
+
+    @property
+    def error_rate(self) -> float:
+        outcomes = list(self._outcomes)
+        return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "samples": self.samples,
+            "error_rate": round(self.error_rate, 4),
+            **{
+                name: None if value is None else round(value, 4)
+                for name, value in self.latency.percentiles().items()
+            },
+        }
+
+
+def status_code(error: Exception) -> int | None:
+    # openai/anthropic: status_code; google-genai: code.
+    for name in ("status_code", "code"):
+        value = getattr(error, name, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    status = status_code(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError)) or (
+        type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+    )
+
+
+def is_provider_failure(error: Exception) -> bool:
+    # What counts towards the breaker: the provider being down, not us being
+    # throttled (429) or sending a bad request (4xx).
+    status = status_code(error)
+    if status is not None:
+        return status >= 500
+    return is_retryable(error)
+
+
+def retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    if value := headers.get("retry-after-ms"):
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    if value := headers.get("retry-after"):
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    if (delay := retry_after(error)) is not None:
+        # Honour the server, plus a little jitter so retries don't align.
+        return delay + random.uniform(0, RETRY_BACKOFF_BASE)
+    # Full jitter.
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2**attempt))
+
+
+def record_error(error: Exception):
+    # Marks the current generation as failed instead of returning the error
+    # as if it were the answer.
+    message = f"{type(error).__name__}: {error}"
+    langfuse_context.update_current_observation(level="ERROR", status_message=message)
+    _event("provider_error", "ERROR", error=message)
+
+
+def record_cancelled():
+    langfuse_context.update_current_observation(
+        level="WARNING", status_message="cancelled"
+    )
+
+
+def _event(name: str, level: str, **metadata):
+    trace_id = langfuse_context.get_current_trace_id()
+    if trace_id is None:
+        return
+    from config import get_langfuse
+
+    get_langfuse().event(
+        trace_id=trace_id,
+        parent_observation_id=langfuse_context.get_current_observation_id(),
+        name=name,
+        level=level,
+        status_message=metadata.get("error"),
+        metadata=metadata,
+    )
+
+
+class ProviderGuard:
+    """
+    Rate limiting, retries and circuit breaking around one provider's calls.
+
+    `call(fn, model=..., tokens=...)` runs `fn()` once the model's buckets
+    have room, retries retryable errors with jittered backoff (honouring
+    Retry-After) and records the outcome with the provider's breaker. Retries
+    and a tripped breaker are logged as events on the current Langfuse
+    observation. `call_async` is the same for a function returning an
+    awaitable. Every attempt also feeds the model's ModelHealth, which the
+    router reads.
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.breaker = CircuitBreaker()
+        self._limiters: dict[str, RateLimiter] = {}
+        self._health: dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model: str) -> RateLimiter:
+        with self._lock:
+            if model not in self._limiters:
+                limits = {
+                    "rpm": DEFAULT_RPM,
+                    "tpm": DEFAULT_TPM,
+                    **RATE_LIMITS.get(self.provider, {}),
+                    **RATE_LIMITS.get(f"{self.provider}/{model}", {}),
+                }
+                self._limiters[model] = RateLimiter(limits["rpm"], limits["tpm"])
+            return self._limiters[model]
+
+    def health(self, model: str) -> ModelHealth:
+        with self._lock:
+            if model not in self._health:
+                self._health[model] = ModelHealth()
+            return self._health[model]
+
+    def _admit(self, model: str, tokens: int) -> float:
+        # The limiter goes first: a throttled request must not take the
+        # half-open probe with it.
+        limiter = self.limiter(model)
+        tokens += RATE_LIMIT_OUTPUT_TOKENS
+        wait = limiter.reserve(tokens)
+        if not self.breaker.allow():
+            limiter.refund(tokens)
+            _event("circuit_open", "ERROR", provider=self.provider, model=model)
+            raise CircuitOpenError(
+                f"{self.provider} is failing, requests paused for "
+                f"{self.breaker.reset_seconds:.0f}s"
+            )
+        return wait
+
+    def _failed(
+        self, error: Exception, attempt: int, model: str, latency: float
+    ) -> float | None:
+        # Returns the delay before the next attempt, or None to give up.
+        if is_retryable(error):
+            self.health(model).record(latency, ok=False)
+        if is_provider_failure(error):
+            self.breaker.record_failure()
+        else:
+            # The provider answered (if only with a 4xx), so it is up.
+            self.breaker.record_success()
+        if not is_retryable(error) or attempt + 1 >= RETRY_MAX_ATTEMPTS:
+            return None
+        delay = backoff_delay(attempt, error)
+        if delay > RATE_LIMIT_MAX_WAIT:
+            return None
+        log.info(
+            "%s/%s attempt %d failed (%s), retrying in %.2fs",
+            self.provider,
+            model,
+            attempt + 1,
+            error,
+            delay,
+        )
+        _event(
+            "provider_retry",
+            "WARNING",
+            provider=self.provider,
+            model=model,
+            attempt=attempt + 1,
+            delay=round(delay, 3),
+            error=f"{type(error).__name__}: {error}",
+        )
+        return delay
+
+    def call(self, fn, *, model: str, tokens: int = 0):
+        attempt = 0
+        while True:
+            wait = self._admit(model, tokens)
+            try:
+                time.sleep(wait)
+                started = time.perf_counter()
+                result = fn()
+            except Exception as e:
+                delay = self._failed(e, attempt, model, time.perf_counter() - started)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (CancelledError, GeneratorExit): no outcome to record,
+                # but a half-open probe must not stay taken.
+                self.breaker.release_probe()
+                raise
+            self.health(model).record(time.perf_counter() - started, ok=True)
+            self.breaker.record_success()
+            return result
+
+    async def call_async(self, fn, *, model: str, tokens: int = 0):
+        attempt = 0
+        while True:
+            wait = self._admit(model, tokens)
+            try:
+                await asyncio.sleep(wait)
+                started = time.perf_counter()
+                result = await fn()
+            except Exception as e:
+                delay = self._failed(e, attempt, model, time.perf_counter() - started)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (CancelledError, GeneratorExit): no outcome to record,
+                # but a half-open probe must not stay taken.
+                self.breaker.release_probe()
+                raise
+            self.health(model).record(time.perf_counter() - started, ok=True)
+            self.breaker.record_success()
+            return result
+
+
+def primed(iterable):
+    """
+    Pulls the first item of a lazy stream, so a guarded call covers the
+    request itself (Gemini only sends it on the first next()).
+    """
+    iterator = iter(iterable)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        return iter(())
+
+    def chain():
+        yield first
+        yield from iterator
+
+    return chain()
+
+
+guards = {name: ProviderGuard(name) for name in ("gemini", "openai", "anthropic")}
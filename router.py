@@ -0,0 +1,173 @@
+import os
+import random
+from dataclasses import dataclass, field
+
+from model_catalog import ModelCatalog, ModelInfo, model_catalog
+from resilience import RATE_LIMIT_OUTPUT_TOKENS, guards
+
+POLICIES = ("fastest", "cheapest", "within_budget")
+
+# Most a request may cost (USD) under the within_budget policy.
+ROUTER_MAX_COST = float(os.getenv("ROUTER_MAX_COST", "0.01"))
+# Models failing more often than this are skipped.
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+# Share of requests sent to a model with fewer than ROUTER_MIN_SAMPLES calls,
+# so new or idle models get measured.
+ROUTER_EXPLORE = float(os.getenv("ROUTER_EXPLORE", "0.05"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))
+# p50 latency (seconds) assumed for a model that has not been measured yet.
+ROUTER_DEFAULT_LATENCY = float(os.getenv("ROUTER_DEFAULT_LATENCY", "5"))
+
+
+@dataclass
+class RouteDecision:
+    provider: str
+    model: str
+    policy: str
+    reason: str
+    estimated_cost: float | None = None
+    # The statistics of every model considered, as used for the decision.
+    candidates: dict = field(default_factory=dict)
+
+    def as_metadata(self) -> dict:
+        return {
+            "model": f"{self.provider}/{self.model}",
+            "policy": self.policy,
+            "reason": self.reason,
+            "estimated_cost": self.estimated_cost,
+            "candidates": self.candidates,
+        }
+
+
+@dataclass
+class _Candidate:
+    info: ModelInfo
+    health: dict
+    expected_latency: float
+    cost: float
+    skipped: str | None = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.info.provider}/{self.info.id}"
+
+    def as_dict(self) -> dict:
+        return {
+            **self.health,
+            "expected_latency": round(self.expected_latency, 4),
+            "estimated_cost": round(self.cost, 6),
+            "skipped": self.skipped,
+        }
+
+
+class Router:
+    """
+    Picks a model per request from the catalog and the rolling statistics of
+    each model's calls (resilience.ModelHealth).
+
+    - fastest: lowest expected latency, i.e. p50 inflated by the error rate
+      (failed attempts are retried).
+    - cheapest: lowest estimated cost for the request's tokens.
+    - within_budget: fastest of the models whose estimated cost is within
+      `max_cost`; the cheapest one if none is.
+
+    Models whose context window is too small, whose circuit is open or whose
+    error rate is above ROUTER_MAX_ERROR_RATE are skipped.
+    """
+
+    def __init__(self, catalog: ModelCatalog = model_catalog):
+        self.catalog = catalog
+
+    def _candidates(
+        self, providers: list[str], input_tokens: int, output_tokens: int
+    ) -> list[_Candidate]:
+        candidates = []
+        for provider in providers:
+            guard = guards[provider]
+            for info in self.catalog.models(provider):
+                health = guard.health(info.id)
+                p50 = health.latency.percentiles((50,))["p50"]
+                latency = p50 if p50 is not None else ROUTER_DEFAULT_LATENCY
+                candidate = _Candidate(
+                    info,
+                    health.as_dict(),
+                    latency / max(1.0 - health.error_rate, 0.05),
+                    info.cost(input_tokens, output_tokens),
+                )
+                if input_tokens + output_tokens > info.context_window:
+                    candidate.skipped = "context_window"
+                elif guard.breaker.state == "open":
+                    candidate.skipped = "circuit_open"
+                elif (
+                    health.samples >= ROUTER_MIN_SAMPLES
+                    and health.error_rate > ROUTER_MAX_ERROR_RATE
+                ):
+                    candidate.skipped = "error_rate"
+                candidates.append(candidate)
+        return candidates
+
+    def route(
+        self,
+        providers: str | list[str],
+        policy: str,
+        input_tokens: int,
+        output_tokens: int = RATE_LIMIT_OUTPUT_TOKENS,
+        max_cost: float = ROUTER_MAX_COST,
+        default: str | None = None,
+        exclude: tuple[str, ...] = (),
+    ) -> RouteDecision:
+        # `exclude` lists "provider/model" keys that must not be picked.
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown routing policy {policy!r}")
+        providers = [providers] if isinstance(providers, str) else list(providers)
+        candidates = self._candidates(providers, input_tokens, output_tokens)
+        stats = {c.key: c.as_dict() for c in candidates}
+        eligible = [c for c in candidates if c.skipped is None and c.key not in exclude]
+        if not eligible:
+            return RouteDecision(
+                providers[0], default, policy, "no eligible model", None, stats
+            )
+
+        by_latency = lambda c: (c.expected_latency, c.cost)  # noqa: E731
+        by_cost = lambda c: (c.cost, c.expected_latency)  # noqa: E731
+        if policy == "cheapest":
+            pool, order, reason = eligible, by_cost, "lowest estimated cost"
+        elif policy == "fastest":
+            pool, order, reason = eligible, by_latency, "lowest expected latency"
+        else:
+            pool = [c for c in eligible if c.cost <= max_cost]
+            order, reason = by_latency, f"fastest within ${max_cost:g}"
+            if not pool:
+                pool, order, reason = eligible, by_cost, "none within budget, cheapest"
+
+        unmeasured = [c for c in pool if c.health["samples"] < ROUTER_MIN_SAMPLES]
+        if policy != "cheapest" and unmeasured and random.random() < ROUTER_EXPLORE:
+            chosen, reason = random.choice(unmeasured), "exploring unmeasured model"
+        else:
+            chosen = min(pool, key=order)
+        return RouteDecision(
+            chosen.info.provider,
+            chosen.info.id,
+            policy,
+            reason,
+            round(chosen.cost, 6),
+            stats,
+        )
+
+    def decide(
+        self, provider: str, choice: str, input_tokens: int, default: str
+    ) -> RouteDecision:
+        # `choice` is a policy or a fixed model id, as picked in the sidebar.
+        if choice in POLICIES:
+            return self.route(provider, choice, input_tokens, default=default)
+        info = self.catalog.get(provider, choice)
+        return RouteDecision(
+            provider,
+            choice,
+            "fixed",
+            "selected model",
+            info and round(info.cost(input_tokens, RATE_LIMIT_OUTPUT_TOKENS), 6),
+        )
+
+
+router = Router()
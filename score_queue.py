@@ -0,0 +1,242 @@
+import atexit
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from langfuse.api.resources.ingestion.types import IngestionEvent_ScoreCreate, ScoreBody
+
+from config import get_langfuse
+from logs import get_logger
+
+log = get_logger(__name__)
+
+
+@dataclass
+class _Pending:
+    score: dict
+    attempts: int = 0
+    not_before: float = 0.0
+
+
+class ScoreQueue:
+    """
+    In-process queue of Langfuse scores drained by a background worker.
+
+    `submit` never touches the network, so it is safe to call from Streamlit
+    callbacks. Scores are coalesced by their id (repeated thumbs clicks on the
+    same `score-{trace_id}` only send the latest value), sent to the ingestion
+    API in batches of `batch_size` and retried with jittered exponential
+    backoff. Scores that exhaust `max_attempts`, are rejected by the API, or
+    arrive while the queue holds `max_size` distinct ids are counted as dropped.
+    """
+
+    def __init__(
+        self,
+        client_factory=get_langfuse,
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        max_size: int = 10_000,
+        max_attempts: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+    ):
+        self._client_factory = client_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._pending: OrderedDict[str, _Pending] = OrderedDict()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._worker: threading.Thread | None = None
+        self.sent = 0
+        self.dropped = 0
+
+    @property
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._pending) + self._in_flight
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "depth": len(self._pending) + self._in_flight,
+                "sent": self.sent,
+                "dropped": self.dropped,
+            }
+
+    def submit(
+        self,
+        *,
+        id: str,
+        trace_id: str,
+        name: str,
+        value,
+        data_type: str | None = None,
+        comment: str | None = None,
+        observation_id: str | None = None,
+    ) -> bool:
+        """
+        Enqueues a score, replacing any pending score with the same id.
+        Returns False if the score was dropped because the queue is full.
+        """
+        score = {
+            "id": id,
+            "trace_id": trace_id,
+            "name": name,
+            "value": value,
+            "data_type": data_type,
+            "comment": comment,
+            "observation_id": observation_id,
+        }
+        with self._cond:
+            if self._stopping:
+                self.dropped += 1
+                return False
+            if id in self._pending:
+                self._pending[id] = _Pending(score)
+            elif len(self._pending) >= self.max_size:
+                self.dropped += 1
+                log.warning("Score queue full, dropping score %s", id)
+                return False
+            else:
+                self._pending[id] = _Pending(score)
+            self._ensure_worker()
+            self._cond.notify()
+        return True
+
+    def _ensure_worker(self):
+        # Called with the condition held.
+        if self._worker is None:
+            self._worker = threading.Thread(
+                target=self._run, name="score-queue", daemon=True
+            )
+            self._worker.start()
+
+    def _take_batch(self) -> list[_Pending]:
+        # Called with the condition held.
+        now = time.monotonic()
+        batch = []
+        for key in list(self._pending):
+            if self._pending[key].not_before <= now:
+                batch.append(self._pending.pop(key))
+                if len(batch) == self.batch_size:
+                    break
+        self._in_flight = len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+                while not batch:
+                    if self._stopping and not self._pending:
+                        return
+                    self._cond.wait(self.flush_interval)
+                    batch = self._take_batch()
+            try:
+                self._send(batch)
+            finally:
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+
+    def _send(self, batch: list[_Pending]):
+        client = self._client_factory()
+        events = {}
+        for item in batch:
+            event_id = str(uuid.uuid4())
+            events[event_id] = item
+        try:
+            response = client.api.ingestion.batch(
+                batch=[
+                    IngestionEvent_ScoreCreate(
+                        id=event_id,
+                        timestamp=datetime.now(timezone.utc).isoformat(),
+                        body=ScoreBody(
+                            environment=client.environment,
+                            **{k: v for k, v in item.score.items() if v is not None},
+                        ),
+                    )
+                    for event_id, item in events.items()
+                ]
+            )
+        except Exception as e:
+            log.warning("Sending %d scores failed: %s", len(batch), e)
+            self._retry(batch)
+            return
+
+        retry = []
+        failed = set()
+        for error in response.errors:
+            item = events.get(error.id)
+            if item is None:
+                continue
+            failed.add(error.id)
+            # Rate limits and server errors are transient; anything else is not.
+            if error.status == 429 or error.status >= 500:
+                retry.append(item)
+            else:
+                log.warning("Score %s rejected: %s", item.score["id"], error.message)
+                with self._cond:
+                    self.dropped += 1
+        with self._cond:
+            self.sent += len(events) - len(failed)
+        if retry:
+            self._retry(retry)
+
+    def _retry(self, items: list[_Pending]):
+        now = time.monotonic()
+        with self._cond:
+            for item in items:
+                item.attempts += 1
+                score_id = item.score["id"]
+                if score_id in self._pending:
+                    # A newer value was submitted while this one was in flight.
+                    continue
+                if item.attempts >= self.max_attempts:
+                    self.dropped += 1
+                    log.warning("Giving up on score %s", score_id)
+                    continue
+                delay = min(self.backoff_max, self.backoff_base * 2**item.attempts)
+                item.not_before = now + delay * random.uniform(0.5, 1.0)
+                self._pending[score_id] = item
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Blocks until every pending score is sent or given up on. Returns False
+        if scores were still queued when `timeout` expired.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            for item in self._pending.values():
+                item.not_before = 0.0
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: float = 10.0):
+        # Registered with atexit so queued feedback survives a server restart.
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            if not flushed:
+                self.dropped += len(self._pending)
+                log.warning("Dropping %d unsent scores on shutdown", len(self._pending))
+                self._pending.clear()
+
+
+score_queue = ScoreQueue()
+atexit.register(score_queue.shutdown)
@@ -1,155 +1,122 @@
-import random
+import functools
 
 import streamlit as st
-from langfuse import Langfuse
 from langfuse.decorators import langfuse_context, observe
-from config import openai_client
-
-langfuse = Langfuse()
-prompt = langfuse.get_prompt("default_prompt")
-
-
-@observe(as_type="generation")
+from chat_engine import ChatSpec, chat_page
+from config import get_openai_client
+from context_window import ContextWindow
+from logs import get_logger
+from prompt_registry import prompt_registry
+from provider_call import ProviderCall
+from router import RouteDecision
+from score_queue import score_queue
+from timing import timed
+from trace_policy import keep_trace
+
+log = get_logger(__name__)
+
+PROMPT_NAME = "default_prompt"
+# Served only until the first successful fetch of PROMPT_NAME.
+FALLBACK_INSTRUCTIONS = "You are a helpful assistant."
+
+
+# Named apart from openai_page.openai_api, so feedback_analytics.py can tell
+# the scored generations from the other OpenAI traffic.
+@observe(name="scoring_openai_api", as_type="generation", capture_input=False)
+@timed("scoring_openai_api")
 def openai_api(
     prompt: str,
     model: str = "gpt-4o-mini",
-    instructions: str = prompt.prompt,
+    instructions: str | None = None,
+    prompt_label: str = "production",
+    context: ContextWindow | None = None,
+    route: RouteDecision | None = None,
     **kwargs,
 ) -> dict:
-    # Debug: Log input details.
-    print("DEBUG: Starting openai_api")
-    print(f"DEBUG: Input prompt: {prompt}")
-    print(f"DEBUG: Model: {model}")
-    print(f"DEBUG: Additional kwargs: {kwargs}")
-
-    user_ids = ["user-1", "user-2", "user-3"]
-    selected_user_id = random.choice(user_ids)
-    # Update the current observation context with input and metadata.
-    langfuse_context.update_current_observation(
-        input=prompt,
-        model=model,
-        metadata=kwargs,
+    # The system prompt comes from the registry (in memory, refreshed in the
+    # background) unless the caller passes explicit instructions.
+    system_prompt = prompt_registry.get(
+        PROMPT_NAME, label=prompt_label, fallback=FALLBACK_INSTRUCTIONS
     )
-    # Capture the trace ID immediately.
+    if instructions is None:
+        instructions = system_prompt.prompt
+        # Links the generation to the prompt version in Langfuse.
+        langfuse_context.update_current_observation(prompt=system_prompt)
+    log.debug("openai_api: model=%s prompt=%r kwargs=%s", model, prompt, kwargs)
+    # The instructions are the Langfuse prompt text, so a new prompt version
+    # gets its own cache entries.
+    call = ProviderCall("openai", model, prompt, context, route, kwargs, instructions)
     trace_id = langfuse_context.get_current_trace_id()
-    print(f"DEBUG: Captured Trace ID: {trace_id}")
-
-    try:
-        response = openai_client.responses.create(
-            model=model, instructions=instructions, input=prompt, **kwargs
-        )
-        print(f"DEBUG: Received response from openai_client: {response}")
-
-        if hasattr(response, "usage"):
-            usage_details = {
-                "input": getattr(response.usage, "input_tokens", None),
-                "output": getattr(response.usage, "output_tokens", None),
-            }
-            print(f"DEBUG: Response usage details: {usage_details}")
-            langfuse_context.update_current_observation(
-                usage_details=usage_details,
+    if call.lookup.hit:
+        log.debug("openai_api: cache hit (%s) for trace %s", call.lookup.tier, trace_id)
+        return {"output_text": call.lookup.response, "trace_id": trace_id}
+    with call.reporting():
+        response = call.request(
+            lambda: get_openai_client().responses.create(
+                model=model,
+                instructions=instructions,
+                input=call.context.openai_input(),
+                **call.context.openai_options(),
+                **kwargs,
             )
+        )
+        call.record(response.usage)
         # Return both the response text and the trace ID.
-        result = {"output_text": response.output_text, "trace_id": trace_id}
-        print(f"DEBUG: openai_api result: {result}")
-        langfuse_context.update_current_trace(user_id=selected_user_id)
-        return result
-    except Exception as e:
-        print(f"DEBUG: Exception in openai_api: {e}")
-        return {"output_text": f"An error occurred: {str(e)}", "trace_id": trace_id}
-
-
-def save_feedback(index):
-    print(f"DEBUG: Saving feedback for message index {index}")
-    # Retrieve the feedback value stored in session state.
-    feedback_value = st.session_state.get(f"feedback_{index}")
-    print(f"DEBUG: Feedback value for message index {index}: {feedback_value}")
-
-    # Update the corresponding message with the new feedback.
-    st.session_state.openai_messages[index]["feedback"] = feedback_value
+        return {"output_text": call.finish(response.output_text), "trace_id": trace_id}
+
+
+def submit_feedback(trace_id: str, score_value: int, comment: str = "Feedback") -> bool:
+    # Queued for the background worker so the caller never waits on Langfuse;
+    # repeated feedback on the same trace coalesces on the score id.
+    # Traces with feedback are sent to Langfuse even when not sampled.
+    keep_trace(trace_id)
+    queued = score_queue.submit(
+        id=f"score-{trace_id}",
+        trace_id=trace_id,
+        name="helpfulness",
+        value=int(score_value),
+        data_type="BOOLEAN",
+        comment=comment,
+    )
+    if not queued:
+        log.warning("Score queue full, dropped score for trace_id %s", trace_id)
+    return queued
 
-    # Convert feedback to a score: here "up" means 1 (helpful) and "down" means 0.
-    score_value = 1 if feedback_value == 1 else 0
-    message = st.session_state.openai_messages[index]
-    print(f"DEBUG: Message being scored: {message}")
 
-    # Debug: Log details before sending score.
-    trace_id = message.get("trace_id")
-    print(
-        f"DEBUG: Sending score for message index {index} with trace_id: {trace_id}, score_value: {score_value}"
+def chat_settings(label: str) -> dict:
+    system_prompt = prompt_registry.get(
+        PROMPT_NAME, label=label, fallback=FALLBACK_INSTRUCTIONS
+    )
+    st.caption(f"Prompt: {PROMPT_NAME} v{system_prompt.version} ({label})")
+    queue_stats = score_queue.stats()
+    st.sidebar.caption(
+        f"Score queue: {queue_stats['depth']} pending, "
+        f"{queue_stats['dropped']} dropped"
     )
-    try:
-        # Use only the trace_id (like the hardcoded version that works)
-        langfuse.score(
-            id=f"score-{trace_id}",
-            trace_id=trace_id,
-            # trace_name="openai_api2",
-            name="helpfulness",
-            value=int(score_value),
-            data_type="BOOLEAN",
-            comment="Feedback",
+    return {"label": label}
+
+
+def respond(prompt: str, context: ContextWindow, settings: dict) -> str:
+    result = openai_api(prompt, prompt_label=settings["label"], context=context)
+    return result["output_text"]
+
+
+def openai_chat_page(label: str = "production"):
+    # Shares the conversation (and its context) with the OpenAI page.
+    chat_page(
+        ChatSpec(
+            "openai",
+            "OpenAI",
+            title="Chat with OpenAI",
+            description="Interact with our assistant.",
+            respond=respond,
+            settings=functools.partial(chat_settings, label),
+            feedback=submit_feedback,
+            timer="scoring_page",
         )
+    )
 
-    except Exception as e:
-        print(f"DEBUG: Exception when sending score: {e}")
-
-
-def openai_chat_page():
-    st.title("Chat with OpenAI")
-    st.write("Interact with our assistant.")
-
-    # Debug: Log the starting state.
-    print("DEBUG: Starting openai_chat_page")
-    if "openai_messages" not in st.session_state:
-        st.session_state.openai_messages = []
-        print("DEBUG: Initialized st.session_state.openai_messages as empty list")
-    else:
-        print(f"DEBUG: Existing openai_messages: {st.session_state.openai_messages}")
-
-    # Display the chat history along with any feedback widgets.
-    for i, message in enumerate(st.session_state.openai_messages):
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-            if message["role"] == "assistant":
-                st.session_state.setdefault(f"feedback_{i}", message.get("feedback"))
-                st.feedback(
-                    "thumbs",
-                    key=f"feedback_{i}",
-                    disabled=message.get("feedback") is not None,
-                    on_change=save_feedback,
-                    args=[i],
-                )
 
-    # Chat input: when a user sends a message.
-    if prompt := st.chat_input("Say something to OpenAI..."):
-        print(f"DEBUG: Received chat input: {prompt}")
-        # Append and display the user's message.
-        st.session_state.openai_messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
-        print(
-            f"DEBUG: Appended user message. Current openai_messages: {st.session_state.openai_messages}"
-        )
-
-        # Get the assistant's response along with the trace ID.
-        result = openai_api(prompt)
-        print(f"DEBUG: openai_api returned: {result}")
-        response_text = result["output_text"]
-        trace_id = result["trace_id"]
-        # Optionally, if available, you could extract a generation id from the response.
-        # In this case, we'll omit it.
-        assistant_message = {
-            "role": "assistant",
-            "content": response_text,
-            "trace_id": trace_id,
-        }
-        st.session_state.openai_messages.append(assistant_message)
-        print(f"DEBUG: Added assistant message: {assistant_message}")
-        with st.chat_message("assistant"):
-            st.markdown(response_text)
-            st.feedback(
-                "thumbs",
-                key=f"feedback_{len(st.session_state.openai_messages) - 1}",
-                on_change=save_feedback,
-                args=[len(st.session_state.openai_messages) - 1],
-            )
+def openai_chat_page_latest():
+    # Same chat, served with the prompt version labelled "latest".
+    openai_chat_page(label="latest")
@@ -0,0 +1,100 @@
+from cache import NullCache, ResponseCache
+
+# Toy embeddings: prompts that share a vector are paraphrases.
+VECTORS = {
+    "what is python": [1.0, 0.0, 0.0],
+    "what's python": [0.99, 0.1, 0.0],
+    "what is rust": [0.0, 1.0, 0.0],
+}
+
+
+def embed(text: str) -> list[float]:
+    if text not in VECTORS:
+        raise ConnectionError("embedding service is down")
+    return VECTORS[text]
+
+
+def cached(cache: ResponseCache, prompt: str, response: str = "answer", **scope):
+    cache.store(cache.lookup("openai", "m1", prompt, **scope), response, 0.5)
+
+
+def test_exact_hit_returns_the_stored_response():
+    cache = ResponseCache()
+    assert not cache.lookup("openai", "m1", "hi").hit
+    cached(cache, "hi", "hello")
+    lookup = cache.lookup("openai", "m1", "hi")
+    assert (lookup.hit, lookup.tier, lookup.response) == (True, "exact", "hello")
+    assert lookup.latency_saved == 0.5
+    stats = cache.stats()
+    assert (stats["hits"]["exact"], stats["misses"]) == (1, 2)
+
+
+def test_instructions_and_params_scope_the_entries():
+    cache = ResponseCache()
+    cached(cache, "hi", instructions="Be brief.", params={"temperature": 0})
+    assert cache.lookup(
+        "openai", "m1", "hi", instructions="Be brief.", params={"temperature": 0}
+    ).hit
+    assert not cache.lookup("openai", "m1", "hi", instructions="Be verbose.").hit
+    assert not cache.lookup("openai", "m1", "hi", instructions="Be brief.").hit
+    assert not cache.lookup("anthropic", "m1", "hi", instructions="Be brief.").hit
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cached(cache, "a")
+    cached(cache, "b")
+    cache.lookup("openai", "m1", "a")
+    cached(cache, "c")
+    assert cache.lookup("openai", "m1", "a").hit
+    assert not cache.lookup("openai", "m1", "b").hit
+    assert cache.stats()["entries"] == 2
+
+
+def test_expired_entry_is_a_miss():
+    cache = ResponseCache(ttl_seconds=60)
+    cached(cache, "hi")
+    next(iter(cache._entries.values())).created_at -= 61
+    assert not cache.lookup("openai", "m1", "hi").hit
+    assert cache.stats()["entries"] == 0
+
+
+def test_paraphrase_hits_the_semantic_tier():
+    cache = ResponseCache(embed=embed, similarity_threshold=0.95)
+    cached(cache, "what is python", "a language")
+    lookup = cache.lookup("openai", "m1", "what's python")
+    assert (lookup.hit, lookup.tier, lookup.response) == (
+        True,
+        "semantic",
+        "a language",
+    )
+    assert 0.95 <= lookup.similarity < 1.0
+    assert not cache.lookup("openai", "m1", "what is rust").hit
+
+
+def test_semantic_tier_only_matches_within_the_scope():
+    cache = ResponseCache(embed=embed)
+    cached(cache, "what is python", instructions="Be brief.")
+    assert not cache.lookup("openai", "m1", "what's python").hit
+    assert not cache.lookup("openai", "m2", "what's python").hit
+
+
+def test_evicted_entry_leaves_the_semantic_index():
+    cache = ResponseCache(max_entries=1, embed=embed)
+    cached(cache, "what is python")
+    cached(cache, "what is rust")
+    assert not cache.lookup("openai", "m1", "what's python").hit
+
+
+def test_embedding_failure_is_a_miss():
+    cache = ResponseCache(embed=embed)
+    lookup = cache.lookup("openai", "m1", "unknown prompt")
+    assert not lookup.hit
+    assert lookup.embedding is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_null_cache_never_hits():
+    cache = NullCache()
+    cached(cache, "hi")
+    assert not cache.lookup("openai", "m1", "hi").hit
@@ -0,0 +1,95 @@
+from context_window import ContextWindow, ConversationContext, estimate_tokens
+
+
+def history(turns: int, words: int = 50) -> list[dict]:
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"question {turn} " * words})
+        messages.append({"role": "assistant", "content": f"answer {turn} " * words})
+    return messages
+
+
+def test_short_history_is_sent_verbatim():
+    conversation = ConversationContext(budget=3000)
+    window = conversation.window(history(2), "next")
+    assert window.messages == history(2)
+    assert window.summary == ""
+    assert window.folded == 0
+
+
+def test_oldest_turns_are_folded_into_the_summary():
+    conversation = ConversationContext(budget=2000, keep_turns=2)
+    messages = history(12)
+    window = conversation.window(messages, "next")
+
+    # Folded back under 75% of the budget, in whole turns.
+    assert window.folded > 0 and window.folded % 2 == 0
+    assert window.tokens <= 2000 * 0.75
+    assert window.messages == messages[window.folded :]
+    assert [m["role"] for m in window.messages[:2]] == ["user", "assistant"]
+    # The summary keeps the latest folded turns within its own budget.
+    last = window.folded // 2 - 1
+    assert window.summary.splitlines()[-1].startswith(f"assistant: answer {last}")
+    assert estimate_tokens(window.summary) <= conversation.summary_tokens
+    assert conversation.summarized == window.folded
+
+
+def test_recent_turns_are_never_folded():
+    conversation = ConversationContext(budget=200, keep_turns=2)
+    window = conversation.window(history(6), "next")
+    # Over budget even then: the kept turns are truncated, not dropped.
+    assert window.folded == 8
+    assert [m["content"].split()[1] for m in window.messages] == ["4", "4", "5", "5"]
+
+
+def test_prefix_is_stable_between_folds():
+    conversation = ConversationContext(budget=2000, keep_turns=2)
+    messages = history(12)
+    first = conversation.window(messages, "next")
+    messages += [
+        {"role": "user", "content": "short"},
+        {"role": "assistant", "content": "reply"},
+    ]
+    second = conversation.window(messages, "again")
+    assert second.folded == 0
+    assert second.summary == first.summary
+    assert second.messages[: len(first.messages)] == first.messages
+
+
+def test_cleared_history_resets_the_summary():
+    conversation = ConversationContext(budget=1000)
+    conversation.window(history(12), "next")
+    window = conversation.window([], "fresh start")
+    assert window.summary == ""
+    assert conversation.summarized == 0
+
+
+def test_message_too_long_for_the_budget_is_truncated():
+    conversation = ConversationContext(budget=300, keep_turns=1)
+    messages = [
+        {"role": "user", "content": "x" * 4000},
+        {"role": "assistant", "content": "ok"},
+    ]
+    window = conversation.window(messages, "next")
+    assert window.truncated == 1
+    assert window.messages[0]["content"].endswith("...")
+    # Within the rounding of estimate_tokens.
+    assert window.tokens <= 300 + 1
+    assert messages[0]["content"] == "x" * 4000
+
+
+def test_single_turn_window_renders_the_bare_prompt():
+    window = ContextWindow("hello")
+    assert not window.is_multi_turn
+    assert window.openai_input() == "hello"
+    assert window.gemini_contents() == "hello"
+    assert window.input_tokens == estimate_tokens("hello")
+    assert window.cache_params({"t": 1}) == {"t": 1}
+
+
+def test_openai_cache_key_goes_in_the_request_body():
+    conversation = ConversationContext()
+    window = conversation.window(history(1), "next")
+    assert window.openai_options() == {
+        "extra_body": {"prompt_cache_key": conversation.cache_key}
+    }
@@ -0,0 +1,95 @@
+import pytest
+
+import conversation_store
+from conversation_store import Conversation, ConversationStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch) -> ConversationStore:
+    monkeypatch.setattr(conversation_store, "CONVERSATION_WINDOW", 3)
+    return ConversationStore(str(tmp_path / "conversations.sqlite3"))
+
+
+def chat(conversation: Conversation, turns: int, words: int = 1):
+    for n in range(turns):
+        conversation.append("user", f"question {n} " * words, trace_id=None)
+        conversation.append("assistant", f"answer {n} " * words, trace_id=f"t{n}")
+
+
+def test_conversation_is_stored_with_its_first_message(store):
+    conversation = Conversation.open(store, "openai_page")
+    assert store.load(conversation.id) is None
+    conversation.append("user", "hi")
+    row = store.load(conversation.id)
+    assert (row["page"], row["count"]) == ("openai_page", 1)
+
+
+def test_reopened_conversation_keeps_only_the_recent_window(store):
+    conversation = Conversation.open(store, "openai_page")
+    chat(conversation, 3)
+    assert [m["position"] for m in conversation.recent] == [3, 4, 5]
+
+    resumed = Conversation.open(store, "openai_page", conversation.id)
+    assert len(resumed) == 6
+    assert resumed.recent == conversation.recent
+    # Older messages are paged from the store.
+    assert [m["content"] for m in resumed.messages(0, 2)] == [
+        "question 0 ",
+        "answer 0 ",
+    ]
+    assert resumed.context.cache_key == conversation.context.cache_key
+
+
+def test_unknown_conversation_id_starts_a_new_one(store):
+    conversation = Conversation.open(store, "openai_page", "missing")
+    assert conversation.id != "missing"
+    assert len(conversation) == 0
+
+
+def test_pop_drops_the_unanswered_prompt(store):
+    conversation = Conversation.open(store, "openai_page")
+    chat(conversation, 1)
+    conversation.append("user", "unanswered")
+    conversation.pop()
+    assert len(conversation) == 2
+    assert conversation.recent[-1]["content"] == "answer 0 "
+    assert store.load(conversation.id)["count"] == 2
+
+
+def test_feedback_is_saved_with_the_message(store):
+    conversation = Conversation.open(store, "openai_page")
+    chat(conversation, 1)
+    conversation.set_feedback(1, 1)
+    assert conversation.recent[1]["feedback"] == 1
+    assert store.messages(conversation.id, 1, 2)[0]["feedback"] == 1
+
+
+def test_appends_from_two_sessions_do_not_collide(store):
+    first = Conversation.open(store, "openai_page")
+    first.append("user", "from the first tab")
+    second = Conversation.open(store, "openai_page", first.id)
+    second.append("assistant", "from the second tab")
+    message = first.append("user", "again from the first tab")
+    assert message["position"] == 2
+    assert len(first) == 3
+    assert [m["content"] for m in first.recent] == [
+        "from the first tab",
+        "from the second tab",
+        "again from the first tab",
+    ]
+
+
+def test_folded_summary_is_saved_and_resumed(store):
+    conversation = Conversation.open(store, "openai_page")
+    conversation.context.budget = 200
+    conversation.context.keep_turns = 1
+    chat(conversation, 4, words=20)
+    window = conversation.window("next question")
+    assert window.summary
+    row = store.load(conversation.id)
+    assert row["summary"] == conversation.context.summary
+    assert row["summarized"] == conversation.context.summarized > 0
+
+    resumed = Conversation.open(store, "openai_page", conversation.id)
+    assert resumed.context.summary == conversation.context.summary
+    assert resumed.context.summarized == conversation.context.summarized
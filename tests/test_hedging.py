@@ -0,0 +1,85 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import hedging
+from model_catalog import model_catalog
+from resilience import RATE_LIMIT_OUTPUT_TOKENS, TokenBucket
+from timing import current_timer, request_timer, timed
+
+hedged_request = hedging.hedged_request.__wrapped__  # without the Langfuse span
+
+
+def fake_api(seconds: float):
+    @timed("fake_api")
+    async def api(prompt, model, context=None, route=None, **kwargs):
+        with current_timer().phase("provider_call"):
+            await asyncio.sleep(seconds)
+        return model
+
+    return api
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    latencies = {}
+    monkeypatch.setattr(
+        hedging, "api_function", lambda provider: fake_api(latencies[provider])
+    )
+    monkeypatch.setattr(hedging, "reserve_budget", lambda *args: 0.001)
+    return latencies
+
+
+def hedge(primary: float, backup: float, delay: float, providers):
+    providers.update(openai=primary, anthropic=backup)
+    with request_timer("page", attach_to_trace=False) as timer:
+        with timer.phase("render"):
+            answer = asyncio.run(
+                hedged_request(
+                    "hi", "openai", "m1", backup=("anthropic", "m2"), delay=delay
+                )
+            )
+    return answer, timer
+
+
+def test_winner_phases_join_the_request_timer(providers):
+    answer, timer = hedge(0.15, 1.0, 0.05, providers)
+    assert answer == "m1"
+    # The cancelled backup's time is neither provider time nor render.
+    assert timer.phases["provider_call"] == pytest.approx(0.15, abs=0.03)
+    assert timer.phases["render"] < 0.03
+
+
+def test_backup_can_win(providers):
+    answer, timer = hedge(1.0, 0.05, 0.05, providers)
+    assert answer == "m2"
+    assert timer.phases["provider_call"] == pytest.approx(0.05, abs=0.03)
+    assert timer.phases["render"] == pytest.approx(0.05, abs=0.03)
+
+
+def test_fast_primary_is_not_hedged(providers):
+    answer, timer = hedge(0.01, 0.01, 1.0, providers)
+    assert answer == "m1"
+    assert "queue" in timer.marks
+
+
+def test_hedge_budget_holds_an_hour_of_spend():
+    assert hedging.hedge_budget.capacity == hedging.HEDGE_BUDGET_PER_HOUR
+
+
+def test_concurrent_backups_do_not_overdraw_the_budget(monkeypatch):
+    cost = model_catalog.get("openai", "gpt-4o-mini").cost(
+        1000, RATE_LIMIT_OUTPUT_TOKENS
+    )
+    budget = TokenBucket(1e-9, capacity=10.5 * cost)
+    monkeypatch.setattr(hedging, "hedge_budget", budget)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        costs = list(
+            pool.map(
+                lambda _: hedging.reserve_budget("openai", "gpt-4o-mini", 1000),
+                range(50),
+            )
+        )
+    assert sum(c is not None for c in costs) == 10
+    assert budget.tokens >= 0
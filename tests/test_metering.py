@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import pytest
+
+import metering
+from context_window import ContextWindow
+from metering import (
+    Meter,
+    RequestTooLarge,
+    Usage,
+    cost_details,
+    estimate_input_tokens,
+    usage_from_response,
+)
+
+
+def turns(count: int) -> list[dict]:
+    messages = []
+    for n in range(count):
+        messages.append({"role": "user", "content": f"question {n} " * 20})
+        messages.append({"role": "assistant", "content": f"answer {n} " * 20})
+    return messages
+
+
+def test_openai_usage_splits_out_cached_and_reasoning_tokens():
+    usage = usage_from_response(
+        "openai",
+        SimpleNamespace(
+            input_tokens=100,
+            output_tokens=40,
+            input_tokens_details=SimpleNamespace(cached_tokens=60),
+            output_tokens_details=SimpleNamespace(reasoning_tokens=10),
+        ),
+    )
+    assert usage == Usage(input=40, output=40, cache_read=60, reasoning=10)
+    assert usage.total == 140
+
+
+def test_anthropic_usage_counts_cache_writes():
+    usage = usage_from_response(
+        "anthropic",
+        SimpleNamespace(
+            input_tokens=10,
+            output_tokens=5,
+            cache_read_input_tokens=None,
+            cache_creation_input_tokens=200,
+        ),
+    )
+    assert usage == Usage(input=10, output=5, cache_write=200)
+    assert usage.usage_details() == {
+        "input": 10,
+        "output": 5,
+        "input_cache_write": 200,
+        "total": 215,
+    }
+
+
+def test_gemini_usage_bills_thoughts_as_output():
+    usage = usage_from_response(
+        "gemini",
+        SimpleNamespace(
+            prompt_token_count=100,
+            candidates_token_count=20,
+            cached_content_token_count=30,
+            thoughts_token_count=50,
+        ),
+    )
+    assert usage == Usage(input=70, output=70, cache_read=30, reasoning=50)
+
+
+def test_cost_details_discount_cached_input():
+    costs = cost_details("openai", "gpt-4o", Usage(input=1000, cache_read=1000))
+    assert costs == {"input": 0.0025, "input_cache_read": 0.00125, "total": 0.00375}
+    assert cost_details("openai", "unknown-model", Usage(input=1000)) is None
+
+
+def test_admit_keeps_a_context_that_fits():
+    context = ContextWindow("hi", summary="earlier", messages=turns(2))
+    admitted = Meter().admit("openai", "gpt-4o", context)
+    assert admitted.messages == context.messages
+    assert admitted.tokens == estimate_input_tokens("openai", "gpt-4o", context)
+    assert admitted.truncated == 0
+
+
+def test_admit_drops_the_summary_then_the_oldest_turns(monkeypatch):
+    context = ContextWindow("hi", summary="earlier " * 50, messages=turns(3))
+    fits = ContextWindow("hi", messages=turns(3)[2:])
+    limit = estimate_input_tokens("openai", "gpt-4o", fits)
+    monkeypatch.setattr(metering, "METER_MAX_INPUT_TOKENS", limit)
+    admitted = Meter().admit("openai", "gpt-4o", context)
+    assert admitted.summary == ""
+    assert admitted.messages == fits.messages
+    assert admitted.truncated == 2
+
+
+def test_admit_rejects_a_prompt_that_cannot_fit(monkeypatch):
+    monkeypatch.setattr(metering, "METER_MAX_INPUT_TOKENS", 10)
+    with pytest.raises(RequestTooLarge):
+        Meter().admit("openai", "gpt-4o", ContextWindow("word " * 100))
+
+
+def test_record_adds_to_the_user_and_model_counters():
+    meter = Meter()
+    usage = SimpleNamespace(input_tokens=1000, output_tokens=1000)
+    meter.record("openai", "gpt-4o", usage, "user-1")
+    meter.record("openai", "gpt-4o", usage, "user-2")
+    rows = {(row["user"], row["model"]): row for row in meter.snapshot()}
+    assert rows[("user-1", None)]["requests"] == 1
+    model = rows[(None, "openai/gpt-4o")]
+    assert (model["requests"], model["input"], model["output"]) == (2, 2000, 2000)
+    assert model["cost_usd"] == 0.025
+    assert meter.record("openai", "gpt-4o", None) == Usage()
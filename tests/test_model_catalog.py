@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from model_catalog import ModelCatalog
+
+
+class SlowLister:
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+        self.error = None
+
+    def __call__(self, provider):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return ["gpt-4o"]
+
+
+@pytest.fixture
+def lister() -> SlowLister:
+    return SlowLister()
+
+
+@pytest.fixture
+def catalog(tmp_path, lister) -> ModelCatalog:
+    return ModelCatalog(path=tmp_path / "catalog.json", lister=lister)
+
+
+def settle(catalog: ModelCatalog):
+    deadline = time.monotonic() + 5
+    while catalog._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not catalog._refreshing
+
+
+def ids(catalog: ModelCatalog) -> set[str]:
+    return {info.id for info in catalog.models("openai")}
+
+
+def test_models_do_not_wait_for_the_listing(catalog, lister):
+    started = time.monotonic()
+    assert "gpt-4o-mini" in ids(catalog)
+    assert "gpt-4o-mini" in ids(catalog)
+    assert time.monotonic() - started < 1
+    lister.release.set()
+    settle(catalog)
+    assert ids(catalog) == {"gpt-4o"}
+    assert lister.calls == 1
+
+
+def test_expired_listing_is_served_while_refreshed(catalog, lister):
+    lister.release.set()
+    ids(catalog)
+    settle(catalog)
+    catalog._listings["openai"]["fetched_at"] -= catalog.ttl + 1
+    lister.release.clear()
+    lister.error = ConnectionError("provider is down")
+    assert ids(catalog) == {"gpt-4o"}
+    lister.release.set()
+    settle(catalog)
+    assert ids(catalog) == {"gpt-4o"}
+    # Not asked again until MODEL_CATALOG_RETRY has passed.
+    ids(catalog)
+    assert lister.calls == 2
+
+
+def test_listing_is_cached_on_disk(catalog, lister, tmp_path):
+    lister.release.set()
+    ids(catalog)
+    settle(catalog)
+    reopened = ModelCatalog(path=tmp_path / "catalog.json", lister=lister)
+    assert ids(reopened) == {"gpt-4o"}
+    assert lister.calls == 1
@@ -0,0 +1,117 @@
+import time
+
+import pytest
+from langfuse.api.resources.prompts import Prompt_Text
+from langfuse.model import TextPromptClient
+
+from prompt_registry import PromptRegistry
+
+KEY = ("greeting", "production")
+
+
+class FakeLangfuse:
+    def __init__(self):
+        self.versions = []
+        self.calls = 0
+
+    def get_prompt(self, name, label, **kwargs):
+        self.calls += 1
+        version = self.versions.pop(0) if self.versions else None
+        if isinstance(version, Exception):
+            raise version
+        if version is None:
+            raise ConnectionError("langfuse is down")
+        return TextPromptClient(
+            Prompt_Text(
+                name=name,
+                version=version,
+                prompt=f"v{version}",
+                config={},
+                labels=[label],
+                tags=[],
+                type="text",
+            )
+        )
+
+
+@pytest.fixture
+def langfuse() -> FakeLangfuse:
+    return FakeLangfuse()
+
+
+@pytest.fixture
+def registry(langfuse) -> PromptRegistry:
+    return PromptRegistry(
+        client_factory=lambda: langfuse,
+        ttl_seconds=60,
+        refresh_interval=3600,
+        cold_fetch_timeout=1,
+        fallback_retry_seconds=5,
+    )
+
+
+def settle(registry: PromptRegistry):
+    # Waits for the background refreshes to finish.
+    deadline = time.monotonic() + 5
+    while registry._inflight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not registry._inflight
+
+
+def age(registry: PromptRegistry, seconds: float):
+    registry._entries[KEY].fetched_at -= seconds
+
+
+def test_first_get_fetches_and_later_gets_are_served_from_memory(registry, langfuse):
+    langfuse.versions = [1]
+    assert registry.get(*KEY).version == 1
+    assert registry.get(*KEY).version == 1
+    assert langfuse.calls == 1
+
+
+def test_stale_prompt_is_served_while_the_new_version_is_fetched(registry, langfuse):
+    langfuse.versions = [1, 2]
+    registry.get(*KEY)
+    age(registry, 61)
+    assert registry.get(*KEY).version == 1
+    settle(registry)
+    assert registry.get(*KEY).version == 2
+
+
+def test_failed_refresh_keeps_serving_the_last_good_version(registry, langfuse):
+    langfuse.versions = [1]
+    registry.get(*KEY)
+    age(registry, 61)
+    registry.get(*KEY)
+    settle(registry)
+    assert registry.get(*KEY).version == 1
+    status = registry.status()["greeting@production"]
+    assert status["failures"] == 1
+    assert status["last_error"] == "langfuse is down"
+
+
+def test_cold_fetch_failure_serves_the_fallback(registry, langfuse):
+    prompt = registry.get(*KEY, fallback="Be helpful.")
+    assert prompt.is_fallback
+    assert prompt.prompt == "Be helpful."
+    assert registry.get(*KEY, fallback="Be helpful.") is prompt
+    assert langfuse.calls == 1
+
+
+def test_cold_fetch_failure_without_fallback_raises(registry):
+    with pytest.raises(ConnectionError):
+        registry.get(*KEY)
+
+
+def test_fallback_is_refetched_with_backoff(registry, langfuse):
+    registry.get(*KEY, fallback="Be helpful.")
+    # One failure: retried after 5s * 2.
+    age(registry, 9)
+    registry.get(*KEY)
+    assert langfuse.calls == 1
+    langfuse.versions = [3]
+    age(registry, 2)
+    assert registry.get(*KEY).is_fallback
+    settle(registry)
+    assert registry.get(*KEY).version == 3
+    assert langfuse.calls == 2
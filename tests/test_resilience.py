@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+import resilience
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ProviderGuard,
+    RateLimiter,
+    RateLimitExceeded,
+)
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt, error: 0.0)
+
+
+def guard(threshold: int = 2, reset_seconds: float = 60.0) -> ProviderGuard:
+    guard = ProviderGuard("openai")
+    guard.breaker = CircuitBreaker(threshold, reset_seconds)
+    return guard
+
+
+def half_open(guard: ProviderGuard):
+    guard.breaker.opened_at = 0.0
+    guard.breaker.reset_seconds = 0.0
+    assert guard.breaker.state == "half_open"
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_lets_one_probe_through_when_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_the_breaker_again():
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=60)
+    breaker.opened_at = 0.0
+    breaker.reset_seconds = 0.0
+    assert breaker.allow()
+    breaker.reset_seconds = 60.0
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_call_retries_retryable_errors():
+    errors = [ProviderError(503), ProviderError(429)]
+
+    def fn():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    provider = guard(threshold=5)
+    assert provider.call(fn, model="m") == "ok"
+    assert provider.breaker.state == "closed"
+    assert provider.health("m").samples == 3
+
+
+def test_call_does_not_retry_client_errors():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise ProviderError(400)
+
+    with pytest.raises(ProviderError):
+        guard().call(fn, model="m")
+    assert len(calls) == 1
+
+
+def test_open_breaker_fails_fast(monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 1)
+    provider = guard(threshold=1)
+
+    def fn():
+        raise ProviderError(500)
+
+    with pytest.raises(ProviderError):
+        provider.call(fn, model="m")
+    with pytest.raises(CircuitOpenError):
+        provider.call(lambda: "ok", model="m")
+
+
+def test_cancelled_probe_is_released():
+    provider = guard(threshold=1)
+    half_open(provider)
+
+    async def cancel_probe():
+        task = asyncio.create_task(
+            provider.call_async(lambda: asyncio.sleep(10), model="m")
+        )
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert provider.call(lambda: "ok", model="m") == "ok"
+    assert provider.breaker.state == "closed"
+
+
+def test_throttled_request_does_not_take_the_probe(monkeypatch):
+    monkeypatch.setattr(resilience, "RATE_LIMIT_MAX_WAIT", 1.0)
+    provider = guard(threshold=1)
+    half_open(provider)
+    limiter = provider._limiters["m"] = RateLimiter(rpm=1, tpm=0)
+    limiter.reserve(0)
+    with pytest.raises(RateLimitExceeded):
+        provider.call(lambda: "ok", model="m")
+    assert not provider.breaker._probing
+
+
+def test_rate_limiter_without_limits_never_waits():
+    limiter = RateLimiter(rpm=0, tpm=0)
+    assert limiter.reserve(10**9) == 0.0
+    limiter.adjust(100)
+    limiter.refund(100)
+
+
+def test_rate_limiter_refuses_long_waits(monkeypatch):
+    monkeypatch.setattr(resilience, "RATE_LIMIT_MAX_WAIT", 1.0)
+    limiter = RateLimiter(rpm=60, tpm=0)
+    for _ in range(60):
+        limiter.reserve(0)
+    assert 0 < limiter.reserve(0) <= 1.0
+    with pytest.raises(RateLimitExceeded):
+        limiter.reserve(0)
@@ -0,0 +1,125 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from score_queue import ScoreQueue
+
+
+class FakeIngestion:
+    def __init__(self):
+        self.sent = []
+        # Score id -> HTTP status of the per-event error, or an exception
+        # raised for the whole batch.
+        self.errors = {}
+        self.down = None
+
+    def batch(self, batch):
+        if self.down is not None:
+            raise self.down
+        errors = []
+        for event in batch:
+            status = self.errors.get(event.body.id)
+            if status is None:
+                self.sent.append((event.body.id, event.body.value))
+            else:
+                errors.append(
+                    SimpleNamespace(id=event.id, status=status, message="rejected")
+                )
+        return SimpleNamespace(successes=[], errors=errors)
+
+
+@pytest.fixture
+def ingestion() -> FakeIngestion:
+    return FakeIngestion()
+
+
+@pytest.fixture
+def queue(ingestion) -> ScoreQueue:
+    client = SimpleNamespace(api=SimpleNamespace(ingestion=ingestion), environment=None)
+    queue = ScoreQueue(client_factory=lambda: client, max_size=2, max_attempts=2)
+    # The tests drain the queue themselves instead of the background worker.
+    queue._worker = object()
+    return queue
+
+
+def submit(queue: ScoreQueue, id: str, value: int = 1) -> bool:
+    return queue.submit(id=id, trace_id=f"trace-{id}", name="helpfulness", value=value)
+
+
+def drain(queue: ScoreQueue):
+    with queue._cond:
+        batch = queue._take_batch()
+    queue._send(batch)
+    queue._in_flight = 0
+
+
+def test_repeated_submits_coalesce_on_the_score_id(queue, ingestion):
+    submit(queue, "a", 0)
+    submit(queue, "a", 1)
+    assert queue.depth == 1
+    drain(queue)
+    assert ingestion.sent == [("a", 1)]
+    assert queue.stats() == {"depth": 0, "sent": 1, "dropped": 0}
+
+
+def test_full_queue_drops_new_ids_but_still_coalesces(queue):
+    assert submit(queue, "a")
+    assert submit(queue, "b")
+    assert not submit(queue, "c")
+    assert submit(queue, "a", 0)
+    assert queue.stats()["dropped"] == 1
+
+
+def test_failed_batch_is_retried_after_a_backoff(queue, ingestion):
+    submit(queue, "a")
+    ingestion.down = ConnectionError("langfuse is down")
+    drain(queue)
+    assert queue.depth == 1
+    assert queue._pending["a"].not_before > time.monotonic()
+    drain(queue)
+    assert queue.depth == 1
+
+    ingestion.down = None
+    queue._pending["a"].not_before = 0.0
+    drain(queue)
+    assert ingestion.sent == [("a", 1)]
+
+
+def test_transient_errors_are_retried_and_rejections_dropped(queue, ingestion):
+    submit(queue, "a")
+    submit(queue, "b")
+    ingestion.errors = {"a": 429, "b": 400}
+    drain(queue)
+    assert list(queue._pending) == ["a"]
+    assert queue.stats() == {"depth": 1, "sent": 0, "dropped": 1}
+
+
+def test_score_is_dropped_after_max_attempts(queue, ingestion):
+    submit(queue, "a")
+    ingestion.down = ConnectionError("langfuse is down")
+    drain(queue)
+    queue._pending["a"].not_before = 0.0
+    drain(queue)
+    assert queue.stats() == {"depth": 0, "sent": 0, "dropped": 1}
+
+
+def test_retry_does_not_overwrite_a_newer_value(queue, ingestion):
+    submit(queue, "a", 0)
+    with queue._cond:
+        batch = queue._take_batch()
+    submit(queue, "a", 1)
+    ingestion.down = ConnectionError("langfuse is down")
+    queue._send(batch)
+    assert queue._pending["a"].score["value"] == 1
+    assert queue._pending["a"].attempts == 0
+
+
+def test_flush_sends_through_the_worker(ingestion):
+    client = SimpleNamespace(api=SimpleNamespace(ingestion=ingestion), environment=None)
+    queue = ScoreQueue(client_factory=lambda: client, flush_interval=0.01)
+    submit(queue, "a")
+    assert queue.flush(timeout=5)
+    assert ingestion.sent == [("a", 1)]
+    queue.shutdown()
+    assert not submit(queue, "b")
@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+
+import pytest
+
+import trace_policy
+from timing import request_timer
+from trace_policy import TraceSampler, _fraction, parse_rules, reduce_payload
+
+
+def trace_ids(sampled: bool, rate: float = 0.5, count: int = 3) -> list[str]:
+    # Trace ids on either side of `rate`, as the hash decides.
+    ids = (f"trace-{n}" for n in range(1000))
+    return [t for t in ids if (_fraction(t) < rate) == sampled][:count]
+
+
+def event(trace_id: str, type: str = "generation-create", **body) -> dict:
+    return {"type": type, "body": {"traceId": trace_id, **body}}
+
+
+@pytest.fixture
+def sent() -> list:
+    return []
+
+
+def test_sampled_trace_passes_straight_through(sent):
+    sampler = TraceSampler(0.5, [])
+    (trace_id,) = trace_ids(sampled=True, count=1)
+    sampler.sample(trace_id)
+    sampler.add(event(trace_id), sent.append)
+    assert len(sent) == 1
+
+
+def test_unsampled_trace_is_held_until_kept(sent):
+    sampler = TraceSampler(0.5, [])
+    (trace_id,) = trace_ids(sampled=False, count=1)
+    sampler.sample(trace_id)
+    sampler.add({"type": "trace-create", "body": {"id": trace_id}}, sent.append)
+    sampler.add(event(trace_id), sent.append)
+    assert sent == []
+
+    sampler.keep(trace_id)
+    assert [e["type"] for e in sent] == ["trace-create", "generation-create"]
+    # Later events of a kept trace are not held.
+    sampler.add(event(trace_id, "generation-update"), sent.append)
+    assert len(sent) == 3
+
+
+@pytest.mark.parametrize(
+    "late",
+    [
+        event("", "generation-update", level="ERROR"),
+        event("", "score-create"),
+    ],
+)
+def test_error_or_score_releases_a_held_trace(sent, late):
+    sampler = TraceSampler(0.5, [])
+    (trace_id,) = trace_ids(sampled=False, count=1)
+    sampler.sample(trace_id)
+    sampler.add(event(trace_id), sent.append)
+    late["body"]["traceId"] = trace_id
+    sampler.add(late, sent.append)
+    assert len(sent) == 2
+
+
+def test_held_payloads_are_reduced(sent, monkeypatch):
+    monkeypatch.setattr(trace_policy, "TRACE_MAX_CHARS", 100)
+    sampler = TraceSampler(0.5, [])
+    (trace_id,) = trace_ids(sampled=False, count=1)
+    sampler.sample(trace_id)
+    sampler.add(event(trace_id, input="x" * 1000), sent.append)
+    sampler.keep(trace_id)
+    assert len(sent[0]["body"]["input"]) == 100
+
+
+def test_rules_pick_the_rate(sent):
+    sampler = TraceSampler(0.0, parse_rules("page=scoring_page:1,model=m:0.5"))
+    assert sampler.rate_for("scoring_page", None, "m") == 1.0
+    assert sampler.rate_for("openai_page", None, "m") == 0.5
+    assert sampler.rate_for("openai_page", None, "other") == 0.0
+
+    trace_id = "trace-0"
+    sampler.sample(trace_id, page="scoring_page")
+    sampler.add(event(trace_id), sent.append)
+    assert len(sent) == 1
+
+
+def test_flush_decides_undecided_traces(sent):
+    sampler = TraceSampler(0.5, [])
+    task_manager = SimpleNamespace(add_task=sent.append, flush=lambda: None)
+    sampler.install(SimpleNamespace(task_manager=task_manager))
+    kept = trace_ids(sampled=True)
+    dropped = trace_ids(sampled=False)
+    for trace_id in kept + dropped:
+        # No generation, so no sampling decision yet.
+        task_manager.add_task(event(trace_id, "span-create"))
+    assert sent == []
+    task_manager.flush()
+    assert sorted(e["body"]["traceId"] for e in sent) == sorted(kept)
+
+
+def test_oldest_held_traces_are_dropped(sent, monkeypatch):
+    monkeypatch.setattr(trace_policy, "TRACE_HOLD_MAX", 2)
+    sampler = TraceSampler(0.5, [])
+    held = trace_ids(sampled=False)
+    for trace_id in held:
+        sampler.sample(trace_id)
+        sampler.add(event(trace_id), sent.append)
+    assert sampler.dropped == 1
+    sampler.keep(held[0])
+    assert sent == []
+
+
+def test_bad_rules_are_rejected():
+    with pytest.raises(ValueError):
+        parse_rules("region=eu:0.5")
+
+
+def test_reduce_payload_replaces_inline_media():
+    image = "data:image/png;base64," + "A" * 400
+    reduced = reduce_payload({"messages": [{"url": image}]})
+    assert reduced["messages"][0]["url"].startswith("<image/png, 300 bytes, sha256:")
+    assert reduce_payload(reduced) == reduced
+
+
+def test_sample_trace_uses_the_page_scope(monkeypatch):
+    pages = []
+    sampler = SimpleNamespace(
+        enabled=True, sample=lambda trace_id, page, **kwargs: pages.append(page)
+    )
+    monkeypatch.setattr(trace_policy, "trace_sampler", sampler)
+    with request_timer("openai_api_async", attach_to_trace=False):
+        trace_policy.sample_trace("m")
+        with trace_policy.page_scope("compare_page"):
+            trace_policy.sample_trace("m")
+    assert pages == ["openai_api_async", "compare_page"]
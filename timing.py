@@ -0,0 +1,235 @@
+import functools
+import inspect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import numpy as np
+from langfuse.decorators import langfuse_context
+
+_current_timer: ContextVar["RequestTimer | None"] = ContextVar(
+    "request_timer", default=None
+)
+
+
+class Histogram:
+    """
+    Rolling latency histogram over the last `window` samples (in seconds).
+    Percentiles are computed on demand, so recording stays O(1).
+    """
+
+    def __init__(self, window: int = 2048):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._samples.append(value)
+            self.count += 1
+
+    def percentiles(self, qs=(50, 95, 99)) -> dict:
+        with self._lock:
+            samples = np.fromiter(self._samples, dtype=np.float64)
+        if samples.size == 0:
+            return {f"p{q}": None for q in qs}
+        values = np.percentile(samples, qs)
+        return {f"p{q}": float(v) for q, v in zip(qs, values)}
+
+
+_histograms: dict[str, Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def histogram(name: str) -> Histogram:
+    with _histograms_lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram()
+        return _histograms[name]
+
+
+def snapshot() -> dict:
+    # {metric: {"count": n, "p50": s, "p95": s, "p99": s}} for every histogram.
+    with _histograms_lock:
+        items = list(_histograms.items())
+    return {
+        name: {"count": hist.count, **hist.percentiles()}
+        for name, hist in sorted(items)
+    }
+
+
+class RequestTimer:
+    """
+    Collects per-phase timings for one chat turn.
+
+    Phases report exclusive time: when phases nest (a streamed provider call
+    inside the render phase, say), the inner phase's time is subtracted from
+    the outer one, so the phases of a request add up to its wall time.
+    Marks record a point in time relative to the start of the request, e.g.
+    time-to-first-token.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.marks: dict[str, float] = {}
+        self.trace_id: str | None = None
+        self._stack: list[float] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self._stack.pop()
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed - nested
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def timed_iter(self, iterable, phase: str):
+        # Times only the waits for the next item, not the consumer's work.
+        iterator = iter(iterable)
+        while True:
+            with self.phase(phase):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def mark(self, name: str):
+        self.marks.setdefault(name, time.perf_counter() - self.started)
+
+    def merge(self, child: "RequestTimer"):
+        # Books the timings of one of several concurrent attempts (each timed
+        # on its own, see use_timer) as if it had run inside the current
+        # phase of this timer.
+        offset = child.started - self.started
+        for name, value in child.phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + value
+        for name, value in child.marks.items():
+            self.marks.setdefault(name, value + offset)
+        self.trace_id = self.trace_id or child.trace_id
+        if self._stack:
+            self._stack[-1] += sum(child.phases.values())
+
+    def as_dict(self) -> dict:
+        # Milliseconds, as recorded in the observation metadata.
+        timings = {k: round(v * 1000, 2) for k, v in self.phases.items()}
+        timings.update({k: round(v * 1000, 2) for k, v in self.marks.items()})
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 2)
+        return timings
+
+    def record(self):
+        for name, value in {**self.phases, **self.marks}.items():
+            histogram(f"{self.name}.{name}").observe(value)
+        histogram(f"{self.name}.total").observe(time.perf_counter() - self.started)
+
+
+def current_timer() -> RequestTimer:
+    timer = _current_timer.get()
+    if timer is None:
+        # Outside any request scope: hand out a throwaway timer.
+        timer = RequestTimer("untracked")
+    return timer
+
+
+@contextmanager
+def use_timer(timer: RequestTimer):
+    """
+    Makes `timer` the current one in this context. Concurrent calls within
+    one request (hedged attempts, say) each get a timer of their own: phases
+    nest on a stack, which interleaved awaits on a shared timer would mix up.
+    """
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+@contextmanager
+def request_timer(name: str, attach_to_trace: bool = True):
+    """
+    Opens the timer for a request, or joins the one already open in this
+    context. The scope that opened the timer records it into the histograms
+    and, when a traced call ran inside it, attaches the timings to the trace.
+    """
+    timer = _current_timer.get()
+    if timer is not None:
+        yield timer
+        return
+
+    timer = RequestTimer(name)
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+        timer.record()
+        if attach_to_trace and timer.trace_id is not None:
+            from config import get_langfuse
+
+            get_langfuse().trace(
+                id=timer.trace_id, metadata={"timings": timer.as_dict()}
+            )
+
+
+def timed(name: str):
+    """
+    Decorator for the *_api functions, applied below @observe. Joins the
+    page's request timer (or opens one), marks how long the request queued
+    before the call started and records the call's own duration under
+    `<name>.call`. Works for plain, async and generator functions.
+    """
+
+    def start(timer: RequestTimer):
+        timer.mark("queue")
+        timer.trace_id = timer.trace_id or langfuse_context.get_current_trace_id()
+        return time.perf_counter()
+
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+
+            @functools.wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                with request_timer(name, attach_to_trace=False) as timer:
+                    started = start(timer)
+                    try:
+                        yield from func(*args, **kwargs)
+                    finally:
+                        histogram(f"{name}.call").observe(time.perf_counter() - started)
+
+            return gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with request_timer(name, attach_to_trace=False) as timer:
+                    started = start(timer)
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        histogram(f"{name}.call").observe(time.perf_counter() - started)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with request_timer(name, attach_to_trace=False) as timer:
+                started = start(timer)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    histogram(f"{name}.call").observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,335 @@
+"""
+What gets sent to Langfuse: trace sampling and the payload policy.
+
+Sampling is decided per trace when its first generation starts
+(`sample_trace`): the page, user and model pick a rate from
+TRACE_SAMPLE_RULES (first match wins, else TRACE_SAMPLE_RATE), and a hash of
+the trace id decides, so every process agrees on the same trace. The events
+of traces that are not sampled are held back rather than dropped: if the
+trace records an error or receives feedback (`keep_trace`) within
+TRACE_HOLD_SECONDS it is sent after all.
+
+The payload policy is the Langfuse clients' mask function, so it runs on
+the SDK's consumer thread: long strings are truncated (or replaced by their
+hash) and inline base64 media by a reference to its type, size and hash.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langfuse.decorators import langfuse_context
+
+from logs import get_logger
+from timing import current_timer
+
+log = get_logger(__name__)
+
+# Share of traces sent to Langfuse, and overrides by page (see page_scope),
+# user or model, e.g.
+# "page=compare_page:0.1,model=gpt-4.5-preview:0.5,user=user-1:1".
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+TRACE_SAMPLE_RULES = os.getenv("TRACE_SAMPLE_RULES", "")
+# Traces not sampled wait this long (seconds) for an error or feedback;
+# at most TRACE_HOLD_MAX traces are remembered.
+TRACE_HOLD_SECONDS = float(os.getenv("TRACE_HOLD_SECONDS", "600"))
+TRACE_HOLD_MAX = int(os.getenv("TRACE_HOLD_MAX", "10000"))
+# Events of a trace that never gets a sampling decision (no generation)
+# wait this long before the default rate applies.
+TRACE_DECISION_TIMEOUT = 5.0
+# Strings longer than TRACE_MAX_CHARS are truncated ("truncate") or replaced
+# by their length and hash ("hash"); "full" sends them unchanged.
+TRACE_PAYLOAD = os.getenv("TRACE_PAYLOAD", "truncate")
+TRACE_MAX_CHARS = int(os.getenv("TRACE_MAX_CHARS", "4000"))
+# Inline media is sent as a reference unless it should be uploaded as
+# Langfuse media (one upload per distinct file).
+TRACE_UPLOAD_MEDIA = os.getenv("TRACE_UPLOAD_MEDIA", "0") == "1"
+
+RULE_KEYS = ("page", "user", "model")
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def _media_reference(mime_type: str, data: str) -> str:
+    return f"<{mime_type}, {len(data) * 3 // 4} bytes, sha256:{_digest(data)}>"
+
+
+def reduce_payload(data):
+    """
+    Mask function for the Langfuse clients (input and output of every
+    event). Idempotent: a reduced payload passes through unchanged.
+    """
+    if isinstance(data, str):
+        if data.startswith("data:") and ";base64," in data[:100]:
+            if TRACE_UPLOAD_MEDIA:
+                return data
+            header, _, encoded = data.partition(";base64,")
+            return _media_reference(header.removeprefix("data:"), encoded)
+        if TRACE_PAYLOAD == "full" or len(data) <= TRACE_MAX_CHARS:
+            return data
+        marker = f" [{len(data)} chars, sha256:{_digest(data)}]"
+        if TRACE_PAYLOAD == "hash":
+            return marker.strip()
+        return data[: TRACE_MAX_CHARS - len(marker)] + marker
+    if isinstance(data, dict):
+        # Anthropic and Gemini blocks carry raw base64 next to the mime type,
+        # OpenAI audio next to its format.
+        mime_type = data.get("media_type") or data.get("mime_type")
+        if data.keys() == {"data", "format"}:
+            mime_type = f"audio/{data['format']}"
+        if mime_type and isinstance(data.get("data"), str) and not TRACE_UPLOAD_MEDIA:
+            return {**data, "data": _media_reference(mime_type, data["data"])}
+        return {key: reduce_payload(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [reduce_payload(value) for value in data]
+    return data
+
+
+def parse_rules(spec: str) -> list[tuple[str, str, float]]:
+    rules = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, rest = item.partition("=")
+        value, _, rate = rest.rpartition(":")
+        if key not in RULE_KEYS or not value:
+            raise ValueError(f"bad TRACE_SAMPLE_RULES entry {item!r}")
+        rules.append((key, value, float(rate)))
+    return rules
+
+
+def _fraction(trace_id: str) -> float:
+    # Uniform in [0, 1), the same for a trace id in every process.
+    digest = hashlib.sha256(trace_id.encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+def _field(body, name: str):
+    # Create events carry pydantic bodies, update events plain dicts with
+    # the API's camelCase keys.
+    if isinstance(body, dict):
+        head, *rest = name.split("_")
+        return body.get(head + "".join(part.title() for part in rest))
+    return getattr(body, name, None)
+
+
+def _trace_id(event: dict) -> str | None:
+    body = event.get("body")
+    return _field(body, "id" if event.get("type") == "trace-create" else "trace_id")
+
+
+class _Trace:
+    __slots__ = ("started", "rate", "kept", "events")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.rate: float | None = None
+        self.kept = False
+        # (forward, event) pairs held back until the trace is kept.
+        self.events: list = []
+
+
+class TraceSampler:
+    """
+    Sits between the Langfuse clients and their ingestion queues (see
+    `install`). Events of sampled traces pass straight through; the others
+    are held with their payloads already reduced, and sent if the trace is
+    kept later: on an ERROR-level event, a score, or `keep`.
+    """
+
+    def __init__(self, rate: float, rules: list[tuple[str, str, float]]):
+        self.rate = rate
+        self.rules = rules
+        self.sent = 0
+        self.dropped = 0
+        self._traces: OrderedDict[str, _Trace] = OrderedDict()
+        self._undecided: OrderedDict[str, _Trace] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate < 1 or any(rate < 1 for _, _, rate in self.rules)
+
+    def install(self, client):
+        # Routes the client's events through the sampler; returns the client.
+        if not self.enabled:
+            return client
+        task_manager = client.task_manager
+        add_task, flush = task_manager.add_task, task_manager.flush
+
+        def flush_all():
+            self._release(self._expire(time.monotonic(), decide_all=True))
+            return flush()
+
+        task_manager.add_task = lambda event: self.add(event, add_task)
+        task_manager.flush = flush_all
+        return client
+
+    def rate_for(self, page: str | None, user_id: str | None, model: str | None):
+        attributes = {"page": page, "user": user_id, "model": model}
+        for key, value, rate in self.rules:
+            if attributes[key] == value:
+                return rate
+        return self.rate
+
+    def sample(self, trace_id: str | None, page=None, user_id=None, model=None):
+        if trace_id is None or not self.enabled:
+            return
+        rate = self.rate_for(page, user_id, model)
+        with self._lock:
+            trace = self._trace(trace_id, time.monotonic())
+            # Several generations in one trace: the highest rate counts.
+            trace.rate = max(rate, trace.rate or 0.0)
+            self._undecided.pop(trace_id, None)
+            release = self._decide(trace_id, trace)
+        self._release(release)
+
+    def keep(self, trace_id: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            release = self._keep(self._trace(trace_id, time.monotonic()))
+        self._release(release)
+
+    def add(self, event: dict, forward):
+        trace_id = _trace_id(event)
+        if trace_id is None:
+            return forward(event)
+        now = time.monotonic()
+        with self._lock:
+            release = self._expire(now)
+            trace = self._trace(trace_id, now)
+            if trace.rate is None and trace_id not in self._undecided:
+                self._undecided[trace_id] = trace
+            if (
+                event.get("type") == "score-create"
+                or _field(event.get("body"), "level") == "ERROR"
+            ):
+                release += self._keep(trace)
+            if not trace.kept:
+                _reduce_event(event)
+                trace.events.append((forward, event))
+                event = None
+        self._release(release)
+        if event is not None:
+            return forward(event)
+
+    # Helpers below run under the lock and return the events to send.
+
+    def _trace(self, trace_id: str, now: float) -> _Trace:
+        trace = self._traces.get(trace_id)
+        if trace is None:
+            trace = self._traces[trace_id] = _Trace(now)
+            if len(self._traces) > TRACE_HOLD_MAX:
+                _, oldest = self._traces.popitem(last=False)
+                self._drop(oldest)
+        return trace
+
+    def _decide(self, trace_id: str, trace: _Trace) -> list:
+        if _fraction(trace_id) < trace.rate:
+            return self._keep(trace)
+        return []
+
+    def _keep(self, trace: _Trace) -> list:
+        if trace.kept:
+            return []
+        trace.kept = True
+        self.sent += 1
+        release, trace.events = trace.events, []
+        return release
+
+    def _drop(self, trace: _Trace):
+        if not trace.kept:
+            self.dropped += 1
+            trace.events = []
+
+    def _expire(self, now: float, decide_all: bool = False) -> list:
+        release = []
+        while self._undecided:
+            trace_id, trace = next(iter(self._undecided.items()))
+            if not decide_all and now - trace.started < TRACE_DECISION_TIMEOUT:
+                break
+            del self._undecided[trace_id]
+            trace.rate = self.rate
+            release += self._decide(trace_id, trace)
+        while self._traces:
+            trace_id, trace = next(iter(self._traces.items()))
+            if now - trace.started < TRACE_HOLD_SECONDS:
+                break
+            del self._traces[trace_id]
+            self._drop(trace)
+        return release
+
+    @staticmethod
+    def _release(events: list):
+        for forward, event in events:
+            forward(event)
+
+
+def _reduce_event(event: dict):
+    # Held events keep only the reduced payload in memory.
+    body = event.get("body")
+    for field in ("input", "output"):
+        value = _field(body, field)
+        if value is None:
+            continue
+        if isinstance(body, dict):
+            body[field] = reduce_payload(value)
+        else:
+            setattr(body, field, reduce_payload(value))
+
+
+trace_sampler = TraceSampler(TRACE_SAMPLE_RATE, parse_rules(TRACE_SAMPLE_RULES))
+
+
+_current_page: ContextVar[str | None] = ContextVar("trace_page", default=None)
+
+
+@contextmanager
+def page_scope(name: str):
+    """
+    Names the page a request comes from, for the sampling rules. Set apart
+    from the request timer, because concurrent calls within one request run
+    on timers of their own (timing.use_timer). Without a page, the current
+    timer's name is used.
+    """
+    token = _current_page.set(name)
+    try:
+        yield
+    finally:
+        _current_page.reset(token)
+
+
+def sample_trace(model: str | None = None, user_id: str | None = None):
+    # Called by the API functions once the model and user are known.
+    if not trace_sampler.enabled:
+        return
+    trace_sampler.sample(
+        langfuse_context.get_current_trace_id(),
+        page=_current_page.get() or current_timer().name,
+        user_id=user_id,
+        model=model,
+    )
+
+
+def keep_trace(trace_id: str):
+    # Sends the trace even if it was not sampled (e.g. it got feedback).
+    trace_sampler.keep(trace_id)
+
+
+def configure_tracing():
+    """
+    Applies the policy to the client behind @observe. Must run before the
+    first traced call, as configuring replaces that client; the API modules
+    import this module, so it does.
+    """
+    mask = None if TRACE_PAYLOAD == "full" and TRACE_UPLOAD_MEDIA else reduce_payload
+    langfuse_context.configure(mask=mask)
+    trace_sampler.install(langfuse_context.client_instance)
+
+
+configure_tracing()